@@ -0,0 +1,242 @@
+"""
+Conseiller d'index basé sur le profiler MongoDB.
+
+1. capture : active le profiler (niveau 1, seuil slowms) sur la base cible
+   pendant une fenêtre donnée, puis restaure les réglages précédents ;
+2. analyse : regroupe system.profile par forme de requête normalisée
+   (valeurs remplacées, opérateurs conservés) et classe les formes par temps
+   total et par documents examinés / documents retournés ;
+3. proposition : un index composé par forme, ordonné Égalité - Tri - Intervalle
+   (ESR), avec une estimation de taille calculée sur un échantillon, et
+   création optionnelle (--create).
+
+Utilisation:
+    python src/advisor.py --capture 300 --slowms 50
+    python src/advisor.py --create --min-ratio 10
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+
+from indexes import describe_indexes
+from migrate import get_env, get_mongo_client, get_target_collection, setup_logging
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex", "$exists"}
+EQUALITY_OPERATORS = {"$eq", "$in"}
+LOGICAL_OPERATORS = {"$and", "$or", "$nor"}
+LIST_OPERATORS = {"$in", "$nin", "$all"}
+# Surcoût approximatif d'une entrée d'index (RecordId + en-têtes de clé)
+INDEX_ENTRY_OVERHEAD = 16
+
+
+def capture_profile(db: Database, seconds: float, slowms: int) -> None:
+    """Activer le profiler le temps de la fenêtre de capture, puis restaurer l'état précédent."""
+    previous = db.command("profile", 1, slowms=slowms)
+    logging.info("Profiler enabled on %s (slowms=%s) for %ss", db.name, slowms, seconds)
+    try:
+        time.sleep(seconds)
+    finally:
+        db.command("profile", previous.get("was", 0), slowms=previous.get("slowms", 100))
+        logging.info("Profiler restored to level %s (slowms=%s)", previous.get("was", 0), previous.get("slowms"))
+
+
+def normalise(value: Any) -> Any:
+    """Remplacer les valeurs littérales d'un filtre par 1 en gardant sa structure.
+
+    Les clauses de $and / $or / $nor sont toutes conservées (triées : leur ordre
+    ne change pas la forme) ; seules les listes de valeurs de $in / $nin / $all
+    sont réduites à [1], quelle que soit leur longueur.
+    """
+    if not isinstance(value, dict):
+        return 1
+    normalised: Dict[str, Any] = {}
+    for key, item in sorted(value.items()):
+        if key in LOGICAL_OPERATORS and isinstance(item, list):
+            clauses = [normalise(clause) for clause in item]
+            normalised[key] = sorted(clauses, key=lambda clause: json.dumps(clause, sort_keys=True))
+        elif key in LIST_OPERATORS:
+            normalised[key] = [1]
+        else:
+            normalised[key] = normalise(item)
+    return normalised
+
+
+def extract_query(entry: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """(opération, filtre, tri) d'une entrée system.profile, ou None si non analysable."""
+    command = entry.get("command", {})
+    op = entry.get("op")
+    if op == "query" or "find" in command:
+        return "find", command.get("filter", {}), command.get("sort", {})
+    if op == "update":
+        return "update", command.get("q", {}), {}
+    if op == "remove":
+        return "delete", command.get("q", {}), {}
+    if "count" in command:
+        return "count", command.get("query", {}), {}
+    if "aggregate" in command:
+        pipeline = command.get("pipeline", [])
+        match = pipeline[0].get("$match", {}) if pipeline else {}
+        sort = next((stage["$sort"] for stage in pipeline if "$sort" in stage), {})
+        return "aggregate", match, sort
+    return None
+
+
+def analyse_profile(db: Database, namespace: str) -> List[Dict[str, Any]]:
+    """Statistiques par forme de requête, triées par temps total décroissant."""
+    shapes: Dict[str, Dict[str, Any]] = {}
+    for entry in db["system.profile"].find({"ns": namespace}):
+        extracted = extract_query(entry)
+        if extracted is None:
+            continue
+        op, query, sort = extracted
+        key = json.dumps({"op": op, "filter": normalise(query), "sort": sort}, sort_keys=True, default=str)
+        stats = shapes.setdefault(key, {
+            "op": op, "filter": normalise(query), "sort": dict(sort), "count": 0, "millis": 0,
+            "docs_examined": 0, "keys_examined": 0, "returned": 0, "plans": set(),
+        })
+        stats["count"] += 1
+        stats["millis"] += entry.get("millis", 0)
+        stats["docs_examined"] += entry.get("docsExamined", 0)
+        stats["keys_examined"] += entry.get("keysExamined", 0)
+        stats["returned"] += entry.get("nreturned", entry.get("nModified", entry.get("ndeleted", 0))) or 0
+        if entry.get("planSummary"):
+            stats["plans"].add(entry["planSummary"])
+
+    ranked = []
+    for stats in shapes.values():
+        stats["plans"] = sorted(stats["plans"])
+        stats["docs_per_returned"] = stats["docs_examined"] / max(1, stats["returned"])
+        ranked.append(stats)
+    ranked.sort(key=lambda s: (s["millis"], s["docs_per_returned"]), reverse=True)
+    return ranked
+
+
+def _field_kinds(query: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """Séparer les champs d'un filtre en champs d'égalité et champs d'intervalle."""
+    equality: List[str] = []
+    ranges: List[str] = []
+    for field, condition in query.items():
+        if field == "$and":
+            for clause in condition:
+                eq, rg = _field_kinds(clause)
+                equality += [f for f in eq if f not in equality]
+                ranges += [f for f in rg if f not in ranges]
+            continue
+        if field.startswith("$"):
+            # $or / $nor / $expr : pas de proposition fiable
+            continue
+        operators = set(condition) if isinstance(condition, dict) and condition \
+            and all(k.startswith("$") for k in condition) else set()
+        if operators & RANGE_OPERATORS:
+            ranges.append(field)
+        elif not operators or operators <= EQUALITY_OPERATORS:
+            equality.append(field)
+    return equality, [f for f in ranges if f not in equality]
+
+
+def propose_index(query: Dict[str, Any], sort: Optional[Dict[str, Any]] = None) -> List[Tuple[str, int]]:
+    """Clés d'index ESR : égalités, puis champs de tri (avec leur sens), puis intervalles."""
+    equality, ranges = _field_kinds(query)
+    keys = [(field, ASCENDING) for field in equality]
+    for field, direction in (sort or {}).items():
+        if field not in equality:
+            keys.append((field, int(direction)))
+    keys += [(field, ASCENDING) for field in ranges if field not in (sort or {})]
+    return keys
+
+
+def is_covered(keys: List[Tuple[str, int]], existing: List[List[Tuple[str, int]]]) -> bool:
+    """Vrai si un index existant commence par exactement ces clés."""
+    return any([tuple(k) for k in index[:len(keys)]] == [tuple(k) for k in keys] for index in existing)
+
+
+def estimate_index_size(collection: Collection, keys: List[Tuple[str, int]], sample_size: int = 1000) -> int:
+    """Taille estimée (octets, sans compression de préfixe) d'un index sur keys."""
+    fields = [field for field, _ in keys]
+    sample = list(collection.aggregate([
+        {"$sample": {"size": sample_size}},
+        {"$project": {field: 1 for field in fields}},
+    ]))
+    if not sample:
+        return 0
+    total = 0
+    for doc in sample:
+        entry = {str(i): doc.get(field) for i, field in enumerate(fields)}
+        total += len(bson.encode(entry)) + INDEX_ENTRY_OVERHEAD
+    return int(total / len(sample) * collection.estimated_document_count())
+
+
+def advise(collection: Collection, min_ratio: float = 10.0, sample_size: int = 1000) -> List[Dict[str, Any]]:
+    """Propositions d'index pour les formes coûteuses non couvertes par un index existant."""
+    existing = [index["key"] for index in describe_indexes(collection)]
+    proposals: List[Dict[str, Any]] = []
+    for shape in analyse_profile(collection.database, collection.full_name):
+        scanned = any("COLLSCAN" in plan for plan in shape["plans"])
+        if not scanned and shape["docs_per_returned"] < min_ratio:
+            continue
+        keys = propose_index(shape["filter"], shape["sort"])
+        if not keys or is_covered(keys, existing) or any(p["keys"] == keys for p in proposals):
+            continue
+        proposals.append({
+            "keys": keys,
+            "shape": shape,
+            "estimated_bytes": estimate_index_size(collection, keys, sample_size),
+        })
+    return proposals
+
+
+def log_shapes(shapes: List[Dict[str, Any]], limit: int = 20) -> None:
+    for shape in shapes[:limit]:
+        logging.info("%-9s n=%-5s total=%6sms docs/returned=%8.1f plans=%s filter=%s sort=%s",
+                     shape["op"], shape["count"], shape["millis"], shape["docs_per_returned"],
+                     ",".join(shape["plans"]) or "-", json.dumps(shape["filter"]), json.dumps(shape["sort"]))
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : capture, analyse et propositions d'index."""
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="advisor.py", description="Conseiller d'index (profiler MongoDB)")
+    parser.add_argument("--capture", type=float, default=0, help="durée de capture en secondes (0 = analyser l'existant)")
+    parser.add_argument("--slowms", type=int, default=int(get_env("ADVISOR_SLOWMS", "50")))
+    parser.add_argument("--min-ratio", type=float, default=10.0,
+                        help="documents examinés / retournés à partir duquel proposer un index")
+    parser.add_argument("--create", action="store_true", help="créer les index proposés")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        client = get_mongo_client()
+        collection = get_target_collection(client)
+        if args.capture > 0:
+            capture_profile(collection.database, args.capture, args.slowms)
+        shapes = analyse_profile(collection.database, collection.full_name)
+        logging.info("%s query shapes captured for %s", len(shapes), collection.full_name)
+        log_shapes(shapes)
+        proposals = advise(collection, args.min_ratio)
+        for proposal in proposals:
+            logging.info("Proposed index %s (~%.1f MB) for %s shape %s", proposal["keys"],
+                         proposal["estimated_bytes"] / (1024 * 1024), proposal["shape"]["op"],
+                         json.dumps(proposal["shape"]["filter"]))
+        if not proposals:
+            logging.info("No index to propose")
+        if args.create and proposals:
+            names = collection.create_indexes([IndexModel(p["keys"]) for p in proposals])
+            logging.info("Created indexes: %s (declare them in src/indexes.py to keep them)", names)
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
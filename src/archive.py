@@ -0,0 +1,157 @@
+"""
+Archivage par lots des admissions anciennes de patient_records.
+
+Les documents dont la date (Discharge Date par défaut) est antérieure à la
+date de coupure sont déplacés vers une collection d'archive
+(patient_records_archive par défaut) :
+
+1. lecture d'un lot borné, par _id croissant, après le dernier _id traité ;
+2. copie dans l'archive (insert_batch : un _id déjà archivé compte comme
+   succès, la reprise après interruption est donc idempotente) ;
+3. suppression dans la collection chaude des seuls _id copiés ($in), encore
+   antérieurs à la coupure, seulement si toute la copie a réussi.
+
+Sur une collection en noms compacts (mapping enregistré, fieldmap.py), le
+champ de coupure est traduit en sa clé courte ; l'archive reçoit les documents
+tels quels et le même mapping est enregistré pour elle.
+
+Le débit est plafonné par un seau à jetons (documents/s). find_history()
+interroge la collection chaude seule, ou l'union chaude + archive
+($unionWith) quand l'historique complet est demandé.
+
+Utilisation:
+    python src/archive.py --before 2021-01-01
+    python src/archive.py --before 2021-01-01 --field "Date of Admission" --batch-size 500 --rate 2000
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from fieldmap import FieldMap, load_fieldmap, save_fieldmap
+from indexes import copy_index_definitions
+from migrate import RetryPolicy, get_env, get_mongo_client, get_target_collection, insert_batch, setup_logging
+from throttle import TokenBucket
+
+ARCHIVE_FIELDS = ("Discharge Date", "Date of Admission")
+
+
+def get_archive_collection(hot: Collection) -> Collection:
+    """Collection d'archive associée (ARCHIVE_COLLECTION, défaut: <collection>_archive)."""
+    return hot.database[get_env("ARCHIVE_COLLECTION", f"{hot.name}_archive")]
+
+
+def archive_batch(hot: Collection, archive: Collection, documents: List[Dict[str, Any]],
+                  field: str, cutoff: str, retry: RetryPolicy = RetryPolicy()) -> Dict[str, int]:
+    """Copier un lot trié par _id puis le supprimer de la collection chaude."""
+    counts = insert_batch(archive, documents, retry=retry, idempotent=True)
+    if counts["errors"]:
+        # Copie incomplète : rien n'est supprimé, le lot sera repris au prochain passage
+        return {"copied": counts["success"], "deleted": 0, "errors": counts["errors"]}
+    # Uniquement les _id lus et copiés : un document inséré entre deux _id du lot
+    # après la lecture n'est pas dans l'archive et ne doit pas être supprimé
+    result = hot.delete_many({
+        "_id": {"$in": [doc["_id"] for doc in documents]},
+        field: {"$lt": cutoff},
+    })
+    return {"copied": counts["success"], "deleted": result.deleted_count, "errors": 0}
+
+
+def archive_collection(hot: Collection, archive: Collection, cutoff: str,
+                       field: str = "Discharge Date", batch_size: int = 1000, rate: float = 0,
+                       max_batches: Optional[int] = None, retry: RetryPolicy = RetryPolicy(),
+                       fieldmap: Optional[FieldMap] = None) -> Dict[str, int]:
+    """Déplacer vers archive les documents dont field < cutoff, par lots bornés.
+
+    fieldmap : mapping de la collection chaude (noms compacts), None si noms longs.
+    """
+    if field not in ARCHIVE_FIELDS:
+        raise ValueError(f"Unsupported archive field: {field} (expected one of {', '.join(ARCHIVE_FIELDS)})")
+    field = fieldmap.short(field) if fieldmap is not None else field
+    if archive.name not in archive.database.list_collection_names():
+        copy_index_definitions(hot, archive)
+
+    bucket = TokenBucket(rate, burst=max(rate, batch_size)) if rate > 0 else None
+    totals = {"batches": 0, "copied": 0, "deleted": 0, "errors": 0}
+    last_id = None
+    started = time.perf_counter()
+    while max_batches is None or totals["batches"] < max_batches:
+        query: Dict[str, Any] = {field: {"$lt": cutoff}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        documents = list(hot.find(query, sort=[("_id", 1)], limit=batch_size))
+        if not documents:
+            break
+        if bucket is not None:
+            bucket.acquire(len(documents))
+        counts = archive_batch(hot, archive, documents, field, cutoff, retry)
+        last_id = documents[-1]["_id"]
+        totals["batches"] += 1
+        for key in ("copied", "deleted", "errors"):
+            totals[key] += counts[key]
+        if totals["batches"] % 50 == 0:
+            logging.info("Archived %s documents so far (%.0f docs/s)",
+                         totals["deleted"], totals["deleted"] / (time.perf_counter() - started))
+    return totals
+
+
+def find_history(hot: Collection, filter: Optional[Dict[str, Any]] = None,
+                 projection: Optional[Dict[str, Any]] = None, sort: Optional[List[Any]] = None,
+                 include_archive: bool = False, archive: Optional[Collection] = None):
+    """Lire les documents chauds, ou l'historique complet (chaud + archive) si demandé."""
+    if not include_archive:
+        return hot.find(filter or {}, projection, sort=sort)
+    archive = archive if archive is not None else get_archive_collection(hot)
+    branch: List[Dict[str, Any]] = [{"$match": filter or {}}]
+    if projection:
+        branch.append({"$project": projection})
+    pipeline = branch + [{"$unionWith": {"coll": archive.name, "pipeline": list(branch)}}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    return hot.aggregate(pipeline, allowDiskUse=True)
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : archivage des documents antérieurs à une date."""
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="archive.py", description="Archivage des admissions anciennes")
+    parser.add_argument("--before", required=True, help="date de coupure (AAAA-MM-JJ, exclue)")
+    parser.add_argument("--field", default=get_env("ARCHIVE_FIELD", "Discharge Date"), choices=ARCHIVE_FIELDS)
+    parser.add_argument("--batch-size", type=int, default=int(get_env("ARCHIVE_BATCH_SIZE", "1000")))
+    parser.add_argument("--rate", type=float, default=float(get_env("ARCHIVE_MAX_DOCS_PER_SEC", "0")),
+                        help="plafond en documents/s (0 = sans plafond)")
+    parser.add_argument("--max-batches", type=int, default=None, help="arrêter après N lots (reprise au prochain run)")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        client = get_mongo_client()
+        hot = get_target_collection(client)
+        archive = get_archive_collection(hot)
+        metadata = hot.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")]
+        fieldmap = load_fieldmap(metadata, hot.name)
+        if fieldmap is not None:
+            # Archive dans le même schéma compact : lisible via TranslatedCollection
+            save_fieldmap(metadata, archive.name, fieldmap)
+        logging.info("Archiving %s documents with %s < %s into %s",
+                     hot.full_name, args.field, args.before, archive.full_name)
+        totals = archive_collection(hot, archive, args.before, args.field, max(1, args.batch_size),
+                                    args.rate, args.max_batches, fieldmap=fieldmap)
+    except ValueError as e:
+        logging.error("Invalid archive settings: %s", e)
+        return 1
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    client.close()
+    logging.info("Archive summary: batches=%s, copied=%s, deleted=%s, errors=%s",
+                 totals["batches"], totals["copied"], totals["deleted"], totals["errors"])
+    return 0 if totals["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,290 @@
+"""
+Moteur de migration asyncio (migrate.py --engine async).
+
+Le moteur synchrone n'a qu'une insertion en vol à la fois ; sur une liaison à
+forte latence, c'est le nombre de requêtes simultanées qui fixe le débit.
+Ici :
+- lecture, parsing, validation et transformations restent séquentiels (dans
+  l'ordre des lots) mais s'exécutent hors de la boucle d'événements ;
+- jusqu'à MIGRATION_CONCURRENCY insert_many sont en vol simultanément (sémaphore,
+  qui borne aussi le nombre de lots préparés en mémoire) ;
+- driver asynchrone (pymongo.AsyncMongoClient, pymongo >= 4.10) si disponible,
+  sinon le client synchrone dans un pool de threads (asyncio.to_thread) ;
+- mêmes étapes, compteurs, dead-letter et résumé que le moteur synchrone
+  (BatchProcessor.prepare/store/record) ; les _id sont dérivés de la version du
+  fichier (chemin absolu, taille, date de modification) et du numéro de ligne
+  pour que la reprise ne crée pas de doublons.
+
+Point de reprise (checkpoint) : fichier JSON donnant le nombre de lots traités
+sans trou depuis le début du fichier et les totaux correspondants. Il est écrit
+au plus une fois par seconde, à la fin du run, et à l'arrêt sur SIGINT/SIGTERM :
+les nouveaux lots ne sont plus lus, les insertions en vol se terminent, puis le
+point de reprise est écrit. Un second signal annule les insertions en vol.
+--resume repart du point de reprise, avec les _id du run interrompu. Le fichier
+porte aussi une borne (reserved), écrite avant l'envoi des lots, au-delà de
+laquelle aucun lot n'a été inséré : à la reprise, un _id dupliqué ne compte
+comme un succès que dans les lots sous cette borne, ailleurs c'est une erreur.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from categorical import CATEGORICAL_COLUMNS
+from coordinator import file_version, row_id
+from migrate import (
+    BatchProcessor,
+    classify_insert_error,
+    finish_insert,
+    get_mongo_uri,
+    read_csv_in_batches,
+    write_with_retry,
+)
+
+try:  # pymongo >= 4.10
+    from pymongo import AsyncMongoClient
+except ImportError:
+    AsyncMongoClient = None
+
+_COUNTERS = ("rows", "success", "errors", "rejected")
+
+
+class Checkpoint:
+    """Progression sans trou (lots terminés depuis le début) d'un fichier CSV."""
+
+    def __init__(self, path: str, csv_path: str, batch_size: int, flush_seconds: float = 1.0,
+                 reserve_batches: int = 64) -> None:
+        self.path = path
+        self.csv = os.path.abspath(csv_path)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.reserve_batches = reserve_batches
+        self.source: Optional[str] = None
+        self.batches = 0
+        # Lots déjà envoyés possibles : ceux du run interrompu (replayable) et de ce run (reserved)
+        self.replayable = 0
+        self.reserved = 0
+        self.totals = {name: 0 for name in _COUNTERS}
+        self.complete = False
+        self._pending: Dict[int, Dict[str, int]] = {}
+        self._flushed = 0.0
+
+    def load(self) -> None:
+        """Reprendre depuis le fichier ; ValueError s'il concerne un autre CSV ou une autre taille de lot."""
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["csv"] != self.csv or state["batch_size"] != self.batch_size:
+            raise ValueError(f"Checkpoint {self.path} is for {state['csv']} with batch size {state['batch_size']}")
+        if state["complete"]:
+            raise ValueError(f"Checkpoint {self.path} is complete, nothing to resume")
+        self.batches = state["batches"]
+        self.totals = {name: state["totals"][name] for name in _COUNTERS}
+        self.source = state["source"]
+        self.replayable = self.reserved = state["reserved"]
+
+    def reserve(self, sequence: int) -> None:
+        """Lot sur le point d'être envoyé : la borne écrite sur disque le couvre toujours."""
+        if sequence >= self.reserved:
+            self.reserved = sequence + self.reserve_batches
+            self.flush()
+
+    def done(self, sequence: int, counts: Dict[str, int]) -> None:
+        """Lot terminé ; le point de reprise n'avance que sur une suite de lots sans trou."""
+        self._pending[sequence] = counts
+        while self.batches in self._pending:
+            for name, value in self._pending.pop(self.batches).items():
+                self.totals[name] += value
+            self.batches += 1
+        if time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {"csv": self.csv, "source": self.source, "batch_size": self.batch_size, "batches": self.batches,
+                 "reserved": self.reserved, "totals": self.totals, "complete": self.complete,
+                 "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._flushed = time.monotonic()
+
+
+async def insert_batch_async(collection, documents: List[Dict[str, Any]], row_numbers: List[int],
+                             processor: BatchProcessor, idempotent: bool = False) -> Dict[str, int]:
+    """insert_batch (migrate.py) pour une collection du driver asynchrone : mêmes reprises et dead-letter.
+
+    La boucle de reprise est celle de migrate.write_with_retry, exécutée dans un
+    thread (délais et throttle bloquants hors de la boucle d'événements) ; chaque
+    envoi est un insert_many asynchrone soumis à la boucle, qui reste seule
+    propriétaire du client.
+    """
+    loop = asyncio.get_running_loop()
+
+    def send(pending: List[int], attempt: int, last_error: Dict[int, str],
+             to_retry: List[int], failed: List[int]) -> int:
+        batch = [documents[i] for i in pending]
+        try:
+            future = asyncio.run_coroutine_threadsafe(collection.insert_many(batch, ordered=False), loop)
+            return len(future.result().inserted_ids)
+        except PyMongoError as e:
+            return classify_insert_error(e, pending, attempt, idempotent, last_error, to_retry, failed)
+
+    success, failed, last_error, retried = await asyncio.to_thread(
+        write_with_retry, send, documents, processor.retry, processor.throttle)
+    return finish_insert(documents, row_numbers, processor.dead_letter, success, failed, last_error, retried)
+
+
+async def migrate_async(processor: BatchProcessor, csv_path: str, batch_size: int,
+                        categorical: Union[Sequence[str], str, None] = CATEGORICAL_COLUMNS,
+                        concurrency: int = 16, checkpoint: Optional[Checkpoint] = None,
+                        async_collection: Any = None) -> Dict[str, Any]:
+    """Charger le CSV avec jusqu'à concurrency lots en vol ; retourne {"interrupted", "batches"}.
+
+    Les _id sont déterministes ; un doublon sur _id n'est un succès que si
+    processor.idempotent est vrai ou si le lot a pu être écrit par le run repris.
+    """
+    loop = asyncio.get_running_loop()
+    # Un thread par lot en vol (boucle de reprise de insert_batch_async ou client
+    # synchrone), plus la lecture du CSV et une réserve pour le driver
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 2, thread_name_prefix="migrate"))
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    in_flight: set = set()
+    failures: List[BaseException] = []
+    signals: List[int] = []
+
+    def on_signal(signum: int) -> None:
+        signals.append(signum)
+        if len(signals) == 1:
+            logging.warning("Received %s: finishing %s in-flight batches before stopping",
+                            signal.Signals(signum).name, len(in_flight))
+            stop.set()
+        else:
+            logging.warning("Received %s again: cancelling in-flight batches", signal.Signals(signum).name)
+            for task in in_flight:
+                task.cancel()
+
+    installed = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, on_signal, signum)
+            installed.append(signum)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    skip = 0
+    if checkpoint is not None and checkpoint.batches:
+        skip = checkpoint.batches
+        processor.totals.update(checkpoint.totals)
+        logging.info("Resuming after %s batches (rows=%s)", skip, checkpoint.totals["rows"])
+    replayable = checkpoint.replayable if checkpoint is not None else 0
+    if checkpoint is not None and checkpoint.source is not None:
+        source = checkpoint.source
+    else:
+        source = file_version(csv_path) + "#row"
+        if checkpoint is not None:
+            checkpoint.source = source
+    reader = iter(read_csv_in_batches(csv_path, batch_size, processor.metrics, categorical))
+
+    def read_and_prepare(skipped: bool) -> Optional[Tuple[Any, ...]]:
+        """Lot suivant préparé ; () si déjà traité (reprise), None en fin de fichier."""
+        batch = next(reader, None)
+        if batch is None:
+            return None
+        if skipped:
+            processor.skip(batch)
+            return ()
+        before = dict(processor.totals)
+        batch, row_numbers, nbytes = processor.prepare(batch)
+        for doc, row_number in zip(batch, row_numbers):
+            doc.setdefault("_id", row_id(source, row_number))
+        return batch, row_numbers, nbytes, {name: processor.totals[name] - before[name] for name in ("rows", "rejected")}
+
+    async def store(sequence: int, batch: List[Dict[str, Any]], row_numbers: List[int], nbytes: int,
+                    prepared: Dict[str, int]) -> None:
+        idempotent = processor.idempotent or sequence < replayable
+        try:
+            if async_collection is not None and batch:
+                started = time.perf_counter()
+                counts = await insert_batch_async(async_collection, batch, row_numbers, processor, idempotent)
+                processor.metrics.add("insert", time.perf_counter() - started, len(batch), nbytes)
+            else:
+                counts = await asyncio.to_thread(processor.store, batch, row_numbers, nbytes, idempotent)
+            processor.record(len(batch), counts)
+            if checkpoint is not None:
+                checkpoint.done(sequence, {**prepared, "success": counts["success"], "errors": counts["errors"]})
+        except Exception as e:  # remonté après l'arrêt des autres lots
+            failures.append(e)
+            stop.set()
+        finally:
+            semaphore.release()
+
+    sequence = 0
+    exhausted = False
+    try:
+        while not stop.is_set():
+            await semaphore.acquire()
+            if stop.is_set():
+                semaphore.release()
+                break
+            item = await asyncio.to_thread(read_and_prepare, sequence < skip)
+            if item is None:
+                semaphore.release()
+                exhausted = True
+                break
+            if sequence < skip:
+                semaphore.release()
+            else:
+                if checkpoint is not None:
+                    checkpoint.reserve(sequence)
+                task = asyncio.create_task(store(sequence, *item))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            sequence += 1
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+    finally:
+        for signum in installed:
+            loop.remove_signal_handler(signum)
+        if checkpoint is not None:
+            checkpoint.complete = exhausted and not failures
+            checkpoint.flush()
+    if failures:
+        raise failures[0]
+    return {"interrupted": bool(signals), "batches": sequence}
+
+
+def run_async(processor: BatchProcessor, csv_path: str, batch_size: int,
+              categorical: Union[Sequence[str], str, None] = CATEGORICAL_COLUMNS,
+              concurrency: int = 16, checkpoint: Optional[Checkpoint] = None) -> Dict[str, Any]:
+    """Point d'entrée synchrone (migrate.main) : driver asynchrone si disponible et si la cible est une collection simple."""
+
+    async def main() -> Dict[str, Any]:
+        collection = processor.collection
+        client = None
+        async_collection = None
+        if AsyncMongoClient is not None and isinstance(collection, Collection):
+            client = AsyncMongoClient(get_mongo_uri(), serverSelectionTimeoutMS=5000)
+            async_collection = client[collection.database.name][collection.name]
+        logging.info("Async engine: %s in-flight batches, %s driver", concurrency,
+                     "async" if async_collection is not None else "threaded")
+        try:
+            return await migrate_async(processor, csv_path, batch_size, categorical, concurrency, checkpoint,
+                                       async_collection)
+        finally:
+            if client is not None:
+                await client.close()
+
+    return asyncio.run(main())
+
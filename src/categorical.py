@@ -0,0 +1,89 @@
+"""
+Dictionnaires catégoriels pour les colonnes à faible cardinalité du CSV.
+
+Le lecteur CSV crée une nouvelle chaîne par cellule alors que des colonnes
+comme Gender ou Blood Type n'ont qu'une poignée de valeurs distinctes.
+CategoryInterner remplace chaque cellule par l'objet partagé de son
+dictionnaire de colonne (les chaînes dupliquées sont libérées aussitôt) et
+calcule les codes entiers du lot, exposés aux étapes vectorisées en aval
+(validation) via CategoricalBatch.codes.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Colonnes déclarées à faible cardinalité du jeu healthcare_dataset.csv
+CATEGORICAL_COLUMNS = (
+    "Gender", "Blood Type", "Medical Condition", "Admission Type",
+    "Medication", "Test Results", "Insurance Provider",
+)
+MISSING_CODE = -1
+
+
+class CategoricalBatch(list):
+    """Lot de lignes (list de dict) accompagné des codes de ses colonnes catégorielles.
+
+    - dictionaries[colonne] : valeurs partagées par tous les lots (code = position)
+    - codes[colonne] : tableau int32 des codes du lot (MISSING_CODE si absent)
+    """
+
+    def __init__(self, rows: Sequence[Dict[str, Any]], codes: Dict[str, np.ndarray],
+                 dictionaries: Dict[str, List[str]]) -> None:
+        super().__init__(rows)
+        self.codes = codes
+        self.dictionaries = dictionaries
+
+    def invalidate(self, name: str) -> None:
+        """Oublier les codes d'une colonne réécrite en place (ils désignent les anciennes valeurs)."""
+        self.codes.pop(name, None)
+
+    def take(self, indices: Sequence[int]) -> "CategoricalBatch":
+        """Sous-lot des lignes indices, codes compris."""
+        selected = np.asarray(indices, dtype=np.intp)
+        return CategoricalBatch([self[i] for i in indices],
+                                {name: codes[selected] for name, codes in self.codes.items()},
+                                self.dictionaries)
+
+
+class CategoryInterner:
+    """Dictionnaires par colonne conservés d'un lot à l'autre.
+
+    columns=None : détection automatique sur le premier lot (colonnes ayant au
+    plus max_categories valeurs distinctes).
+    """
+
+    def __init__(self, columns: Optional[Sequence[str]] = CATEGORICAL_COLUMNS, max_categories: int = 64) -> None:
+        self.columns: Optional[List[str]] = list(columns) if columns is not None else None
+        self.max_categories = max_categories
+        self.dictionaries: Dict[str, List[str]] = {}
+        self._index: Dict[str, Dict[str, int]] = {}
+
+    def _detect(self, rows: List[Dict[str, Any]]) -> None:
+        self.columns = []
+        if not rows:
+            return
+        for name in rows[0]:
+            distinct = {row.get(name) for row in rows}
+            if len(distinct) <= self.max_categories and len(distinct) < len(rows):
+                self.columns.append(name)
+
+    def encode(self, rows: List[Dict[str, Any]]) -> CategoricalBatch:
+        """Partager les valeurs des colonnes catégorielles et calculer les codes du lot."""
+        if self.columns is None:
+            self._detect(rows)
+        codes: Dict[str, np.ndarray] = {}
+        for name in self.columns:
+            index = self._index.setdefault(name, {})
+            values = self.dictionaries.setdefault(name, [])
+            cells = [row.get(name) for row in rows]
+            for value in dict.fromkeys(cells):
+                if value is not None and value not in index:
+                    index[value] = len(values)
+                    values.append(value)
+            column = [index.get(value, MISSING_CODE) for value in cells]
+            for row, code in zip(rows, column):
+                if code != MISSING_CODE:
+                    row[name] = values[code]
+            codes[name] = np.array(column, dtype=np.int32)
+        return CategoricalBatch(rows, codes, self.dictionaries)
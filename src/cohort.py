@@ -0,0 +1,269 @@
+"""
+Moteur local de requêtes de cohortes sur un instantané colonnaire de patient_records.
+
+L'instantané est exporté via les lots BSON bruts (src/columnar.py) puis stocké
+en colonnes :
+- catégorielles encodées par dictionnaire (codes entiers) ; un bitmap
+  compressé (np.packbits) par valeur pour les colonnes d'au plus
+  BITMAP_MAX_VALUES valeurs, comparaison directe des codes pour les autres
+  (Hospital : des dizaines de milliers de valeurs, un bitmap chacune coûterait
+  des centaines de Mo) ;
+- numériques et dates triées (argsort) pour répondre aux intervalles par
+  recherche dichotomique.
+
+L'export suit le stockage de la migration : noms de champs compacts (mapping de
+schema_metadata, src/fieldmap.py) et clés de dimension (colonnes enregistrées
+dans schema_metadata, src/dimensions.py) ramenées aux noms et libellés d'origine.
+
+Les filtres reprennent la syntaxe MongoDB : valeur exacte, {"$in": [...]},
+{"$gte": ..., "$lt": ...} (ainsi que $gt / $lte).
+
+Utilisation:
+    python src/cohort.py refresh
+    python src/cohort.py count --where "Medical Condition=Asthma" --where "Billing Amount>=20000"
+    python src/cohort.py count --where "Date of Admission>=2022-01-01" --group-by Hospital
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from columnar import read_columns
+from dimensions import DimensionCache, dimensions_record
+from fieldmap import FieldMap, load_fieldmap
+from migrate import get_env, get_mongo_client, get_target_collection, setup_logging
+
+CATEGORICAL_COLUMNS = (
+    "Gender", "Blood Type", "Medical Condition", "Hospital",
+    "Admission Type", "Medication", "Test Results",
+)
+NUMERIC_COLUMNS = ("Age", "Billing Amount")
+DATE_COLUMNS = ("Date of Admission", "Discharge Date")
+DEFAULT_SNAPSHOT = "reports/cohort_snapshot.npz"
+# Au-delà, les filtres comparent les codes au lieu de combiner des bitmaps par valeur
+BITMAP_MAX_VALUES = 256
+
+# Nombre de bits à 1 pour chaque octet (popcount des bitmaps compressés)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class CohortEngine:
+    """Instantané colonnaire interrogeable en mémoire (comptages, group-by)."""
+
+    def __init__(self, size: int, categories: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                 values: Dict[str, np.ndarray], created_at: float) -> None:
+        self.size = size
+        self.categories = categories
+        self.values = values
+        self.created_at = created_at
+        self._all = np.packbits(np.ones(size, dtype=bool))
+        self._bitmaps: Dict[str, Dict[Any, np.ndarray]] = {}
+        self._codes: Dict[str, Dict[Any, int]] = {}
+        for name, (dictionary, codes) in categories.items():
+            labels = dictionary.tolist()
+            if len(labels) <= BITMAP_MAX_VALUES:
+                self._bitmaps[name] = {value: np.packbits(codes == code) for code, value in enumerate(labels)}
+            else:
+                self._codes[name] = {value: code for code, value in enumerate(labels)}
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        for name, column in values.items():
+            order = np.argsort(column, kind="stable")
+            ordered = column[order]
+            missing = np.isnat(ordered) if ordered.dtype.kind == "M" else np.isnan(ordered)
+            self._sorted[name] = (ordered, order, int(len(ordered) - missing.sum()))
+
+    # --- Construction et persistance ------------------------------------
+
+    @classmethod
+    def from_collection(cls, collection: Collection, batch_size: int = 10000, fieldmap: Optional[FieldMap] = None,
+                        dimensions: Optional[DimensionCache] = None) -> "CohortEngine":
+        """Exporter la collection (lots bruts) et construire l'instantané.
+
+        fieldmap : lire les clés courtes ; dimensions : résoudre les clés de dimension en libellés.
+        """
+        columns = CATEGORICAL_COLUMNS + NUMERIC_COLUMNS + DATE_COLUMNS
+        stored = [fieldmap.short(name) if fieldmap is not None else name for name in columns]
+        raw = read_columns(collection, stored, batch_size=batch_size)
+        data = {name: raw[key] for name, key in zip(columns, stored)}
+        size = len(data[columns[0]])
+        categories = {}
+        for name in CATEGORICAL_COLUMNS:
+            codes, uniques = pd.factorize(data[name])
+            uniques = uniques.tolist()
+            if dimensions is not None and name in dimensions.fields:
+                # Une entrée par clé distincte : résolution en libellés sur le dictionnaire seulement
+                labels = dimensions.names[name]
+                uniques = [labels.get(key, key) for key in uniques]
+            categories[name] = (np.asarray(uniques, dtype=str), codes.astype(np.int32))
+        values = {name: pd.to_numeric(pd.Series(data[name]), errors="coerce").to_numpy(dtype=float)
+                  for name in NUMERIC_COLUMNS}
+        for name in DATE_COLUMNS:
+            values[name] = pd.to_datetime(pd.Series(data[name]), errors="coerce").to_numpy(dtype="datetime64[D]")
+        return cls(size, categories, values, time.time())
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        arrays = {"size": np.array(self.size), "created_at": np.array(self.created_at)}
+        for name, (dictionary, codes) in self.categories.items():
+            arrays[f"dict:{name}"] = dictionary
+            arrays[f"codes:{name}"] = codes
+        for name, column in self.values.items():
+            arrays[f"values:{name}"] = column
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "CohortEngine":
+        with np.load(path) as archive:
+            categories = {key[5:]: (archive[key], archive[f"codes:{key[5:]}"])
+                          for key in archive.files if key.startswith("dict:")}
+            values = {key[7:]: archive[key] for key in archive.files if key.startswith("values:")}
+            return cls(int(archive["size"]), categories, values, float(archive["created_at"]))
+
+    # --- Requêtes ---------------------------------------------------------
+
+    def _range_bits(self, name: str, condition: Dict[str, Any]) -> np.ndarray:
+        ordered, order, valid = self._sorted[name]
+        cast = (lambda v: np.datetime64(v, "D")) if ordered.dtype.kind == "M" else float
+        start, end = 0, valid
+        for op, bound in condition.items():
+            if op == "$gte":
+                start = max(start, int(np.searchsorted(ordered[:valid], cast(bound), side="left")))
+            elif op == "$gt":
+                start = max(start, int(np.searchsorted(ordered[:valid], cast(bound), side="right")))
+            elif op == "$lt":
+                end = min(end, int(np.searchsorted(ordered[:valid], cast(bound), side="left")))
+            elif op == "$lte":
+                end = min(end, int(np.searchsorted(ordered[:valid], cast(bound), side="right")))
+            else:
+                raise ValueError(f"Unsupported operator for {name}: {op}")
+        mask = np.zeros(self.size, dtype=bool)
+        if end > start:
+            mask[order[start:end]] = True
+        return np.packbits(mask)
+
+    def _category_bits(self, name: str, condition: Any) -> np.ndarray:
+        wanted = condition["$in"] if isinstance(condition, dict) else [condition]
+        if name in self._codes:
+            lookup = self._codes[name]
+            return np.packbits(np.isin(self.categories[name][1], [lookup[v] for v in wanted if v in lookup]))
+        bits = np.zeros_like(self._all)
+        for value in wanted:
+            bitmap = self._bitmaps[name].get(value)
+            if bitmap is not None:
+                bits |= bitmap
+        return bits
+
+    def filter_bits(self, filters: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Bitmap compressé des lignes qui satisfont tous les filtres."""
+        bits = self._all.copy()
+        for name, condition in (filters or {}).items():
+            if name in self.categories:
+                bits &= self._category_bits(name, condition)
+            elif name in self._sorted:
+                if not isinstance(condition, dict):
+                    condition = {"$gte": condition, "$lte": condition}
+                bits &= self._range_bits(name, condition)
+            else:
+                raise KeyError(f"Unknown cohort column: {name}")
+        return bits
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Nombre de patients de la cohorte."""
+        return int(_POPCOUNT[self.filter_bits(filters)].sum(dtype=np.int64))
+
+    def group_by(self, column: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+        """Comptage de la cohorte par valeur d'une colonne catégorielle."""
+        dictionary, codes = self.categories[column]
+        mask = np.unpackbits(self.filter_bits(filters), count=self.size).astype(bool)
+        selected = codes[mask]
+        counts = np.bincount(selected[selected >= 0], minlength=len(dictionary))
+        return {value: int(n) for value, n in zip(dictionary.tolist(), counts) if n}
+
+
+_WHERE = re.compile(r"^(?P<field>[^<>=]+?)\s*(?P<op>>=|<=|>|<|=)\s*(?P<value>.*)$")
+_OPERATORS = {">=": "$gte", "<=": "$lte", ">": "$gt", "<": "$lt"}
+
+
+def parse_where(clauses) -> Dict[str, Any]:
+    """Convertir des clauses "Champ=val1,val2" / "Champ>=val" en filtres du moteur."""
+    filters: Dict[str, Any] = {}
+    for clause in clauses or []:
+        match = _WHERE.match(clause)
+        if match is None:
+            raise ValueError(f"Invalid --where clause: {clause}")
+        field, op, value = match.group("field").strip(), match.group("op"), match.group("value").strip()
+        if op == "=":
+            values = [v.strip() for v in value.split(",")]
+            filters[field] = values[0] if len(values) == 1 else {"$in": values}
+        else:
+            filters.setdefault(field, {})[_OPERATORS[op]] = value
+    return filters
+
+
+def main(argv) -> int:
+    """Point d'entrée : rafraîchir l'instantané ou l'interroger."""
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="cohort.py", description="Requêtes de cohortes en mémoire")
+    parser.add_argument("--snapshot", default=get_env("COHORT_SNAPSHOT", DEFAULT_SNAPSHOT))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("refresh", help="exporter la collection et réécrire l'instantané")
+    count = sub.add_parser("count", help="compter une cohorte")
+    count.add_argument("--where", action="append", help='ex: "Blood Type=O+,A-" ou "Billing Amount>=20000"')
+    count.add_argument("--group-by", help="colonne catégorielle de regroupement")
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "refresh":
+        try:
+            client = get_mongo_client()
+            started = time.perf_counter()
+            target = get_target_collection(client)
+            metadata = target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")]
+            fieldmap = load_fieldmap(metadata, target.name)
+            # Clés de dimension d'après l'enregistrement de la collection, pas d'après le réglage courant
+            record = dimensions_record(metadata, target.name)
+            dimensions = DimensionCache(target.database, record["fields"]) if record is not None else None
+            engine = CohortEngine.from_collection(target, fieldmap=fieldmap, dimensions=dimensions)
+            client.close()
+        except PyMongoError as e:
+            logging.error("Snapshot export failed: %s", e)
+            return 1
+        engine.save(args.snapshot)
+        logging.info("Snapshot refreshed: %s rows in %.2fs -> %s",
+                     engine.size, time.perf_counter() - started, args.snapshot)
+        return 0
+
+    try:
+        engine = CohortEngine.load(args.snapshot)
+        filters = parse_where(args.where)
+        started = time.perf_counter()
+        result = engine.group_by(args.group_by, filters) if args.group_by else engine.count(filters)
+    except FileNotFoundError:
+        logging.error("Snapshot not found: %s (run 'refresh' first)", args.snapshot)
+        return 1
+    except (KeyError, ValueError) as e:
+        logging.error("Invalid query: %s", e)
+        return 1
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    snapshot_age = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(engine.created_at))
+    logging.info("Query answered in %.2fms (snapshot of %s)", elapsed_ms, snapshot_age)
+    if isinstance(result, dict):
+        for value, n in sorted(result.items(), key=lambda item: -item[1]):
+            print(f"{value}\t{n}")
+    else:
+        print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
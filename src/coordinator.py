@@ -0,0 +1,301 @@
+"""
+Migration coopérative répartie entre plusieurs instances de migrate.py.
+
+Le CSV est découpé en tranches d'octets alignées sur les fins de ligne. Chaque
+tranche est un document de la collection de travaux (migration_jobs dans
+healthcare_db) que les instances se disputent par bail :
+
+- claim : find_one_and_update atomique sur une tranche en attente ou dont le
+  bail a expiré (horloge du serveur, $$NOW : pas de dérive entre conteneurs) ;
+- heartbeat : un thread prolonge le bail pendant le traitement ; si le bail a
+  été repris par une autre instance, le traitement de la tranche est abandonné ;
+- progress : après chaque lot, la position de la dernière ligne traitée et
+  les compteurs partiels sont enregistrés ; une tranche reprise repart après
+  cette position (pas de double écriture en quarantaine ni de réinsertion) ;
+- complete : passage à "done" conditionné au propriétaire courant, donc une
+  seule instance marque chaque tranche terminée.
+
+Le travail est identifié par le chemin absolu du fichier, sa taille et sa date
+de modification : deux fichiers de même nom ne partagent pas leurs tranches.
+Les lignes écartées sont tracées par fichier et position (_file / _offset).
+
+Les _id des documents sont dérivés de (version du fichier, position de la
+ligne) par blake2b, la version étant l'identité du travail hors taille des
+tranches : une tranche retraitée après la mort d'une instance réinsère les
+mêmes _id et les doublons comptent comme des succès (insert_batch idempotent).
+
+Les lignes sont supposées sans retour à la ligne à l'intérieur d'un champ
+(cas du jeu de données healthcare_dataset.csv).
+"""
+
+import csv
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from metrics import StageMetrics
+from quarantine import RowLocation
+
+PENDING, LEASED, DONE = "pending", "leased", "done"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def file_version(path: str) -> str:
+    """Identité d'une version de fichier : chemin absolu, taille et date de modification."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def row_id(source: str, offset: int) -> ObjectId:
+    """_id déterministe d'une ligne : blake2b(source:position), 12 octets."""
+    return ObjectId(hashlib.blake2b(f"{source}:{offset}".encode("utf-8"), digest_size=12).digest())
+
+
+def plan_chunks(csv_path: str, chunk_bytes: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """En-tête du CSV et tranches [début, fin) alignées sur les fins de ligne."""
+    size = os.path.getsize(csv_path)
+    with open(csv_path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]))
+        start = f.tell()
+        chunks = []
+        while start < size:
+            end = start + chunk_bytes
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            chunks.append((start, end))
+            start = end
+    return header, chunks
+
+
+def read_chunk_in_batches(csv_path: str, header: List[str], start: int, end: int, batch_size: int,
+                          source: str, metrics: Optional[StageMetrics] = None
+                          ) -> Generator[Tuple[List[Dict[str, Any]], List[int]], None, None]:
+    """Lire une tranche par lots : (documents avec _id déterministe, positions des lignes)."""
+    with open(csv_path, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            started = time.perf_counter()
+            lines: List[str] = []
+            offsets: List[int] = []
+            nbytes = 0
+            while pos < end and len(lines) < batch_size:
+                raw = f.readline()
+                if not raw:
+                    pos = end
+                    break
+                offsets.append(pos)
+                lines.append(raw.decode("utf-8"))
+                pos += len(raw)
+                nbytes += len(raw)
+            batch: List[Dict[str, Any]] = []
+            row_offsets: List[int] = []
+            for offset, values in zip(offsets, csv.reader(lines)):
+                if not any(v.strip() for v in values):
+                    continue
+                row: Dict[str, Any] = dict(zip(header, values))
+                row["_id"] = row_id(source, offset)
+                batch.append(row)
+                row_offsets.append(offset)
+            if metrics is not None:
+                metrics.add("read", time.perf_counter() - started, len(batch), nbytes)
+            if batch:
+                yield batch, row_offsets
+
+
+class ChunkCoordinator:
+    """Baux sur les tranches d'un travail, stockés dans la collection jobs."""
+
+    def __init__(self, jobs: Collection, job_id: str, worker_id: Optional[str] = None,
+                 lease_seconds: float = 60.0) -> None:
+        self.jobs = jobs
+        self.job_id = job_id
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ms = int(lease_seconds * 1000)
+
+    def register(self, chunks: List[Tuple[int, int]]) -> None:
+        """Créer les tranches du travail (idempotent : chaque instance peut l'appeler)."""
+        documents = [
+            {"_id": f"{self.job_id}:{index:06d}", "job": self.job_id, "index": index,
+             "start": start, "end": end, "state": PENDING, "attempts": 0}
+            for index, (start, end) in enumerate(chunks)
+        ]
+        try:
+            self.jobs.insert_many(documents, ordered=False)
+        except BulkWriteError as bwe:
+            if any(err.get("code") != 11000 for err in bwe.details.get("writeErrors", [])):
+                raise
+        self.jobs.create_index([("job", 1), ("state", 1), ("index", 1)])
+
+    def _lease(self) -> Dict[str, Any]:
+        return {"$add": ["$$NOW", self.lease_ms]}
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Prendre une tranche en attente ou dont le bail a expiré."""
+        return self.jobs.find_one_and_update(
+            {"job": self.job_id, "$or": [
+                {"state": PENDING},
+                {"state": LEASED, "$expr": {"$lt": ["$lease_expires", "$$NOW"]}},
+            ]},
+            [{"$set": {"state": LEASED, "owner": self.worker_id, "lease_expires": self._lease(),
+                       "attempts": {"$add": ["$attempts", 1]}}}],
+            sort=[("index", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def heartbeat(self, chunk_id: str) -> bool:
+        """Prolonger le bail ; False si la tranche a été reprise par une autre instance."""
+        result = self.jobs.update_one(
+            {"_id": chunk_id, "owner": self.worker_id, "state": LEASED},
+            [{"$set": {"lease_expires": self._lease()}}],
+        )
+        return result.matched_count == 1
+
+    def progress(self, chunk_id: str, offset: int, counts: Dict[str, int]) -> bool:
+        """Enregistrer la dernière ligne traitée et les compteurs partiels ; False si la tranche a été reprise."""
+        result = self.jobs.update_one(
+            {"_id": chunk_id, "owner": self.worker_id, "state": LEASED},
+            {"$set": {"done_to": offset, "partial": counts}},
+        )
+        return result.matched_count == 1
+
+    def complete(self, chunk_id: str, counts: Dict[str, int]) -> bool:
+        """Marquer la tranche terminée ; False si elle ne nous appartient plus."""
+        result = self.jobs.update_one(
+            {"_id": chunk_id, "owner": self.worker_id, "state": LEASED},
+            [{"$set": {"state": DONE, "counts": counts, "finished_at": "$$NOW"}}],
+        )
+        return result.modified_count == 1
+
+    def remaining(self) -> int:
+        return self.jobs.count_documents({"job": self.job_id, "state": {"$ne": DONE}})
+
+    def summary(self) -> Dict[str, Any]:
+        """Totaux globaux du travail (toutes instances confondues)."""
+        totals: Dict[str, Any] = {"chunks": 0, "done": 0, "rows": 0, "success": 0, "errors": 0,
+                                  "rejected": 0, "workers": 0}
+        pipeline = [
+            {"$match": {"job": self.job_id}},
+            {"$group": {
+                "_id": None,
+                "chunks": {"$sum": 1},
+                "done": {"$sum": {"$cond": [{"$eq": ["$state", DONE]}, 1, 0]}},
+                "rows": {"$sum": "$counts.rows"},
+                "success": {"$sum": "$counts.success"},
+                "errors": {"$sum": "$counts.errors"},
+                "rejected": {"$sum": "$counts.rejected"},
+                "owners": {"$addToSet": "$owner"},
+            }},
+        ]
+        for group in self.jobs.aggregate(pipeline):
+            totals.update({k: v for k, v in group.items() if k in totals})
+            totals["workers"] = len([owner for owner in group["owners"] if owner])
+        return totals
+
+
+class _Heartbeat(threading.Thread):
+    """Prolonge le bail d'une tranche toutes les interval secondes."""
+
+    def __init__(self, coordinator: ChunkCoordinator, chunk_id: str, interval: float) -> None:
+        super().__init__(daemon=True)
+        self.coordinator = coordinator
+        self.chunk_id = chunk_id
+        self.interval = interval
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            try:
+                if not self.coordinator.heartbeat(self.chunk_id):
+                    self.lost = True
+                    return
+            except Exception as e:  # Un heartbeat manqué n'interrompt pas le lot en cours
+                logging.warning("Heartbeat failed for %s: %s", self.chunk_id, e)
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+def job_id_for(csv_path: str, chunk_bytes: int) -> str:
+    """Identifiant de travail commun à toutes les instances lisant le même fichier (même version)."""
+    return f"{file_version(csv_path)}:{chunk_bytes}"
+
+
+def run_coordinated(processor, jobs: Collection, csv_path: str, batch_size: int,
+                    chunk_bytes: int = 64 * 1024 * 1024, lease_seconds: float = 60.0,
+                    worker_id: Optional[str] = None, poll_seconds: float = 5.0) -> Dict[str, Any]:
+    """Traiter les tranches disponibles jusqu'à ce que tout le travail soit terminé.
+
+    processor : BatchProcessor de migrate.py (insertion idempotente).
+    Retourne le résumé global du travail.
+    """
+    header, chunks = plan_chunks(csv_path, chunk_bytes)
+    # Identité du travail sans la taille des tranches : les _id ne dépendent pas du découpage
+    source = file_version(csv_path)
+    coordinator = ChunkCoordinator(jobs, job_id_for(csv_path, chunk_bytes), worker_id, lease_seconds)
+    coordinator.register(chunks)
+    logging.info("Worker %s joined job %s (%s chunks)", coordinator.worker_id, coordinator.job_id, len(chunks))
+
+    while True:
+        chunk = coordinator.claim()
+        if chunk is None:
+            if coordinator.remaining() == 0:
+                break
+            # Tranches encore louées par d'autres instances : attendre une fin ou une expiration
+            time.sleep(poll_seconds)
+            continue
+
+        # Tranche reprise : les lignes jusqu'à done_to ont été traitées par l'instance précédente
+        done_to = chunk.get("done_to", -1)
+        partial = chunk.get("partial") or {}
+        before = dict(processor.totals)
+
+        def chunk_counts() -> Dict[str, int]:
+            return {key: partial.get(key, 0) + processor.totals[key] - before[key] for key in processor.totals}
+
+        heartbeat = _Heartbeat(coordinator, chunk["_id"], max(1.0, lease_seconds / 3))
+        heartbeat.start()
+        try:
+            for batch, offsets in read_chunk_in_batches(csv_path, header, chunk["start"], chunk["end"],
+                                                        batch_size, source, processor.metrics):
+                if heartbeat.lost:
+                    break
+                if offsets[-1] <= done_to:
+                    processor.skip(batch)
+                    continue
+                if offsets[0] <= done_to:
+                    keep = [i for i, offset in enumerate(offsets) if offset > done_to]
+                    batch, offsets = [batch[i] for i in keep], [offsets[i] for i in keep]
+                processor.process(batch, [RowLocation(csv_path, offset) for offset in offsets])
+                if not coordinator.progress(chunk["_id"], offsets[-1], chunk_counts()):
+                    heartbeat.lost = True
+        finally:
+            heartbeat.stop()
+        counts = chunk_counts()
+        if heartbeat.lost:
+            logging.warning("Lease lost on chunk %s, abandoning it to its new owner", chunk["_id"])
+        elif coordinator.complete(chunk["_id"], counts):
+            logging.info("Chunk %s done (attempt %s%s): %s", chunk["_id"], chunk["attempts"],
+                         f", resumed after offset {done_to}" if done_to >= 0 else "", counts)
+        else:
+            logging.warning("Chunk %s was reclaimed before completion, counts not recorded", chunk["_id"])
+
+    return coordinator.summary()
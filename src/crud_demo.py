@@ -11,6 +11,10 @@ import sys
 from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 
+from indexes import DEMO_INDEX_SPECS, ensure_indexes
+from pagination import fetch_page
+from repository import BulkWriteRepository
+
 
 def setup_logging() -> None:
     """Configurer un logging simple pour voir les opérations CRUD."""
@@ -97,6 +101,14 @@ def demo_read(collection):
         logging.info("  - Patient %s: âge %s, diagnostic: %s", 
                     p.get("patient_id", "N/A"), p.get("age", "N/A"), p.get("diagnosis", "N/A"))
     
+    # Pagination par clé : la page suivante reprend après la dernière clé vue (pas de skip)
+    first_page, token = fetch_page(collection, sort=[("Date of Admission", 1)], page_size=3)
+    logging.info("Page 1 (pagination par clé): %s documents", len(first_page))
+    if token is not None:
+        second_page, token = fetch_page(collection, sort=[("Date of Admission", 1)], page_size=3,
+                                        resume_token=token)
+        logging.info("Page 2 (reprise via jeton): %s documents", len(second_page))
+    
     # Projection (ne récupérer que certains champs)
     patients_summary = list(collection.find(
         {"diagnosis": {"$regex": "Diabetes", "$options": "i"}}, 
@@ -152,6 +164,24 @@ def demo_delete(collection):
     logging.info("Documents de test après suppression: %s", count_after)
 
 
+def demo_bulk_repository(collection):
+    """Démonstration des écritures groupées via BulkWriteRepository."""
+    logging.info("=== DÉMONSTRATION ÉCRITURES GROUPÉES ===")
+
+    with BulkWriteRepository(collection, key_field="patient_id") as repo:
+        inserts = [
+            repo.insert({"patient_id": f"P99990{i}", "age": "50", "diagnosis": "Test bulk"})
+            for i in range(3)
+        ]
+        # Deux $set successifs sur la même clé : fusionnés en une seule écriture
+        repo.set_fields("P999900", {"diagnosis": "Bulk mis à jour"})
+        repo.set_fields("P999900", {"last_modified": "2024-01-21"})
+        repo.flush()
+        logging.info("Insertions acquittées: %s", sum(1 for f in inserts if f.result()))
+
+        repo.delete({"patient_id": {"$in": ["P999900", "P999901", "P999902"]}}, many=True)
+
+
 def main() -> int:
     """Point d'entrée du script de démonstration CRUD."""
     setup_logging()
@@ -173,11 +203,14 @@ def main() -> int:
     collection = client[db_name][coll_name]
     
     try:
+        # Index des champs de démonstration (patient_id, age, diagnosis), hors migration
+        ensure_indexes(collection, specs=DEMO_INDEX_SPECS)
         # Démonstrations dans l'ordre CRUD
         demo_create(collection)
         demo_read(collection)
         demo_update(collection)
         demo_delete(collection)
+        demo_bulk_repository(collection)
         
         logging.info("Démonstration CRUD terminée avec succès")
         
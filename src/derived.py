@@ -0,0 +1,187 @@
+"""
+Champs dérivés calculés à l'ingestion.
+
+Durée de séjour, année/mois d'admission et tranche d'âge sont calculés une
+fois par lot (pandas/NumPy) puis stockés dans chaque document, au lieu d'être
+recalculés par $dateFromString / $subtract dans chaque agrégation ; les index
+peuvent alors les couvrir directement.
+
+- derive_batch : transformation de lot pour BatchProcessor (MIGRATION_DERIVED_FIELDS)
+- backfill : complète par lots les documents existants qui n'ont pas encore
+  les champs demandés (lectures en noms longs via TranslatedCollection si la
+  collection est en noms compacts). Un document dont une source manque ou est
+  invalide n'est pas calculable : il est compté (uncomputable) et sera relu au
+  prochain backfill tant que sa source n'est pas corrigée.
+
+Utilisation:
+    python src/derived.py --fields length_of_stay,age_band --batch-size 2000
+"""
+
+import argparse
+import logging
+import sys
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from fieldmap import FieldMap, TranslatedCollection, load_fieldmap
+from throttle import TokenBucket
+from validation import DATE_FORMAT
+
+SOURCE_FIELDS = ("Age", "Date of Admission", "Discharge Date")
+AGE_BANDS = (0, 18, 30, 45, 60, 75)
+AGE_BAND_LABELS = ("0-17", "18-29", "30-44", "45-59", "60-74", "75+")
+
+
+def _source_columns(batch: List[Dict[str, Any]]) -> Dict[str, pd.Series]:
+    dates = {
+        name: pd.to_datetime(pd.Series([row.get(name) for row in batch], dtype=object),
+                             format=DATE_FORMAT, errors="coerce")
+        for name in ("Date of Admission", "Discharge Date")
+    }
+    dates["Age"] = pd.to_numeric(pd.Series([row.get("Age") for row in batch], dtype=object), errors="coerce")
+    return dates
+
+
+def _length_of_stay(columns: Dict[str, pd.Series]) -> pd.Series:
+    return (columns["Discharge Date"] - columns["Date of Admission"]).dt.days
+
+
+def _admission_year(columns: Dict[str, pd.Series]) -> pd.Series:
+    return columns["Date of Admission"].dt.year
+
+
+def _admission_month(columns: Dict[str, pd.Series]) -> pd.Series:
+    return columns["Date of Admission"].dt.month
+
+
+def _age_band(columns: Dict[str, pd.Series]) -> pd.Series:
+    bins = list(AGE_BANDS) + [np.inf]
+    return pd.cut(columns["Age"], bins=bins, labels=AGE_BAND_LABELS, right=False).astype(object)
+
+
+DERIVED_FIELDS: Dict[str, Callable[[Dict[str, pd.Series]], pd.Series]] = {
+    "length_of_stay": _length_of_stay,
+    "admission_year": _admission_year,
+    "admission_month": _admission_month,
+    "age_band": _age_band,
+}
+
+
+def parse_fields(spec: str) -> List[str]:
+    """Liste "a,b,c" de champs dérivés connus ("" = aucun, "all" = tous)."""
+    if spec.strip().lower() == "all":
+        return list(DERIVED_FIELDS)
+    fields = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in DERIVED_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown derived fields: {', '.join(unknown)} (expected {', '.join(DERIVED_FIELDS)})")
+    return fields
+
+
+def derived_values(batch: List[Dict[str, Any]], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """Valeurs dérivées de chaque ligne (champs non calculables omis)."""
+    columns = _source_columns(batch)
+    values: List[Dict[str, Any]] = [{} for _ in batch]
+    for name in fields:
+        series = DERIVED_FIELDS[name](columns)
+        present = series.notna().to_numpy()
+        data = series.to_numpy(dtype=object)
+        for i in np.flatnonzero(present):
+            value = data[i]
+            values[i][name] = int(value) if isinstance(value, (float, np.integer, np.floating)) else value
+    return values
+
+
+def make_transform(fields: Sequence[str]) -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Transformation de lot pour BatchProcessor : ajoute les champs dérivés."""
+    fields = list(fields)
+
+    def derive_batch(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for row, values in zip(batch, derived_values(batch, fields)):
+            row.update(values)
+        return batch
+
+    return derive_batch
+
+
+def backfill(collection: Collection, fields: Sequence[str], batch_size: int = 1000,
+             rate: float = 0, fieldmap: Optional[FieldMap] = None) -> Dict[str, int]:
+    """Ajouter les champs dérivés manquants aux documents existants, par lots d'_id croissants.
+
+    fieldmap : mapping de la collection (noms compacts), None si noms longs.
+    """
+    bucket = TokenBucket(rate, burst=max(rate, batch_size)) if rate > 0 else None
+    reader = TranslatedCollection(collection, fieldmap) if fieldmap is not None else collection
+    missing = {"$or": [{name: {"$exists": False}} for name in fields]}
+    projection = {name: 1 for name in SOURCE_FIELDS}
+    totals = {"scanned": 0, "modified": 0, "errors": 0, "uncomputable": 0}
+    last_id = None
+    while True:
+        query = dict(missing) if last_id is None else {"$and": [missing, {"_id": {"$gt": last_id}}]}
+        documents = list(reader.find(query, projection, sort=[("_id", 1)], limit=batch_size))
+        if not documents:
+            break
+        last_id = documents[-1]["_id"]
+        totals["scanned"] += len(documents)
+        requests = []
+        for doc, values in zip(documents, derived_values(documents, fields)):
+            if len(values) < len(fields):
+                totals["uncomputable"] += 1
+            if values:
+                update = {"$set": values}
+                requests.append(UpdateOne({"_id": doc["_id"]},
+                                          fieldmap.translate_update(update) if fieldmap is not None else update))
+        if bucket is not None:
+            bucket.acquire(len(requests))
+        if requests:
+            try:
+                result = collection.bulk_write(requests, ordered=False)
+                totals["modified"] += result.modified_count
+            except BulkWriteError as bwe:
+                totals["modified"] += bwe.details.get("nModified", 0)
+                totals["errors"] += len(bwe.details.get("writeErrors", []))
+        logging.info("Backfill progress: scanned=%s, modified=%s", totals["scanned"], totals["modified"])
+    return totals
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : backfill des champs dérivés sur la collection cible."""
+    # Import local : migrate.py importe ce module pour MIGRATION_DERIVED_FIELDS
+    from migrate import get_env, get_mongo_client, get_target_collection, setup_logging
+
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="derived.py", description="Backfill des champs dérivés")
+    parser.add_argument("--fields", default=get_env("MIGRATION_DERIVED_FIELDS", "") or "all",
+                        help=f"champs à calculer ({', '.join(DERIVED_FIELDS)} ou all)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="plafond en documents/s (0 = sans plafond)")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        fields = parse_fields(args.fields)
+        client = get_mongo_client()
+        target = get_target_collection(client)
+        fieldmap = load_fieldmap(target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")], target.name)
+        totals = backfill(target, fields, max(1, args.batch_size), args.rate, fieldmap)
+    except ValueError as e:
+        logging.error("Invalid backfill settings: %s", e)
+        return 1
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    client.close()
+    logging.info("Backfill summary: scanned=%s, modified=%s, errors=%s, uncomputable=%s",
+                 totals["scanned"], totals["modified"], totals["errors"], totals["uncomputable"])
+    if totals["uncomputable"]:
+        logging.warning("%s documents lack a valid %s and will be scanned again by the next backfill",
+                        totals["uncomputable"], " / ".join(SOURCE_FIELDS))
+    return 0 if totals["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
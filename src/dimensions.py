@@ -0,0 +1,214 @@
+"""
+Normalisation des dimensions Doctor, Hospital et Insurance Provider.
+
+Pendant la migration, chaque valeur texte de ces colonnes est remplacée par une
+clé entière (clé de substitution) ; les libellés sont stockés une seule fois
+dans une petite collection de dimension (dim_doctor, dim_hospital,
+dim_insurance_provider) : {"_id": clé, "name": libellé}.
+
+- DimensionEncoder : dictionnaire en mémoire conservé d'un lot à l'autre ; les
+  nouvelles valeurs reçoivent des clés réservées par plages via un compteur
+  atomique (schema_metadata), ce qui reste correct avec plusieurs chargeurs.
+- DimensionCache : côté lecture, carte clé -> libellé chargée localement,
+  complétée à la demande, pour résoudre les noms sans $lookup.
+
+Les colonnes encodées d'une collection sont enregistrées dans schema_metadata
+(_id "<collection>:dimensions") : un chargement en append qui n'encode pas les
+mêmes colonnes est refusé, et les lecteurs (cohort.py, patch.py) détectent les
+clés de dimension d'après cet enregistrement.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from categorical import CategoricalBatch
+
+DIMENSION_FIELDS = ("Doctor", "Hospital", "Insurance Provider")
+
+
+def dimension_collection_name(field: str) -> str:
+    """Nom de la collection de dimension d'une colonne ("Insurance Provider" -> dim_insurance_provider)."""
+    return "dim_" + field.lower().replace(" ", "_")
+
+
+def dimensions_record(metadata: Collection, collection_name: str) -> Optional[Dict[str, Any]]:
+    """Colonnes de dimension enregistrées pour la collection (None si elle stocke les libellés)."""
+    return metadata.find_one({"_id": f"{collection_name}:dimensions"})
+
+
+def register_dimensions(metadata: Collection, collection_name: str, fields: Sequence[str] = DIMENSION_FIELDS,
+                        has_documents: bool = False, replace: bool = False) -> None:
+    """Enregistrer les colonnes encodées en clés de dimension.
+
+    ValueError si la collection encode d'autres colonnes, ou si elle n'a pas
+    d'enregistrement mais contient déjà des documents (libellés en clair).
+    replace=True : après le swap d'un full_reload, remplace l'enregistrement.
+    """
+    doc_id = f"{collection_name}:dimensions"
+    record = {"_id": doc_id, "collection": collection_name, "kind": "dimensions", "fields": list(fields),
+              "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if replace:
+        metadata.replace_one({"_id": doc_id}, record, upsert=True)
+        return
+    if has_documents and dimensions_record(metadata, collection_name) is None:
+        raise ValueError(f"{collection_name} already holds dimension labels; "
+                         "encode them with a full reload (MIGRATION_MODE=full_reload)")
+    try:
+        metadata.insert_one(record)
+    except DuplicateKeyError:
+        existing = dimensions_record(metadata, collection_name)
+        if sorted(existing["fields"]) != sorted(fields):
+            raise ValueError(f"{collection_name} encodes {', '.join(existing['fields'])} as dimension keys, "
+                             f"not {', '.join(fields)}")
+
+
+def forget_dimensions(metadata: Collection, collection_name: str) -> int:
+    """Supprimer l'enregistrement (collection rechargée avec ses libellés) ; retourne le nombre supprimé."""
+    return metadata.delete_many({"_id": f"{collection_name}:dimensions"}).deleted_count
+
+
+class DimensionEncoder:
+    """Remplace les libellés des colonnes de dimension par leurs clés entières.
+
+    db=None (dry-run) : les clés sont attribuées localement sans rien écrire.
+    """
+
+    def __init__(self, db: Optional[Database], fields: Sequence[str] = DIMENSION_FIELDS,
+                 metadata_name: str = "schema_metadata") -> None:
+        self.db = db
+        self.fields = tuple(fields)
+        self.metadata_name = metadata_name
+        self.keys: Dict[str, Dict[str, int]] = {field: {} for field in self.fields}
+        self._next_local = {field: 1 for field in self.fields}
+        # Encodeur partagé par les workers de l'ingestion multi-fichiers
+        self._lock = threading.Lock()
+        if db is not None:
+            for field in self.fields:
+                collection = db[dimension_collection_name(field)]
+                collection.create_index("name", unique=True)
+                self.keys[field] = {doc["name"]: doc["_id"] for doc in collection.find({}, {"name": 1})}
+            logging.info("Dimension maps loaded: %s",
+                         ", ".join(f"{field}={len(self.keys[field])}" for field in self.fields))
+
+    def _reserve(self, field: str, count: int) -> int:
+        """Réserver count clés consécutives ; retourne la première."""
+        if self.db is None:
+            first = self._next_local[field]
+            self._next_local[field] += count
+            return first
+        counter = self.db[self.metadata_name].find_one_and_update(
+            {"_id": f"{dimension_collection_name(field)}:next_key"},
+            {"$inc": {"value": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["value"] - count + 1
+
+    def _register(self, field: str, names: List[str]) -> None:
+        """Attribuer des clés aux nouveaux libellés et les enregistrer dans la dimension."""
+        first = self._reserve(field, len(names))
+        assigned = {name: first + i for i, name in enumerate(names)}
+        if self.db is not None:
+            collection = self.db[dimension_collection_name(field)]
+            try:
+                collection.insert_many([{"_id": key, "name": name} for name, key in assigned.items()], ordered=False)
+            except BulkWriteError as bwe:
+                if any(err.get("code") != 11000 for err in bwe.details.get("writeErrors", [])):
+                    raise
+                # Libellés insérés entre-temps par un autre chargeur : reprendre leurs clés
+                conflicts = [names[err["index"]] for err in bwe.details["writeErrors"]]
+                for doc in collection.find({"name": {"$in": conflicts}}):
+                    assigned[doc["name"]] = doc["_id"]
+        self.keys[field].update(assigned)
+
+    def encode_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Transformation de lot pour BatchProcessor (migrate.py).
+
+        Les lignes sont réécrites en place : les codes catégoriels d'un
+        CategoricalBatch pour ces colonnes sont invalidés.
+        """
+        for field in self.fields:
+            keys = self.keys[field]
+            with self._lock:
+                new = list(dict.fromkeys(doc[field] for doc in batch if field in doc and doc[field] not in keys))
+                if new:
+                    self._register(field, new)
+            for doc in batch:
+                if field in doc:
+                    doc[field] = keys[doc[field]]
+            if isinstance(batch, CategoricalBatch):
+                batch.invalidate(field)
+        return batch
+
+
+class DimensionCache:
+    """Carte locale clé -> libellé pour résoudre les dimensions à la lecture."""
+
+    def __init__(self, db: Database, fields: Sequence[str] = DIMENSION_FIELDS) -> None:
+        self.db = db
+        self.fields = tuple(fields)
+        self.names: Dict[str, Dict[int, str]] = {}
+        self.keys: Dict[str, Dict[str, int]] = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Recharger toutes les dimensions (une requête par collection de dimension)."""
+        for field in self.fields:
+            docs = list(self.db[dimension_collection_name(field)].find({}, {"name": 1}))
+            self.names[field] = {doc["_id"]: doc["name"] for doc in docs}
+            self.keys[field] = {doc["name"]: doc["_id"] for doc in docs}
+
+    def _load_missing(self, field: str, keys: Iterable[int]) -> None:
+        missing = [key for key in keys if key not in self.names[field]]
+        if missing:
+            for doc in self.db[dimension_collection_name(field)].find({"_id": {"$in": missing}}):
+                self.names[field][doc["_id"]] = doc["name"]
+                self.keys[field][doc["name"]] = doc["_id"]
+
+    def resolve(self, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Remplacer les clés de dimension d'un document par leurs libellés."""
+        if doc is None:
+            return None
+        return self.resolve_many([doc])[0]
+
+    def resolve_many(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for field in self.fields:
+            self._load_missing(field, {doc[field] for doc in docs if isinstance(doc.get(field), int)})
+            names = self.names[field]
+            for doc in docs:
+                if isinstance(doc.get(field), int):
+                    doc[field] = names.get(doc[field], doc[field])
+        return docs
+
+    def key_for(self, field: str, name: str) -> Optional[int]:
+        """Clé d'un libellé (None s'il n'existe pas)."""
+        if name not in self.keys[field]:
+            doc = self.db[dimension_collection_name(field)].find_one({"name": name})
+            if doc is None:
+                return None
+            self.names[field][doc["_id"]] = name
+            self.keys[field][name] = doc["_id"]
+        return self.keys[field][name]
+
+    def translate_filter(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Traduire les égalités et $in sur libellés de dimension en conditions sur les clés."""
+        translated = dict(query)
+        for field in self.fields:
+            if field not in query:
+                continue
+            condition = query[field]
+            if isinstance(condition, dict) and "$in" in condition:
+                keys = [self.key_for(field, name) for name in condition["$in"]]
+                translated[field] = {**condition, "$in": [key for key in keys if key is not None]}
+            elif not isinstance(condition, dict):
+                key = self.key_for(field, condition)
+                # Libellé inconnu : aucune correspondance (et non les documents sans valeur)
+                translated[field] = key if key is not None else {"$in": []}
+        return translated
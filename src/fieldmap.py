@@ -0,0 +1,240 @@
+"""
+Encodage compact des noms de champs de patient_records.
+
+Les en-têtes CSV (« Date of Admission », « Insurance Provider »...) sont répétés
+comme clés BSON dans chaque document. En mode compact, la migration écrit des
+clés courtes issues d'un mapping versionné, stocké dans la collection de
+métadonnées (schema_metadata par défaut). TranslatedCollection traduit filtres,
+projections, tris, mises à jour et résultats entre noms longs et clés courtes.
+
+Une collection n'utilise qu'une version de mapping à la fois : la plus récente
+enregistrée pour elle. Changer de mapping implique un rechargement complet, qui
+enregistre le mapping (ou le supprime, en noms longs) une fois le swap réussi.
+
+Utilisation:
+    fieldmap = load_fieldmap(db["schema_metadata"], "patient_records")
+    patients = TranslatedCollection(db["patient_records"], fieldmap)
+    patients.find_one({"Medical Condition": "Asthma"}, {"Name": 1})
+"""
+
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+# Version 1 : une à trois lettres par colonne du CSV
+DEFAULT_MAPPING: Dict[str, str] = {
+    "Name": "n",
+    "Age": "a",
+    "Gender": "g",
+    "Blood Type": "bt",
+    "Medical Condition": "mc",
+    "Date of Admission": "da",
+    "Doctor": "dr",
+    "Hospital": "h",
+    "Insurance Provider": "ip",
+    "Billing Amount": "ba",
+    "Room Number": "rn",
+    "Admission Type": "at",
+    "Discharge Date": "dd",
+    "Medication": "m",
+    "Test Results": "tr",
+}
+
+# Opérateurs dont la valeur est une liste de sous-filtres
+_LOGICAL = ("$and", "$or", "$nor")
+
+
+class FieldMap:
+    """Correspondance versionnée nom long <-> clé courte."""
+
+    def __init__(self, mapping: Dict[str, str], version: int = 1) -> None:
+        if len(set(mapping.values())) != len(mapping):
+            raise ValueError("Field map short keys must be unique")
+        self.version = version
+        self.to_short = dict(mapping)
+        self.to_long = {short: long for long, short in mapping.items()}
+
+    def short(self, path: str) -> str:
+        """Traduire un chemin (éventuellement pointé) vers sa forme compacte."""
+        head, dot, rest = path.partition(".")
+        return self.to_short.get(head, head) + dot + rest
+
+    def long(self, path: str) -> str:
+        head, dot, rest = path.partition(".")
+        return self.to_long.get(head, head) + dot + rest
+
+    # --- Documents --------------------------------------------------------
+
+    def encode_document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        return {self.to_short.get(k, k): v for k, v in doc.items()}
+
+    def decode_document(self, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if doc is None:
+            return None
+        return {self.to_long.get(k, k): v for k, v in doc.items()}
+
+    def encode_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Transformation de lot pour BatchProcessor (migrate.py)."""
+        return [self.encode_document(doc) for doc in batch]
+
+    # --- Requêtes ---------------------------------------------------------
+
+    def _expression(self, value: Any) -> Any:
+        """Références "$Champ" dans les expressions ($expr, pipelines)."""
+        if isinstance(value, str) and value.startswith("$") and not value.startswith("$$"):
+            return "$" + self.short(value[1:])
+        if isinstance(value, dict):
+            return {k: self._expression(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._expression(v) for v in value]
+        return value
+
+    def translate_filter(self, query: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        translated: Dict[str, Any] = {}
+        for key, value in (query or {}).items():
+            if key in _LOGICAL:
+                translated[key] = [self.translate_filter(clause) for clause in value]
+            elif key == "$expr":
+                translated[key] = self._expression(value)
+            elif key.startswith("$"):
+                translated[key] = value
+            else:
+                translated[self.short(key)] = value
+        return translated
+
+    def translate_projection(self, projection: Any) -> Any:
+        if projection is None:
+            return None
+        if isinstance(projection, dict):
+            return {self.short(k): v for k, v in projection.items()}
+        return [self.short(field) for field in projection]
+
+    def translate_sort(self, sort: Any) -> Any:
+        if sort is None:
+            return None
+        if isinstance(sort, str):
+            return self.short(sort)
+        return [(self.short(field), direction) for field, direction in sort]
+
+    def translate_update(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        """Mises à jour par opérateurs ($set, $unset, $inc...) ou document de remplacement."""
+        if not any(key.startswith("$") for key in update):
+            return self.encode_document(update)
+        return {op: {self.short(k): v for k, v in fields.items()} if isinstance(fields, dict) else fields
+                for op, fields in update.items()}
+
+
+def save_fieldmap(metadata: Collection, collection_name: str, fieldmap: FieldMap) -> None:
+    """Enregistrer une version de mapping (idempotent ; une version publiée est immuable)."""
+    doc_id = f"{collection_name}:fieldmap:v{fieldmap.version}"
+    try:
+        metadata.insert_one({
+            "_id": doc_id, "collection": collection_name, "kind": "fieldmap",
+            "version": fieldmap.version, "mapping": fieldmap.to_short,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+    except DuplicateKeyError:
+        existing = metadata.find_one({"_id": doc_id})
+        if existing["mapping"] != fieldmap.to_short:
+            raise ValueError(f"Field map version {fieldmap.version} of {collection_name} "
+                             f"already exists with a different mapping")
+
+
+def forget_fieldmap(metadata: Collection, collection_name: str) -> int:
+    """Supprimer les mappings d'une collection rechargée en noms longs ; retourne le nombre supprimé."""
+    return metadata.delete_many({"collection": collection_name, "kind": "fieldmap"}).deleted_count
+
+
+def load_fieldmap(metadata: Collection, collection_name: str,
+                  version: Optional[int] = None) -> Optional[FieldMap]:
+    """Mapping de la collection (dernière version par défaut), ou None si stockage en noms longs."""
+    query: Dict[str, Any] = {"collection": collection_name, "kind": "fieldmap"}
+    if version is not None:
+        query["version"] = version
+    doc = metadata.find_one(query, sort=[("version", -1)])
+    return FieldMap(doc["mapping"], doc["version"]) if doc else None
+
+
+class _TranslatedCursor:
+    """Curseur pymongo dont les documents sont retraduits en noms longs."""
+
+    def __init__(self, cursor, fieldmap: FieldMap) -> None:
+        self._cursor = cursor
+        self._fieldmap = fieldmap
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "_TranslatedCursor":
+        if direction is not None:
+            self._cursor.sort(self._fieldmap.short(key_or_list), direction)
+        else:
+            self._cursor.sort(self._fieldmap.translate_sort(key_or_list))
+        return self
+
+    def limit(self, n: int) -> "_TranslatedCursor":
+        self._cursor.limit(n)
+        return self
+
+    def skip(self, n: int) -> "_TranslatedCursor":
+        self._cursor.skip(n)
+        return self
+
+    def batch_size(self, n: int) -> "_TranslatedCursor":
+        self._cursor.batch_size(n)
+        return self
+
+    def close(self) -> None:
+        self._cursor.close()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for doc in self._cursor:
+            yield self._fieldmap.decode_document(doc)
+
+
+class TranslatedCollection:
+    """Accès CRUD en noms longs sur une collection stockée en clés courtes.
+
+    Les opérations non traduites restent disponibles via .raw.
+    """
+
+    def __init__(self, collection: Collection, fieldmap: FieldMap) -> None:
+        self.raw = collection
+        self.fieldmap = fieldmap
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None, **kwargs) -> _TranslatedCursor:
+        fm = self.fieldmap
+        if "sort" in kwargs:
+            kwargs["sort"] = fm.translate_sort(kwargs["sort"])
+        cursor = self.raw.find(fm.translate_filter(filter), fm.translate_projection(projection), **kwargs)
+        return _TranslatedCursor(cursor, fm)
+
+    def find_one(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None,
+                 **kwargs) -> Optional[Dict[str, Any]]:
+        fm = self.fieldmap
+        if "sort" in kwargs:
+            kwargs["sort"] = fm.translate_sort(kwargs["sort"])
+        return fm.decode_document(self.raw.find_one(fm.translate_filter(filter), fm.translate_projection(projection),
+                                                    **kwargs))
+
+    def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        return self.raw.count_documents(self.fieldmap.translate_filter(filter), **kwargs)
+
+    def insert_one(self, document: Dict[str, Any], **kwargs):
+        return self.raw.insert_one(self.fieldmap.encode_document(document), **kwargs)
+
+    def insert_many(self, documents: List[Dict[str, Any]], **kwargs):
+        return self.raw.insert_many(self.fieldmap.encode_batch(documents), **kwargs)
+
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], **kwargs):
+        return self.raw.update_one(self.fieldmap.translate_filter(filter), self.fieldmap.translate_update(update),
+                                   **kwargs)
+
+    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], **kwargs):
+        return self.raw.update_many(self.fieldmap.translate_filter(filter), self.fieldmap.translate_update(update),
+                                    **kwargs)
+
+    def delete_one(self, filter: Dict[str, Any], **kwargs):
+        return self.raw.delete_one(self.fieldmap.translate_filter(filter), **kwargs)
+
+    def delete_many(self, filter: Dict[str, Any], **kwargs):
+        return self.raw.delete_many(self.fieldmap.translate_filter(filter), **kwargs)
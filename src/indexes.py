@@ -0,0 +1,109 @@
+"""
+Définition centralisée des index de la collection patient_records.
+
+Les index sont déclarés une seule fois ici et réutilisés par la migration,
+les tests d'utilisation des index (explain) et les outils d'administration.
+
+Utilisation:
+    python src/indexes.py        # créer les index sur la collection cible
+"""
+
+import logging
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from fieldmap import FieldMap
+
+# Chaque entrée : liste de (champ, sens) + options createIndex.
+# Uniquement des champs écrits par la migration : ces index sont garantis à
+# chaque chargement (append, full_reload, partitions).
+INDEX_SPECS: List[Dict[str, Any]] = [
+    # Contrôle de complétude de la migration (recherche par nom)
+    {"keys": [("Name", ASCENDING)]},
+    # Cohortes par pathologie sur une période d'admission (égalité puis intervalle)
+    {"keys": [("Medical Condition", ASCENDING), ("Date of Admission", ASCENDING)]},
+    # Agrégations par période d'admission (champs dérivés, src/derived.py)
+    {"keys": [("admission_year", ASCENDING), ("admission_month", ASCENDING)]},
+    # Pagination par clé sur la date d'admission (src/pagination.py)
+    {"keys": [("Date of Admission", ASCENDING), ("_id", ASCENDING)]},
+]
+
+# Champs des documents de la démonstration CRUD (src/crud_demo.py), absents du
+# CSV : créés par la démonstration elle-même, jamais par la migration.
+DEMO_INDEX_SPECS: List[Dict[str, Any]] = [
+    # Recherche patient (recherche par préfixe)
+    {"keys": [("patient_id", ASCENDING)]},
+    # Filtrage par âge
+    {"keys": [("age", ASCENDING)]},
+    # Recherche par diagnostic
+    {"keys": [("diagnosis", ASCENDING)]},
+]
+
+
+def index_models(fieldmap: Optional[FieldMap] = None,
+                 specs: Sequence[Dict[str, Any]] = INDEX_SPECS) -> List[IndexModel]:
+    """Construire les IndexModel pymongo à partir de specs (clés courtes si fieldmap)."""
+    models = []
+    for spec in specs:
+        keys = fieldmap.translate_sort(spec["keys"]) if fieldmap is not None else spec["keys"]
+        models.append(IndexModel(keys, **spec.get("options", {})))
+    return models
+
+
+def ensure_indexes(collection: Collection, fieldmap: Optional[FieldMap] = None,
+                   specs: Sequence[Dict[str, Any]] = INDEX_SPECS) -> List[str]:
+    """Créer (de façon idempotente) les index déclarés et retourner leurs noms."""
+    names = collection.create_indexes(index_models(fieldmap, specs))
+    logging.info("Indexes ensured on %s: %s", collection.full_name, names)
+    return names
+
+
+def describe_indexes(collection: Collection) -> List[Dict[str, Any]]:
+    """Décrire les index secondaires existants (hors _id_) : clés et options."""
+    described = []
+    for index in collection.list_indexes():
+        if index["name"] == "_id_":
+            continue
+        options = {k: v for k, v in index.items() if k not in ("v", "key", "ns")}
+        described.append({"key": list(index["key"].items()), "options": options})
+    return described
+
+
+def copy_index_definitions(source: Collection, target: Collection,
+                           fieldmap: Optional[FieldMap] = None) -> List[str]:
+    """Recréer sur target les index secondaires de source (hors _id_) dont les clés n'y existent pas déjà.
+
+    Un index de mêmes clés sous un autre nom (ex. déjà créé par ensure_indexes)
+    ferait échouer create_indexes (IndexOptionsConflict) : il est ignoré.
+    fieldmap : target est stockée en clés courtes ; les index portant sur des
+    noms longs du mapping (source en noms longs) ne sont pas copiés.
+    """
+    existing = {tuple(index["key"].items()) for index in target.list_indexes()}
+    models = [IndexModel(index["key"], **index["options"]) for index in describe_indexes(source)
+              if tuple(index["key"]) not in existing
+              and (fieldmap is None or all(fieldmap.short(field) == field for field, _ in index["key"]))]
+    return target.create_indexes(models) if models else []
+
+
+def main() -> int:
+    """Créer les index sur la collection cible (variables d'env de migrate.py)."""
+    # Import local : migrate.py importe ce module pour le mode full_reload
+    from migrate import get_mongo_client, get_target_collection, setup_logging
+
+    setup_logging()
+    try:
+        client = get_mongo_client()
+        ensure_indexes(get_target_collection(client))
+    except PyMongoError as e:
+        logging.error("Failed to create indexes: %s", e)
+        return 1
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+Générateur de charge concurrent pour les chemins CRUD de patient_records.
+
+Rejoue un mélange configurable d'opérations (lecture par _id, lecture filtrée,
+projection, mise à jour, insertion, suppression) depuis plusieurs threads à un
+débit cible, puis rapporte débit et latences p50/p95/p99 par type d'opération.
+
+- Boucle fermée (défaut) : chaque thread enchaîne ses opérations, le débit
+  cible est plafonné par un seau à jetons.
+- Boucle ouverte (--open-loop) : les arrivées sont planifiées à intervalles
+  fixes indépendamment des réponses ; la latence est mesurée depuis l'instant
+  prévu, ce qui évite l'omission coordonnée quand le serveur ralentit.
+
+Les écritures ne touchent que des documents insérés par le run (marqués
+_loadgen_run), supprimés en fin d'exécution. Les cibles des mises à jour et
+suppressions sont insérées avant la mesure (--pool-size) ; si le pool est
+épuisé, l'opération est comptée comme sautée au lieu de mesurer un insert.
+
+Utilisation:
+    python src/loadgen.py --duration 60 --rate 2000 --workers 32 --open-loop
+    python src/loadgen.py --mix "point_read=70,filtered_read=20,update=10" --report reports/load.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from migrate import get_env, get_mongo_client, get_target_collection, setup_logging
+from throttle import TokenBucket
+
+OPERATIONS = ("point_read", "filtered_read", "projection", "update", "insert", "delete")
+DEFAULT_MIX = "point_read=40,filtered_read=20,projection=15,update=15,insert=5,delete=5"
+RUN_FIELD = "_loadgen_run"
+
+
+class PoolExhausted(Exception):
+    """Plus aucun document du run disponible pour une mise à jour ou une suppression."""
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Convertir "op=poids,op=poids" en poids par opération."""
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in mix: {name} (expected one of {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"Empty operation mix: {spec!r}")
+    return mix
+
+
+class Workload:
+    """Opérations CRUD tirées d'un échantillon de la collection."""
+
+    def __init__(self, collection: Collection, sample_size: int = 1000,
+                 run_id: Optional[str] = None) -> None:
+        self.collection = collection
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        sample = list(collection.aggregate([
+            {"$sample": {"size": sample_size}},
+            {"$match": {RUN_FIELD: {"$exists": False}}},
+        ]))
+        if not sample:
+            raise ValueError(f"Collection {collection.name} is empty, nothing to load-test")
+        self.ids = [doc["_id"] for doc in sample]
+        self.conditions = sorted({doc["Medical Condition"] for doc in sample if doc.get("Medical Condition")})
+        self.templates = [{k: v for k, v in doc.items() if k != "_id"} for doc in sample]
+        self._inserted: deque = deque()
+        self.operations: Dict[str, Callable[[random.Random], Any]] = {
+            "point_read": self.point_read,
+            "filtered_read": self.filtered_read,
+            "projection": self.projection,
+            "update": self.update,
+            "insert": self.insert,
+            "delete": self.delete,
+        }
+
+    def check_mix(self, mix: Dict[str, float]) -> None:
+        """Refuser un mélange que l'échantillon ne permet pas d'exécuter.
+
+        Les lectures filtrées et projections tirent une "Medical Condition" de
+        l'échantillon : sans aucune valeur, chaque tirage lèverait IndexError
+        dans les threads de charge.
+        """
+        needs_condition = [op for op in ("filtered_read", "projection") if mix.get(op, 0) > 0]
+        if needs_condition and not self.conditions:
+            raise ValueError(f"No 'Medical Condition' value in the sampled documents of {self.collection.name}, "
+                             f"cannot run {', '.join(needs_condition)}")
+
+    def point_read(self, rng: random.Random) -> Any:
+        return self.collection.find_one({"_id": rng.choice(self.ids)})
+
+    def filtered_read(self, rng: random.Random) -> Any:
+        return list(self.collection.find({"Medical Condition": rng.choice(self.conditions)}).limit(20))
+
+    def projection(self, rng: random.Random) -> Any:
+        return list(self.collection.find(
+            {"Medical Condition": rng.choice(self.conditions)},
+            {"Name": 1, "Age": 1, "Hospital": 1, "_id": 0},
+        ).limit(20))
+
+    def seed_pool(self, count: int, seed: Optional[int] = None) -> int:
+        """Insérer count documents du run avant la mesure (cibles des mises à jour et suppressions)."""
+        rng = random.Random(seed)
+        documents = [self._new_document(rng) for _ in range(count)]
+        if documents:
+            self._inserted.extend(self.collection.insert_many(documents).inserted_ids)
+        return len(documents)
+
+    def _own_id(self, rng: random.Random) -> Any:
+        """Un document inséré par ce run ; PoolExhausted si aucun n'est disponible."""
+        try:
+            return self._inserted.popleft()
+        except IndexError:
+            raise PoolExhausted() from None
+
+    def _new_document(self, rng: random.Random) -> Dict[str, Any]:
+        doc = dict(rng.choice(self.templates))
+        doc[RUN_FIELD] = self.run_id
+        return doc
+
+    def _insert_document(self, rng: random.Random) -> Any:
+        return self.collection.insert_one(self._new_document(rng)).inserted_id
+
+    def update(self, rng: random.Random) -> Any:
+        doc_id = self._own_id(rng)
+        try:
+            return self.collection.update_one(
+                {"_id": doc_id, RUN_FIELD: self.run_id},
+                {"$set": {"Billing Amount": f"{rng.uniform(1000, 50000):.2f}"}},
+            )
+        finally:
+            self._inserted.append(doc_id)
+
+    def insert(self, rng: random.Random) -> Any:
+        doc_id = self._insert_document(rng)
+        self._inserted.append(doc_id)
+        return doc_id
+
+    def delete(self, rng: random.Random) -> Any:
+        return self.collection.delete_one({"_id": self._own_id(rng), RUN_FIELD: self.run_id})
+
+    def cleanup(self) -> int:
+        """Supprimer tous les documents insérés par ce run."""
+        return self.collection.delete_many({RUN_FIELD: self.run_id}).deleted_count
+
+
+class LatencyRecorder:
+    """Latences (s) et erreurs par type d'opération, partagées entre threads."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, op: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self.latencies.setdefault(op, []).append(seconds)
+            if error:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+    def skip(self, op: str) -> None:
+        """Opération non exécutée (pool de documents du run épuisé) : aucune latence enregistrée."""
+        with self._lock:
+            self.skipped[op] = self.skipped.get(op, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, float]]:
+        """Débit et percentiles (ms) par opération, plus une ligne "all"."""
+        result = {}
+        everything = [s for values in self.latencies.values() for s in values]
+        for op, values in list(self.latencies.items()) + [("all", everything)]:
+            if not values:
+                continue
+            p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+            result[op] = {
+                "count": len(values),
+                "errors": sum(self.errors.values()) if op == "all" else self.errors.get(op, 0),
+                "ops_per_s": len(values) / elapsed if elapsed > 0 else 0.0,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": max(values) * 1000,
+            }
+        return result
+
+
+def _execute(workload: Workload, recorder: LatencyRecorder, op: str, rng: random.Random, started: float) -> None:
+    error = False
+    try:
+        workload.operations[op](rng)
+    except PoolExhausted:
+        recorder.skip(op)
+        return
+    except PyMongoError as e:
+        error = True
+        logging.debug("Operation %s failed: %s", op, e)
+    recorder.record(op, time.perf_counter() - started, error)
+
+
+def run_load(workload: Workload, mix: Dict[str, float], workers: int = 8, duration: float = 30.0,
+             rate: float = 0.0, open_loop: bool = False, seed: Optional[int] = None) -> Dict[str, Any]:
+    """Exécuter la charge et retourner le rapport (débit, percentiles par opération)."""
+    if open_loop and rate <= 0:
+        raise ValueError("Open-loop mode needs a target rate (--rate)")
+    workload.check_mix(mix)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    recorder = LatencyRecorder()
+    bucket = TokenBucket(rate, burst=max(1.0, rate / 10)) if rate > 0 and not open_loop else None
+    slots = itertools.count()
+    start = time.perf_counter()
+    deadline = start + duration
+    # Un compteur par thread : pas d'incrément partagé sans verrou
+    late = [0] * max(1, workers)
+
+    def worker(index: int) -> None:
+        rng = random.Random(None if seed is None else seed + index)
+        while True:
+            if open_loop:
+                # Instant d'arrivée prévu : indépendant de la vitesse de réponse du serveur
+                intended = start + next(slots) / rate
+                if intended >= deadline:
+                    return
+                now = time.perf_counter()
+                if intended > now:
+                    time.sleep(intended - now)
+                else:
+                    late[index] += 1
+                began = intended
+            else:
+                if bucket is not None:
+                    bucket.acquire(1)
+                began = time.perf_counter()
+                if began >= deadline:
+                    return
+            _execute(workload, recorder, rng.choices(names, weights)[0], rng, began)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "run_id": workload.run_id,
+        "mode": "open" if open_loop else "closed",
+        "workers": workers,
+        "target_rate": rate,
+        "elapsed_s": elapsed,
+        "late_arrivals": sum(late),
+        "skipped": dict(recorder.skipped),
+        "operations": recorder.summary(elapsed),
+    }
+
+
+def log_report(report: Dict[str, Any]) -> None:
+    logging.info("Load run %s (%s loop, %s workers, target %s ops/s) in %.1fs",
+                 report["run_id"], report["mode"], report["workers"],
+                 report["target_rate"] or "unlimited", report["elapsed_s"])
+    for op, line in report["operations"].items():
+        logging.info("  %-13s count=%-7s errors=%-4s %8.1f ops/s  p50=%.2fms p95=%.2fms p99=%.2fms max=%.2fms",
+                     op, line["count"], line["errors"], line["ops_per_s"],
+                     line["p50_ms"], line["p95_ms"], line["p99_ms"], line["max_ms"])
+    if report["skipped"]:
+        logging.warning("Skipped operations (run document pool exhausted, raise --pool-size): %s",
+                        ", ".join(f"{op}={count}" for op, count in report["skipped"].items()))
+    if report["late_arrivals"]:
+        logging.warning("%s arrivals started late: workers could not keep up with the target rate",
+                        report["late_arrivals"])
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : charge mixte contre la collection cible."""
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="loadgen.py", description="Charge CRUD concurrente sur patient_records")
+    parser.add_argument("--mix", default=get_env("LOADGEN_MIX", DEFAULT_MIX),
+                        help=f"poids par opération ({', '.join(OPERATIONS)})")
+    parser.add_argument("--workers", type=int, default=int(get_env("LOADGEN_WORKERS", "8")))
+    parser.add_argument("--rate", type=float, default=float(get_env("LOADGEN_RATE", "0")),
+                        help="débit cible total en ops/s (0 = aussi vite que possible)")
+    parser.add_argument("--duration", type=float, default=float(get_env("LOADGEN_DURATION", "30")))
+    parser.add_argument("--open-loop", action="store_true", help="arrivées planifiées (nécessite --rate)")
+    parser.add_argument("--sample-size", type=int, default=1000, help="documents échantillonnés pour les lectures")
+    parser.add_argument("--pool-size", type=int, default=int(get_env("LOADGEN_POOL_SIZE", "1000")),
+                        help="documents insérés avant la mesure pour les mises à jour et suppressions")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", help="écrire le rapport JSON dans ce fichier")
+    args = parser.parse_args(argv[1:])
+
+    client = None
+    try:
+        mix = parse_mix(args.mix)
+        client = get_mongo_client()
+        workload = Workload(get_target_collection(client), args.sample_size)
+        workload.check_mix(mix)
+        try:
+            if mix.get("update", 0) > 0 or mix.get("delete", 0) > 0:
+                workload.seed_pool(max(0, args.pool_size), args.seed)
+            report = run_load(workload, mix, args.workers, args.duration, args.rate, args.open_loop, args.seed)
+        finally:
+            removed = workload.cleanup()
+            logging.info("Removed %s documents inserted by the load run", removed)
+    except ValueError as e:
+        logging.error("Invalid load configuration: %s", e)
+        return 1
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    finally:
+        if client is not None:
+            client.close()
+
+    log_report(report)
+    if args.report:
+        directory = os.path.dirname(args.report)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,68 @@
+"""
+Mesure du temps passé par étape du pipeline de migration.
+
+Chaque étape (read, parse, transform, validate, encode, insert, update) cumule son
+temps, ses lignes et ses octets ; le rapport final donne lignes/s et octets/s
+par étape, ce qui sépare le coût CPU côté client du coût serveur/réseau.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Generator, List
+
+STAGE_ORDER = ("read", "parse", "transform", "validate", "encode", "insert", "update")
+
+
+class StageMetrics:
+    """Cumul (secondes, lignes, octets) par étape."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, List[float]] = {}
+        # Étapes d'insertion concurrentes (moteur asyncio) : cumuls protégés
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, rows: int = 0, nbytes: int = 0) -> None:
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += rows
+            totals[2] += nbytes
+
+    def merge(self, other: "StageMetrics") -> None:
+        """Ajouter les cumuls d'un autre StageMetrics (ex: un par worker)."""
+        for stage, (seconds, rows, nbytes) in other.stages.items():
+            self.add(stage, seconds, rows, nbytes)
+
+    @contextmanager
+    def measure(self, stage: str, rows: int = 0, nbytes: int = 0) -> Generator[None, None, None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started, rows, nbytes)
+
+    def report(self) -> List[Dict[str, float]]:
+        """Lignes du rapport, dans l'ordre du pipeline."""
+        names = [s for s in STAGE_ORDER if s in self.stages] + [s for s in self.stages if s not in STAGE_ORDER]
+        lines = []
+        for name in names:
+            seconds, rows, nbytes = self.stages[name]
+            lines.append({
+                "stage": name,
+                "seconds": seconds,
+                "rows": rows,
+                "bytes": nbytes,
+                "rows_per_s": rows / seconds if seconds > 0 else 0.0,
+                "bytes_per_s": nbytes / seconds if seconds > 0 else 0.0,
+            })
+        return lines
+
+    def log_report(self) -> None:
+        for line in self.report():
+            logging.info(
+                "Stage %-9s time=%.3fs rows=%s (%.0f rows/s) bytes=%s (%.2f MB/s)",
+                line["stage"], line["seconds"], line["rows"], line["rows_per_s"],
+                line["bytes"], line["bytes_per_s"] / (1024 * 1024),
+            )
@@ -1,12 +1,39 @@
+import argparse
 import csv
 import logging
 import os
+import random
+import re
 import sys
-from typing import Generator, List, Dict
+import time
+from typing import Any, Callable, Generator, List, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+import bson
 
 from pymongo import MongoClient
 from pymongo.collection import Collection
-from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.errors import (
+    BulkWriteError,
+    ConnectionFailure,
+    ExecutionTimeout,
+    OperationFailure,
+    PyMongoError,
+    WTimeoutError,
+)
+
+from categorical import CATEGORICAL_COLUMNS, CategoricalBatch, CategoryInterner
+from coordinator import run_coordinated
+from derived import make_transform, parse_fields
+from dimensions import DimensionEncoder, dimensions_record, forget_dimensions, register_dimensions
+from fieldmap import DEFAULT_MAPPING, FieldMap, forget_fieldmap, load_fieldmap, save_fieldmap
+from indexes import copy_index_definitions, ensure_indexes
+from metrics import StageMetrics
+from partitions import GRANULARITIES, PartitionedCollection, partition_names
+from pseudonymise import Pseudonymiser, key_record, read_key, register_key
+from quarantine import QuarantineWriter
+from scheduler import expand_inputs, log_summary, run_multi_file, write_summary
+from throttle import LoadThrottle
+from validation import validate_batch
 
 
 def setup_logging() -> None:
@@ -23,8 +50,8 @@ def get_env(name: str, default: str) -> str:
     return value if value not in (None, "") else default
 
 
-def get_mongo_client() -> MongoClient:
-    """Créer un client MongoDB à partir des variables d'env (valeurs par défaut locales).
+def get_mongo_uri() -> str:
+    """URI MongoDB à partir des variables d'env (valeurs par défaut locales).
 
     Variables d'environnement prises en compte (optionnelles):
       - MONGO_HOST (par défaut: localhost)
@@ -40,8 +67,12 @@ def get_mongo_client() -> MongoClient:
     auth_db = get_env("MONGO_AUTH_DB", "admin")
 
     # URI local par défaut (voir README pour le conteneur Docker)
-    uri = f"mongodb://{user}:{password}@{host}:{port}/?authSource={auth_db}"
-    return MongoClient(uri, serverSelectionTimeoutMS=5000)
+    return f"mongodb://{user}:{password}@{host}:{port}/?authSource={auth_db}"
+
+
+def get_mongo_client() -> MongoClient:
+    """Créer un client MongoDB à partir des variables d'env (voir get_mongo_uri)."""
+    return MongoClient(get_mongo_uri(), serverSelectionTimeoutMS=5000)
 
 
 def get_target_collection(client: MongoClient) -> Collection:
@@ -56,113 +87,895 @@ def get_target_collection(client: MongoClient) -> Collection:
     return client[db_name][coll_name]
 
 
-def read_csv_in_batches(csv_path: str, batch_size: int) -> Generator[List[Dict[str, str]], None, None]:
+class _TimedLines:
+    """Itérateur sur les lignes d'un fichier qui cumule le temps et le volume lus."""
+
+    def __init__(self, f) -> None:
+        self._f = f
+        self.seconds = 0.0
+        self.nbytes = 0
+
+    def __iter__(self) -> "_TimedLines":
+        return self
+
+    def __next__(self) -> str:
+        started = time.perf_counter()
+        line = next(self._f)
+        self.seconds += time.perf_counter() - started
+        self.nbytes += len(line)
+        return line
+
+
+def read_csv_in_batches(csv_path: str, batch_size: int,
+                        metrics: Optional[StageMetrics] = None,
+                        categorical: Union[Sequence[str], str, None] = CATEGORICAL_COLUMNS,
+                        ) -> Generator[List[Dict[str, str]], None, None]:
     """Lire le CSV en dictionnaires et produire des lots (batches) de taille fixe.
 
     - Utilise csv.DictReader (stdlib) pour éviter des dépendances inutiles.
     - Ignore les lignes totalement vides.
+    - Si metrics est fourni, le temps de lecture du fichier (read) et celui du
+      découpage CSV (parse) sont comptabilisés séparément pour chaque lot.
+    - categorical : colonnes dont les valeurs sont partagées via un dictionnaire
+      par colonne (lots CategoricalBatch avec leurs codes) ; "auto" pour les
+      détecter sur le premier lot, None pour des lots list simples.
     """
+    interner = None
+    if categorical is not None:
+        interner = CategoryInterner(None if categorical == "auto" else categorical)
     with open(csv_path, mode="r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
+        lines = _TimedLines(f) if metrics is not None else f
+        reader = csv.DictReader(lines)
         batch: List[Dict[str, str]] = []
+        started = time.perf_counter()
+        read_seconds, read_bytes = 0.0, 0
         for row in reader:
             # Minimal: conserver les valeurs telles quelles (str) ; ignorer lignes vides
             if row is None or all((v is None or str(v).strip() == "") for v in row.values()):
                 continue
             batch.append(row)
             if len(batch) >= batch_size:
+                if interner is not None:
+                    batch = interner.encode(batch)
+                if metrics is not None:
+                    read_seconds, read_bytes = _record_read(metrics, lines, started, read_seconds, read_bytes, len(batch))
                 yield batch
                 batch = []
+                started = time.perf_counter()
         if batch:
+            if interner is not None:
+                batch = interner.encode(batch)
+            if metrics is not None:
+                _record_read(metrics, lines, started, read_seconds, read_bytes, len(batch))
             yield batch
 
 
-def insert_batch(collection: Collection, documents: List[Dict[str, str]]) -> Dict[str, int]:
+def _record_read(metrics: StageMetrics, lines: _TimedLines, started: float,
+                 read_seconds: float, read_bytes: int, rows: int):
+    """Ventiler le temps écoulé depuis le début du lot entre lecture et parsing."""
+    elapsed = time.perf_counter() - started
+    batch_read = lines.seconds - read_seconds
+    batch_bytes = lines.nbytes - read_bytes
+    metrics.add("read", batch_read, rows, batch_bytes)
+    metrics.add("parse", max(0.0, elapsed - batch_read), rows, batch_bytes)
+    return lines.seconds, lines.nbytes
+
+
+class RetryPolicy(NamedTuple):
+    """Politique de nouvelle tentative pour les erreurs transitoires."""
+
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int) -> float:
+        """Backoff exponentiel avec gigue (attempt commence à 0)."""
+        return min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+# Codes serveur transitoires : élection, arrêt, réseau, dépassement de délai
+RETRYABLE_ERROR_CODES = frozenset({
+    6, 7, 50, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13388, 13435, 13436,
+})
+DUPLICATE_KEY_CODE = 11000
+
+
+def is_retryable_error(error: PyMongoError) -> bool:
+    """Indiquer si une erreur globale (hors writeErrors) justifie une nouvelle tentative."""
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout, WTimeoutError)):
+        return True
+    if error.has_error_label("RetryableWriteError"):
+        return True
+    return isinstance(error, OperationFailure) and error.code in RETRYABLE_ERROR_CODES
+
+
+def _is_duplicate_id(write_error: Dict) -> bool:
+    """Erreur de clé dupliquée sur _id (document déjà inséré par une tentative précédente)."""
+    if write_error.get("code") != DUPLICATE_KEY_CODE:
+        return False
+    key_pattern = write_error.get("keyPattern")
+    if key_pattern is not None:
+        return list(key_pattern) == ["_id"]
+    return "_id_" in write_error.get("errmsg", "")
+
+
+def insert_batch(collection: Collection, documents: List[Dict[str, str]],
+                 row_numbers: Optional[List[int]] = None,
+                 dead_letter: Optional[QuarantineWriter] = None,
+                 retry: RetryPolicy = RetryPolicy(),
+                 throttle: Optional[LoadThrottle] = None,
+                 idempotent: bool = False) -> Dict[str, int]:
     """Insérer un lot de documents et retourner le nombre de succès/erreurs.
 
     - ordered=False: continue les insertions même si certaines échouent (meilleure robustesse).
+    - Chaque writeErrors[].index est rattaché à son document source ; seules les
+      erreurs transitoires sont renvoyées, avec backoff exponentiel.
+    - Une erreur globale transitoire (réseau, élection) renvoie les documents en
+      attente ; les _id attribués par pymongo étant conservés, une clé dupliquée
+      sur _id lors d'une nouvelle tentative compte comme un succès.
+    - Les échecs définitifs sont écrits dans dead_letter avec leur numéro de ligne.
+    - throttle (optionnel) régule le débit et ralentit quand la latence monte.
+    - idempotent=True : les _id sont déterministes (reprise d'un travail déjà
+      partiellement fait), une clé dupliquée sur _id compte comme un succès dès
+      la première tentative.
+    """
+    if row_numbers is None:
+        row_numbers = list(range(1, len(documents) + 1))
+
+    def send(pending: List[int], attempt: int, last_error: Dict[int, str],
+             to_retry: List[int], failed: List[int]) -> int:
+        try:
+            return len(collection.insert_many([documents[i] for i in pending], ordered=False).inserted_ids)
+        except PyMongoError as e:
+            return classify_insert_error(e, pending, attempt, idempotent, last_error, to_retry, failed)
+
+    success, failed, last_error, retried = write_with_retry(send, documents, retry, throttle)
+    return finish_insert(documents, row_numbers, dead_letter, success, failed, last_error, retried)
+
+
+WriteAttempt = Callable[[List[int], int, Dict[int, str], List[int], List[int]], int]
+
+
+def write_with_retry(write: WriteAttempt, payload: Sequence[Dict[str, Any]], retry: RetryPolicy = RetryPolicy(),
+                     throttle: Optional[LoadThrottle] = None,
+                     label: str = "documents") -> Tuple[int, List[int], Dict[int, str], int]:
+    """Boucle d'envoi avec reprise ciblée, partagée par insert_batch et patch.apply_updates.
+
+    - write(pending, attempt, last_error, to_retry, failed) envoie les éléments
+      d'indices pending, range ses erreurs dans to_retry ou failed (voir
+      classify_write_error) et retourne le nombre de succès.
+    - payload : documents (ou mises à jour) passés à throttle pour estimer le volume.
+    Retourne (succès, échecs définitifs, dernière erreur par indice, renvois).
+    """
+    pending = list(range(len(payload)))
+    last_error: Dict[int, str] = {}
+    failed: List[int] = []
+    success = 0
+    retried = 0
+    attempt = 0
+
+    while pending:
+        to_retry: List[int] = []
+        if throttle is not None:
+            throttle.before_insert([payload[i] for i in pending])
+        started = time.perf_counter()
+        success += write(pending, attempt, last_error, to_retry, failed)
+        if throttle is not None:
+            throttle.after_insert(time.perf_counter() - started)
+
+        if to_retry and attempt < retry.max_retries:
+            delay = retry.delay(attempt)
+            logging.warning("Retrying %s %s in %.2fs (attempt %s/%s)",
+                            len(to_retry), label, delay, attempt + 1, retry.max_retries)
+            time.sleep(delay)
+            retried += len(to_retry)
+            attempt += 1
+            pending = to_retry
+        else:
+            failed.extend(to_retry)
+            pending = []
+    return success, failed, last_error, retried
+
+
+def classify_write_error(error: PyMongoError, pending: List[int], last_error: Dict[int, str],
+                         to_retry: List[int], failed: List[int],
+                         accepted: Optional[Callable[[Dict], bool]] = None) -> int:
+    """Répartir les éléments en attente après une erreur d'écriture groupée.
+
+    writeErrors transitoires -> to_retry, définitives -> failed ; accepted(err)
+    désigne les erreurs comptées comme succès (retourné). Une erreur globale
+    transitoire renvoie tout le lot, ce qui suppose des écritures idempotentes.
+    """
+    if isinstance(error, BulkWriteError):
+        success = 0
+        for err in (error.details or {}).get("writeErrors", []):
+            source = pending[err["index"]]
+            last_error[source] = f"{err.get('code')}: {err.get('errmsg', '')}"
+            if accepted is not None and accepted(err):
+                success += 1
+            elif err.get("code") in RETRYABLE_ERROR_CODES:
+                to_retry.append(source)
+            else:
+                failed.append(source)
+        return success
+    for source in pending:
+        last_error[source] = f"{type(error).__name__}: {error}"
+    if is_retryable_error(error):
+        to_retry.extend(pending)
+    else:
+        logging.error("MongoDB error during bulk write: %s", error)
+        failed.extend(pending)
+    return 0
+
+
+def classify_insert_error(error: PyMongoError, pending: List[int], attempt: int, idempotent: bool,
+                          last_error: Dict[int, str], to_retry: List[int], failed: List[int]) -> int:
+    """Répartir les documents en attente après une erreur d'insert_many ; retourne les succès.
+
+    Partagé par insert_batch et le moteur asyncio (async_engine.py).
+    """
+    accepted = _is_duplicate_id if attempt > 0 or idempotent else None
+    success = classify_write_error(error, pending, last_error, to_retry, failed, accepted)
+    if isinstance(error, BulkWriteError):
+        success += (error.details or {}).get("nInserted", 0)
+    return success
+
+
+def finish_insert(documents: List[Dict[str, Any]], row_numbers: List[int], dead_letter: Optional[QuarantineWriter],
+                  success: int, failed: List[int], last_error: Dict[int, str], retried: int) -> Dict[str, int]:
+    """Écrire les échecs définitifs en dead-letter et retourner les compteurs du lot."""
+    if failed:
+        failed.sort()
+        logging.error("Bulk write completed with errors: success=%s, errors=%s", success, len(failed))
+        if dead_letter is not None:
+            dead_letter.write_many([documents[i] for i in failed], [row_numbers[i] for i in failed],
+                                   [last_error.get(i, "unknown error") for i in failed])
+    return {"success": success, "errors": len(failed), "retried": retried}
+
+
+def create_staging_collection(target: Collection, options: Optional[Dict[str, Any]] = None) -> Collection:
+    """Créer une collection de staging vide (sans index secondaire) à côté de la cible.
+
+    Les options de la cible (validateur, etc.) sont reprises pour que le swap
+    final ne change pas le comportement de la collection ; options les remplace
+    (restauration : options enregistrées dans le manifest de l'instantané).
+    """
+    db = target.database
+    # Stagings laissés par un run interrompu (crash, kill -9) : jamais repris, supprimés
+    for name in db.list_collection_names(filter={"name": {"$regex": f"^{re.escape(target.name)}__staging_"}}):
+        db.drop_collection(name)
+        logging.warning("Dropped leftover staging collection %s", name)
+    staging_name = f"{target.name}__staging_{time.strftime('%Y%m%d%H%M%S')}"
+    if options is None:
+        options = target.options() if target.name in db.list_collection_names() else {}
+    staging = db.create_collection(staging_name, **options)
+    logging.info("Loading into staging collection %s", staging.full_name)
+    return staging
+
+
+def target_has_documents(target: Collection, partitioned: bool = False) -> bool:
+    """La cible contient-elle des documents ? En mode partitionné, la base reste vide :
+    ce sont ses partitions (toutes périodes) qui sont examinées."""
+    if target.find_one({}, {"_id": 1}) is not None:
+        return True
+    return partitioned and any(target.database[name].find_one({}, {"_id": 1}) is not None
+                               for name in partition_names(target.database, target.name))
+
+
+def prepare_fieldmap(target: Optional[Collection], metadata: Optional[Collection], mode: str,
+                     partitioned: bool = False) -> FieldMap:
+    """Mapping du chargement en noms compacts : celui de la collection, sinon DEFAULT_MAPPING.
+
+    Une collection n'utilise qu'un schéma de clés : en mode append, une cible non
+    vide sans mapping enregistré (documents en noms longs) est refusée (ValueError ;
+    partitioned : une des partitions non vide), sinon le mapping est enregistré aussitôt. En full_reload, il ne l'est qu'après
+    le swap (record_schema) : un rechargement échoué laisse la cible inchangée.
+    """
+    fieldmap = FieldMap(DEFAULT_MAPPING)
+    if target is None:
+        return fieldmap
+    stored = load_fieldmap(metadata, target.name)
+    if stored is None and mode == "append" and target_has_documents(target, partitioned):
+        raise ValueError(f"{target.name} holds long-name documents; compact field names require "
+                         "MIGRATION_MODE=full_reload")
+    fieldmap = stored or fieldmap
+    if mode == "append":
+        save_fieldmap(metadata, target.name, fieldmap)
+    return fieldmap
+
+
+def record_schema(metadata: Collection, collection_name: str, fieldmap: Optional[FieldMap],
+                  pseudonymiser: Optional[Pseudonymiser] = None,
+                  dimensions: Optional[DimensionEncoder] = None) -> None:
+    """Après le swap d'un full_reload : enregistrer le schéma de la nouvelle collection.
+
+    Mapping et colonnes de dimension enregistrés, ou supprimés si elle est en
+    noms longs / libellés ; clé de pseudonymisation enregistrée (remplace celle
+    de l'ancienne collection).
+    """
+    if pseudonymiser is not None:
+        register_key(metadata, collection_name, pseudonymiser, replace=True)
+    if dimensions is not None:
+        register_dimensions(metadata, collection_name, dimensions.fields, replace=True)
+    elif forget_dimensions(metadata, collection_name):
+        logging.info("Dimension record of %s removed (reloaded with labels)", collection_name)
+    if fieldmap is not None:
+        save_fieldmap(metadata, collection_name, fieldmap)
+    elif forget_fieldmap(metadata, collection_name):
+        logging.info("Field map of %s removed (reloaded with long field names)", collection_name)
+
+
+def verify_staging(staging: Collection, totals: Dict[str, int], max_errors: int = 0) -> bool:
+    """Vérifier la collection de staging avant le swap.
+
+    - au plus max_errors échecs définitifs d'insertion (dead-letter) ;
+    - comptage égal aux lignes lues moins les rejets de validation et ces échecs.
+    """
+    if totals["errors"] > max_errors:
+        logging.error("Staging verification failed: %s insert errors (allowed: %s)", totals["errors"], max_errors)
+        return False
+    expected = totals["rows"] - totals["rejected"] - totals["errors"]
+    count = staging.count_documents({})
+    if count == 0 or count != expected:
+        logging.error("Staging verification failed: count=%s, expected=%s", count, expected)
+        return False
+    logging.info("Staging verification passed: count=%s", count)
+    return True
+
+
+def swap_staging(staging: Collection, target: Collection, keep_generations: int) -> None:
+    """Remplacer la cible par la collection de staging via renameCollection.
+
+    - keep_generations=0 : un seul renameCollection(dropTarget=True), atomique
+      pour les lecteurs ; l'ancienne génération est supprimée.
+    - keep_generations>0 : l'ancienne cible est d'abord renommée en
+      <cible>__gen_<horodatage> (courte fenêtre entre les deux renommages),
+      puis seules les keep_generations générations les plus récentes sont gardées.
+    """
+    db = target.database
+    if keep_generations > 0 and target.name in db.list_collection_names():
+        generation = f"{target.name}__gen_{time.strftime('%Y%m%d%H%M%S')}"
+        target.rename(generation)
+        logging.info("Previous generation retained as %s", generation)
+    staging.rename(target.name, dropTarget=True)
+    logging.info("Swapped %s into %s", staging.name, target.full_name)
+
+    pattern = f"^{re.escape(target.name)}__gen_"
+    generations = sorted(db.list_collection_names(filter={"name": {"$regex": pattern}}), reverse=True)
+    for name in generations[keep_generations:]:
+        db.drop_collection(name)
+        logging.info("Dropped old generation %s", name)
+
+
+Transform = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+class BatchProcessor:
+    """Étapes appliquées à chaque lot : transformations, validation, insertion.
+
+    - transforms : fonctions lot -> lot appliquées dans l'ordre
+    - quarantine : active la validation vectorisée ; rejets écrits dans ce fichier
+    - dead_letter, retry, throttle : voir insert_batch
+    - metrics : temps par étape (transform, validate, encode/insert)
+    - collection=None : mode dry-run, les documents sont encodés en BSON
+      exactement comme par le driver mais rien n'est envoyé au serveur
+    - idempotent : _id déterministes, doublons sur _id comptés comme succès
     """
-    try:
-        result = collection.insert_many(documents, ordered=False)
-        return {"success": len(result.inserted_ids), "errors": 0}
-    except BulkWriteError as bwe:
-        details = bwe.details or {}
-        success = details.get("nInserted", 0)
-        errors = len(details.get("writeErrors", []))
-        logging.error("Bulk write completed with errors: success=%s, errors=%s", success, errors)
-        return {"success": success, "errors": errors}
-    except PyMongoError as e:
-        logging.error("MongoDB error during insert_many: %s", e)
-        return {"success": 0, "errors": len(documents)}
+
+    def __init__(self, collection: Optional[Collection],
+                 quarantine: Optional[QuarantineWriter] = None,
+                 dead_letter: Optional[QuarantineWriter] = None,
+                 retry: RetryPolicy = RetryPolicy(),
+                 throttle: Optional[LoadThrottle] = None,
+                 metrics: Optional[StageMetrics] = None,
+                 transforms: Sequence[Transform] = (),
+                 idempotent: bool = False) -> None:
+        self.collection = collection
+        self.quarantine = quarantine
+        self.dead_letter = dead_letter
+        self.retry = retry
+        self.throttle = throttle
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.transforms = list(transforms)
+        self.idempotent = idempotent
+        self.totals = {"rows": 0, "success": 0, "errors": 0, "rejected": 0}
+        self._read_bytes = 0
+
+    def _batch_bytes(self) -> int:
+        """Octets CSV bruts du lot courant, d'après l'étape read (0 si non mesurée)."""
+        read_total = int(self.metrics.stages.get("read", (0, 0, 0))[2])
+        nbytes, self._read_bytes = read_total - self._read_bytes, read_total
+        return nbytes
+
+    def process(self, batch: List[Dict[str, Any]], row_numbers: Optional[List[int]] = None) -> Dict[str, int]:
+        """Traiter un lot ; row_numbers par défaut : numérotation continue des lignes lues."""
+        batch, row_numbers, nbytes = self.prepare(batch, row_numbers)
+        return self.record(len(batch), self.store(batch, row_numbers, nbytes))
+
+    def skip(self, batch: List[Dict[str, Any]]) -> None:
+        """Lot déjà traité lors d'un run précédent (reprise) : seuls ses octets lus sont consommés."""
+        self._batch_bytes()
+
+    def prepare(self, batch: List[Dict[str, Any]],
+                row_numbers: Optional[List[int]] = None) -> Tuple[List[Dict[str, Any]], List[int], int]:
+        """Numérotation, validation et transformations (étapes CPU, dans l'ordre des lots)."""
+        if row_numbers is None:
+            first_row = self.totals["rows"] + 1
+            row_numbers = list(range(first_row, first_row + len(batch)))
+        self.totals["rows"] += len(batch)
+        nbytes = self._batch_bytes()
+
+        if self.quarantine is not None:
+            with self.metrics.measure("validate", len(batch), nbytes):
+                valid, rejected, reasons = validate_batch(batch)
+            self.quarantine.write_many([batch[i] for i in rejected], [row_numbers[i] for i in rejected], reasons)
+            self.totals["rejected"] += len(rejected)
+            if rejected:
+                nbytes = nbytes * len(valid) // max(len(batch), 1)
+                batch = batch.take(valid) if isinstance(batch, CategoricalBatch) else [batch[i] for i in valid]
+                row_numbers = [row_numbers[i] for i in valid]
+
+        if self.transforms:
+            with self.metrics.measure("transform", len(batch), nbytes):
+                for transform in self.transforms:
+                    batch = transform(batch)
+        return batch, row_numbers, nbytes
+
+    def store(self, batch: List[Dict[str, Any]], row_numbers: List[int], nbytes: int,
+              idempotent: Optional[bool] = None) -> Dict[str, int]:
+        """Insertion (ou encodage BSON en dry-run) d'un lot préparé.
+
+        idempotent : remplace self.idempotent pour ce lot (lot peut-être déjà écrit par un run interrompu).
+        """
+        if not batch:
+            counts = {"success": 0, "errors": 0}
+        elif self.collection is None:
+            started = time.perf_counter()
+            encoded = sum(len(bson.encode(doc)) for doc in batch)
+            self.metrics.add("encode", time.perf_counter() - started, len(batch), encoded)
+            counts = {"success": len(batch), "errors": 0}
+        else:
+            started = time.perf_counter()
+            counts = insert_batch(self.collection, batch, row_numbers, self.dead_letter, self.retry,
+                                  self.throttle, self.idempotent if idempotent is None else idempotent)
+            self.metrics.add("insert", time.perf_counter() - started, len(batch), nbytes)
+        return counts
+
+    def record(self, size: int, counts: Dict[str, int]) -> Dict[str, int]:
+        """Cumuler les compteurs d'un lot stocké et journaliser la progression."""
+        self.totals["success"] += counts["success"]
+        self.totals["errors"] += counts["errors"]
+        logging.info(
+            "Processed batch: size=%s, success=%s, errors=%s, totals=(rows=%s, success=%s, errors=%s, rejected=%s)",
+            size, counts["success"], counts["errors"], self.totals["rows"], self.totals["success"],
+            self.totals["errors"], self.totals["rejected"],
+        )
+        return counts
+
+
+def load_csv(processor: BatchProcessor, csv_path: str, batch_size: int,
+             categorical: Union[Sequence[str], str, None] = CATEGORICAL_COLUMNS) -> Dict[str, int]:
+    """Charger le CSV par lots via le processeur et retourner les totaux."""
+    for batch in read_csv_in_batches(csv_path, batch_size, processor.metrics, categorical):
+        processor.process(batch)
+    return processor.totals
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Analyser la ligne de commande (chemins CSV positionnels et optionnels)."""
+    parser = argparse.ArgumentParser(prog="migrate.py", description="Migration CSV → MongoDB")
+    parser.add_argument("csv_paths", nargs="*", metavar="csv_path",
+                        help="fichiers, répertoires ou globs CSV (défaut: CSV_PATH ou data/healthcare_dataset.csv)")
+    parser.add_argument("--manifest", action="append", default=[],
+                        help="fichier listant un CSV par ligne (répétable)")
+    parser.add_argument("--dry-run", action="store_true",
+                        default=get_env("MIGRATION_DRY_RUN", "0") not in ("0", "false", "no"),
+                        help="exécuter tout le pipeline sans serveur (encodage BSON au lieu de l'insertion)")
+    parser.add_argument("--coordinated", action="store_true",
+                        default=get_env("MIGRATION_COORDINATED", "0") not in ("0", "false", "no"),
+                        help="se partager les tranches du CSV avec les autres instances (baux en base)")
+    parser.add_argument("--engine", choices=("sync", "async"), default=get_env("MIGRATION_ENGINE", "sync"),
+                        help="moteur d'insertion : sync (une requête en vol) ou async (MIGRATION_CONCURRENCY)")
+    parser.add_argument("--resume", action="store_true",
+                        help="moteur async : reprendre depuis le point de reprise (MIGRATION_CHECKPOINT_PATH)")
+    return parser.parse_args(argv[1:])
+
+
+def build_throttle(client: Optional[MongoClient]) -> Optional[LoadThrottle]:
+    """Construire le régulateur de charge si l'une de ses variables d'env est définie."""
+    throttle_vars = ("MIGRATION_MAX_DOCS_PER_SEC", "MIGRATION_MAX_MB_PER_SEC", "MIGRATION_MAX_LATENCY_MS",
+                     "MIGRATION_MAX_QUEUE", "MIGRATION_THROTTLE_FILE")
+    if not any(get_env(name, "") for name in throttle_vars):
+        return None
+    throttle = LoadThrottle(
+        docs_per_second=float(get_env("MIGRATION_MAX_DOCS_PER_SEC", "0")),
+        mb_per_second=float(get_env("MIGRATION_MAX_MB_PER_SEC", "0")),
+        max_latency_ms=float(get_env("MIGRATION_MAX_LATENCY_MS", "500")),
+        max_queue=int(get_env("MIGRATION_MAX_QUEUE", "0")),
+        client=client,
+        control_file=get_env("MIGRATION_THROTTLE_FILE", "") or None,
+    )
+    throttle.install_signal_handler()
+    logging.info("Throttle enabled: %s", throttle.settings)
+    return throttle
 
 
 def main(argv: List[str]) -> int:
     """Point d'entrée du script de migration.
 
     Utilisation:
-      python src/migrate.py [chemin_du_csv]
+      python src/migrate.py [chemin_du_csv] [--dry-run]
+      python src/migrate.py data/*.csv [--manifest fichiers.txt]
+      python src/migrate.py [chemin_du_csv] --engine async [--resume]
 
     Comportement:
       - Connexion à MongoDB (local par défaut)
       - Lecture du CSV par lots
       - Insertion des lots dans la collection cible
       - Journalisation de la progression et du résumé final
+
+    Mode de chargement (MIGRATION_MODE):
+      - append (par défaut) : insertion directe dans la collection cible, index
+        déclarés (indexes.py) créés s'ils manquent après le chargement
+      - full_reload : chargement dans une collection de staging sans index,
+        construction des index, vérification du comptage puis swap atomique
+        (renameCollection + dropTarget). MIGRATION_KEEP_GENERATIONS (défaut 0)
+        fixe le nombre d'anciennes générations conservées. Pas de swap si plus de
+        MIGRATION_MAX_LOAD_ERRORS (défaut 0) documents ont échoué définitivement,
+        ni si un fichier de l'ingestion multi-fichiers a échoué.
+
+    Dry-run (--dry-run ou MIGRATION_DRY_RUN=1):
+      - lecture, parsing, transformation, validation et encodage BSON identiques
+        à une exécution réelle, sans connexion au serveur ; le rapport donne
+        lignes/s et octets/s par étape
+
+    Validation (MIGRATION_VALIDATE, activée par défaut):
+      - les lignes qui violent les contraintes du schéma sont écrites dans
+        MIGRATION_QUARANTINE_PATH (défaut: reports/quarantine.jsonl, .csv accepté)
+
+    Reprise sur erreur:
+      - erreurs transitoires renvoyées jusqu'à MIGRATION_MAX_RETRIES fois (défaut 3),
+        backoff exponentiel à partir de MIGRATION_RETRY_BASE_DELAY secondes (défaut 0.5)
+      - échecs définitifs écrits dans MIGRATION_DEAD_LETTER_PATH
+        (défaut: reports/dead_letter.jsonl) avec leur numéro de ligne
+
+    Migration coopérative (--coordinated ou MIGRATION_COORDINATED=1):
+      - plusieurs instances se partagent des tranches du CSV via des baux stockés
+        dans MIGRATION_JOBS_COLLECTION (défaut: migration_jobs) ; tranches de
+        MIGRATION_CHUNK_MB Mo (défaut 64), bail de MIGRATION_LEASE_SECONDS (défaut 60)
+      - _id déterministes : une tranche reprise après la mort d'une instance
+        ne crée pas de doublons ; le résumé global couvre toutes les instances
+
+    Moteur asyncio (--engine async ou MIGRATION_ENGINE=async):
+      - jusqu'à MIGRATION_CONCURRENCY insertions en vol (défaut 16), driver
+        asynchrone si disponible ; _id déterministes par ligne
+      - point de reprise MIGRATION_CHECKPOINT_PATH (défaut: reports/checkpoint.json),
+        écrit aussi sur SIGINT/SIGTERM ; --resume repart de ce point (mode append
+        uniquement ; un full_reload interrompu supprime son staging sans swap)
+
+    Ingestion multi-fichiers (plusieurs chemins, glob, répertoire ou --manifest):
+      - fichiers découpés en unités (tranches de MIGRATION_CHUNK_MB Mo pour les
+        gros fichiers) réparties entre MIGRATION_WORKERS threads (défaut 4) avec
+        vol de travail ; _id déterministes par (fichier, ligne)
+      - résumé par fichier et combiné, écrit en JSON dans MIGRATION_SUMMARY_PATH
+        si défini ; code de sortie 1 si un fichier a échoué
+
+    Noms de champs compacts (MIGRATION_FIELD_MAP=1):
+      - les documents sont écrits avec des clés courtes ; le mapping versionné est
+        enregistré dans FIELDMAP_COLLECTION (défaut: schema_metadata), à lire via
+        fieldmap.TranslatedCollection ; une collection existante change de schéma
+        de clés uniquement par full_reload (append refusé sinon)
+
+    Colonnes catégorielles (MIGRATION_CATEGORICAL):
+      - valeurs partagées par dictionnaire de colonne et codes entiers exposés à
+        la validation ; liste de colonnes, "auto" (détection) ou "none"
+        (défaut: categorical.CATEGORICAL_COLUMNS)
+
+    Champs dérivés (MIGRATION_DERIVED_FIELDS, ex: "length_of_stay,age_band" ou "all"):
+      - calculés par lot et stockés avec chaque document (voir src/derived.py)
+
+    Pseudonymisation (MIGRATION_PSEUDONYMISE, ex: "Name" ou "Name,Doctor"):
+      - valeurs remplacées par un hachage BLAKE2b à clé (MIGRATION_PSEUDONYM_KEY ou
+        MIGRATION_PSEUDONYM_KEY_FILE), cache LRU de MIGRATION_PSEUDONYM_CACHE valeurs
+        (défaut 100000) ; rotation de clé via src/pseudonymise.py
+
+    Partitionnement (MIGRATION_PARTITION=year|month, mode append):
+      - chaque document est écrit dans patient_records_<année>[_<mois>] selon
+        Date of Admission ; lectures et rétention via src/partitions.py
+
+    Dimensions (MIGRATION_DIMENSIONS=1):
+      - Doctor, Hospital et Insurance Provider sont remplacés par des clés entières,
+        libellés stockés dans dim_doctor, dim_hospital, dim_insurance_provider
+      - colonnes encodées enregistrées dans schema_metadata : un append sans
+        MIGRATION_DIMENSIONS sur une collection encodée est refusé
+
+    Limitation de charge (activée si l'une des variables est définie):
+      - MIGRATION_MAX_DOCS_PER_SEC, MIGRATION_MAX_MB_PER_SEC : plafonds de débit
+      - MIGRATION_MAX_LATENCY_MS (défaut 500), MIGRATION_MAX_QUEUE : seuils de ralentissement
+      - MIGRATION_THROTTLE_FILE : fichier JSON de réglage à chaud (relu aussi sur SIGHUP)
     """
     setup_logging()
+    args = parse_args(argv)
 
     # Paramètres d'entrée (chemin CSV et taille de lot)
     # Chemin CSV : local "data/..." ou Docker "/data/..."
     default_csv = "/data/healthcare_dataset.csv" if get_env("MONGO_HOST", "localhost") == "mongo" else "data/healthcare_dataset.csv"
-    csv_path = argv[1] if len(argv) > 1 else get_env("CSV_PATH", default_csv)
+    specs = args.csv_paths or ([] if args.manifest else [get_env("CSV_PATH", default_csv)])
+    multi_file = (len(specs) != 1 or bool(args.manifest) or os.path.isdir(specs[0])
+                  or any(char in specs[0] for char in "*?["))
+    csv_path = ", ".join(specs + args.manifest) if multi_file else specs[0]
     batch_size_str = get_env("MIGRATION_BATCH_SIZE", "1000")
     try:
         batch_size = max(1, int(batch_size_str))
     except ValueError:
         batch_size = 1000
+    mode = get_env("MIGRATION_MODE", "append")
+    try:
+        keep_generations = max(0, int(get_env("MIGRATION_KEEP_GENERATIONS", "0")))
+    except ValueError:
+        keep_generations = 0
+    try:
+        max_load_errors = max(0, int(get_env("MIGRATION_MAX_LOAD_ERRORS", "0")))
+    except ValueError:
+        max_load_errors = 0
 
-    logging.info("Starting CSV → MongoDB migration")
+    validate = get_env("MIGRATION_VALIDATE", "1") not in ("0", "false", "no")
+    quarantine_path = get_env("MIGRATION_QUARANTINE_PATH", "reports/quarantine.jsonl")
+    dead_letter_path = get_env("MIGRATION_DEAD_LETTER_PATH", "reports/dead_letter.jsonl")
+    try:
+        retry = RetryPolicy(max_retries=max(0, int(get_env("MIGRATION_MAX_RETRIES", "3"))),
+                            base_delay=float(get_env("MIGRATION_RETRY_BASE_DELAY", "0.5")))
+    except ValueError:
+        retry = RetryPolicy()
+
+    # Colonnes à dictionnaire partagé : liste déclarée (défaut), "auto" ou "none"
+    categorical_spec = get_env("MIGRATION_CATEGORICAL", "")
+    if categorical_spec in ("", "default"):
+        categorical: Union[Sequence[str], str, None] = CATEGORICAL_COLUMNS
+    elif categorical_spec in ("auto", "none"):
+        categorical = None if categorical_spec == "none" else "auto"
+    else:
+        categorical = [name.strip() for name in categorical_spec.split(",") if name.strip()]
+
+    logging.info("Starting CSV → MongoDB migration%s", " (dry-run)" if args.dry_run else "")
     logging.info("CSV file: %s", csv_path)
     logging.info("Batch size: %s", batch_size)
-
-    # Connexion et test rapide (ping)
+    logging.info("Mode: %s%s", mode, " (coordinated)" if args.coordinated else "")
+    if args.coordinated and mode != "append":
+        logging.error("Coordinated migration only supports MIGRATION_MODE=append")
+        return 1
+    partition = get_env("MIGRATION_PARTITION", "")
+    if partition and (partition not in GRANULARITIES or mode != "append"):
+        logging.error("MIGRATION_PARTITION must be one of %s and requires MIGRATION_MODE=append",
+                      ", ".join(GRANULARITIES))
+        return 1
+    if args.coordinated and multi_file:
+        logging.error("Coordinated migration takes a single CSV file")
+        return 1
+    if args.engine == "async" and (args.coordinated or multi_file):
+        logging.error("The async engine takes a single CSV file and does not support --coordinated")
+        return 1
+    if args.resume and (args.engine != "async" or mode != "append"):
+        # En full_reload, chaque run crée une nouvelle collection de staging : rien à reprendre
+        logging.error("--resume requires --engine async and MIGRATION_MODE=append")
+        return 1
     try:
-        client = get_mongo_client()
-        client.admin.command({"ping": 1})
-    except PyMongoError as e:
-        logging.error("Failed to connect/ping MongoDB: %s", e)
+        workers = max(1, int(get_env("MIGRATION_WORKERS", "4")))
+        concurrency = max(1, int(get_env("MIGRATION_CONCURRENCY", "16")))
+        chunk_bytes = int(float(get_env("MIGRATION_CHUNK_MB", "64")) * 1024 * 1024)
+    except ValueError as e:
+        logging.error("Invalid worker settings: %s", e)
         return 1
 
-    collection = get_target_collection(client)
+    client = None
+    target = None
+    staging = None
+    if not args.dry_run:
+        # Connexion et test rapide (ping)
+        try:
+            client = get_mongo_client()
+            client.admin.command({"ping": 1})
+        except PyMongoError as e:
+            logging.error("Failed to connect/ping MongoDB: %s", e)
+            return 1
+        target = get_target_collection(client)
 
-    total_rows = 0
-    total_success = 0
-    total_errors = 0
+    try:
+        throttle = build_throttle(client) if client is not None else None
+    except ValueError as e:
+        logging.error("Invalid throttle settings: %s", e)
+        if client is not None:
+            client.close()
+        return 1
 
+    metrics = StageMetrics()
+    transforms: List[Transform] = []
+    fieldmap = None
+    pseudonymiser = None
+    dimensions = None
     try:
-        for batch in read_csv_in_batches(csv_path, batch_size):
-            total_rows += len(batch)
-            counts = insert_batch(collection, batch)
-            total_success += counts["success"]
-            total_errors += counts["errors"]
-            logging.info(
-                "Processed batch: size=%s, success=%s, errors=%s, totals=(rows=%s, success=%s, errors=%s)",
-                len(batch), counts["success"], counts["errors"], total_rows, total_success, total_errors,
+        derived_fields = parse_fields(get_env("MIGRATION_DERIVED_FIELDS", ""))
+        if derived_fields:
+            transforms.append(make_transform(derived_fields))
+            logging.info("Derived fields: %s", ", ".join(derived_fields))
+
+        pseudonym_fields = [name.strip() for name in get_env("MIGRATION_PSEUDONYMISE", "").split(",") if name.strip()]
+        if pseudonym_fields:
+            # Avant les dimensions : dim_doctor ne contient alors que des pseudonymes
+            pseudonymiser = Pseudonymiser(
+                read_key(get_env("MIGRATION_PSEUDONYM_KEY", ""), get_env("MIGRATION_PSEUDONYM_KEY_FILE", "")),
+                pseudonym_fields, cache_size=int(get_env("MIGRATION_PSEUDONYM_CACHE", "100000")),
             )
+            if target is not None and mode == "append":
+                # Un full_reload remplace tout le contenu : sa clé est enregistrée après le swap (record_schema)
+                has_documents = target_has_documents(target, bool(partition))
+                register_key(target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")], target.name,
+                             pseudonymiser, has_documents)
+            transforms.append(pseudonymiser.pseudonymise_batch)
+            logging.info("Pseudonymised fields: %s (key %s)", ", ".join(pseudonym_fields), pseudonymiser.fingerprint)
+        elif target is not None and key_record(target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")],
+                                               target.name) is not None:
+            raise ValueError(f"{target.name} is pseudonymised; set MIGRATION_PSEUDONYMISE and its key "
+                             "(plain-text values would be mixed with pseudonyms)")
+
+        metadata = target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")] if target is not None else None
+        if get_env("MIGRATION_DIMENSIONS", "0") not in ("0", "false", "no"):
+            # Avant l'encodage compact : les colonnes de dimension portent encore leurs noms longs
+            dimensions = DimensionEncoder(target.database if target is not None else None,
+                                          metadata_name=get_env("FIELDMAP_COLLECTION", "schema_metadata"))
+            if target is not None and mode == "append":
+                # Un full_reload enregistre ses colonnes après le swap (record_schema)
+                register_dimensions(metadata, target.name, dimensions.fields,
+                                    target_has_documents(target, bool(partition)))
+            transforms.append(dimensions.encode_batch)
+        elif mode == "append" and target is not None and dimensions_record(metadata, target.name) is not None:
+            raise ValueError(f"{target.name} stores dimension keys; set MIGRATION_DIMENSIONS=1 "
+                             "(labels would be mixed with keys)")
+
+        if get_env("MIGRATION_FIELD_MAP", "0") not in ("0", "false", "no"):
+            fieldmap = prepare_fieldmap(target, metadata, mode, bool(partition))
+            transforms.append(fieldmap.encode_batch)
+            logging.info("Compact field names enabled (mapping v%s)", fieldmap.version)
+        elif mode == "append" and target is not None and load_fieldmap(metadata, target.name) is not None:
+            raise ValueError(f"{target.name} uses compact field names; set MIGRATION_FIELD_MAP=1 "
+                             "(long names would be mixed with short keys)")
+
+        if mode == "full_reload" and target is not None:
+            staging = create_staging_collection(target)
+        collection = staging if staging is not None else target
+        if partition and target is not None:
+            collection = PartitionedCollection(target.database, target.name, partition, fieldmap)
+            logging.info("Partitioned by %s of %s: %s", partition, collection.field, target.name + "_*")
+
+        with QuarantineWriter(quarantine_path, append=args.resume) as quarantine, \
+                QuarantineWriter(dead_letter_path, append=args.resume) as dead_letter:
+            processor = BatchProcessor(collection, quarantine if validate else None, dead_letter, retry, throttle,
+                                       metrics, transforms, idempotent=args.coordinated)
+            job = None
+            files = None
+            run = None
+            if multi_file:
+                files = run_multi_file(
+                    expand_inputs(specs, args.manifest),
+                    lambda worker_metrics: BatchProcessor(collection, quarantine if validate else None, dead_letter,
+                                                          retry, throttle, worker_metrics, transforms,
+                                                          idempotent=True),
+                    batch_size, workers=workers, chunk_bytes=chunk_bytes,
+                )
+                metrics.merge(files["metrics"])
+                totals = files["totals"]
+            elif args.coordinated and target is not None:
+                job = run_coordinated(
+                    processor, target.database[get_env("MIGRATION_JOBS_COLLECTION", "migration_jobs")],
+                    csv_path, batch_size,
+                    chunk_bytes=chunk_bytes,
+                    lease_seconds=float(get_env("MIGRATION_LEASE_SECONDS", "60")),
+                )
+                totals = processor.totals
+            elif args.engine == "async":
+                # Import local : async_engine importe ce module
+                from async_engine import Checkpoint, run_async
+
+                # Point de reprise en mode append uniquement (le staging d'un full_reload n'est pas repris)
+                checkpoint = None
+                if mode == "append":
+                    checkpoint = Checkpoint(get_env("MIGRATION_CHECKPOINT_PATH", "reports/checkpoint.json"),
+                                            csv_path, batch_size)
+                    if args.resume:
+                        checkpoint.load()
+                run = run_async(processor, csv_path, batch_size, categorical, concurrency, checkpoint)
+                totals = processor.totals
+                if run["interrupted"] and checkpoint is not None:
+                    logging.warning("Migration interrupted after %s complete batches; resume with --resume "
+                                    "(checkpoint: %s)", checkpoint.batches, checkpoint.path)
+            else:
+                load_csv(processor, csv_path, batch_size, categorical)
+                totals = processor.totals
+        if totals["rejected"]:
+            logging.warning("Rejected %s invalid rows, see %s", totals["rejected"], quarantine_path)
+        if totals["errors"]:
+            logging.warning("%s documents failed permanently, see %s", totals["errors"], dead_letter_path)
+        if pseudonymiser is not None:
+            cache = pseudonymiser.cache_info()
+            logging.info("Pseudonym cache: hits=%s, misses=%s, size=%s/%s",
+                         cache.hits, cache.misses, cache.currsize, cache.maxsize)
+        if throttle is not None:
+            logging.info("Throttle waited %.1fs in total (final rate factor %.2f)", throttle.total_wait, throttle.factor)
+        if isinstance(collection, PartitionedCollection):
+            logging.info("Partitions: %s", ", ".join(collection.partition_names()))
+            collection.close()
+
+        if staging is not None and run is not None and run["interrupted"]:
+            # Chargement incomplet : la cible reste inchangée
+            logging.error("Full reload interrupted: dropping %s, %s left unchanged", staging.name, target.full_name)
+            staging.drop()
+            client.close()
+            return 1
+        if staging is not None and files is not None and files["failed_files"]:
+            # Fichiers absents ou illisibles : leurs lignes manquent au staging sans apparaître dans totals
+            log_summary(files)
+            logging.error("Full reload with %s failed files: dropping %s, %s left unchanged",
+                          len(files["failed_files"]), staging.name, target.full_name)
+            staging.drop()
+            client.close()
+            return 1
+        if staging is not None:
+            # Index construits après le chargement massif, puis vérification et swap
+            ensure_indexes(staging, fieldmap)
+            if target.name in target.database.list_collection_names():
+                copy_index_definitions(target, staging, fieldmap)
+            if not verify_staging(staging, totals, max_load_errors):
+                staging.drop()
+                client.close()
+                return 1
+            swap_staging(staging, target, keep_generations)
+            record_schema(metadata, target.name, fieldmap, pseudonymiser, dimensions)
+        elif target is not None and not partition:
+            # Append : index déclarés garantis aussi (idempotent, après le chargement)
+            ensure_indexes(target, fieldmap)
     except FileNotFoundError:
         logging.error("CSV file not found: %s", csv_path)
-        client.close()
+        if staging is not None:
+            staging.drop()
+        if client is not None:
+            client.close()
         return 1
     except Exception as e:  # Minimal: surface toute erreur inattendue
         logging.error("Unexpected error during migration: %s", e)
-        client.close()
+        if staging is not None:
+            staging.drop()
+        if client is not None:
+            client.close()
         return 1
 
-    client.close()
+    if client is not None:
+        client.close()
 
-    logging.info("Migration summary: rows_read=%s, inserted=%s, errors=%s", total_rows, total_success, total_errors)
+    if files is not None:
+        log_summary(files)
+        summary_path = get_env("MIGRATION_SUMMARY_PATH", "")
+        if summary_path:
+            write_summary(files, summary_path)
+    metrics.log_report()
+    logging.info(
+        "Migration summary: rows_read=%s, %s=%s, errors=%s, rejected=%s",
+        totals["rows"], "encoded" if args.dry_run else "inserted", totals["success"],
+        totals["errors"], totals["rejected"],
+    )
+    if job is not None:
+        logging.info(
+            "Global summary (%s workers, %s/%s chunks): rows_read=%s, inserted=%s, errors=%s, rejected=%s",
+            job["workers"], job["done"], job["chunks"], job["rows"], job["success"], job["errors"], job["rejected"],
+        )
+        return 0 if job["success"] > 0 else 1
+
+    if files is not None and files["failed_files"]:
+        return 1
+    if run is not None and run["interrupted"]:
+        return 1
 
     # Politique de code de sortie: succès si au moins un document inséré
-    return 0 if total_success > 0 else 1
+    return 0 if totals["success"] > 0 else 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+"""
+Pagination par clé (keyset) sur patient_records.
+
+Au lieu de skip/limit (coût O(offset) côté serveur), chaque page reprend après
+la dernière clé de tri vue : filtre {clé > dernière valeur} aligné sur un index,
+donc la page 10 000 coûte autant que la page 1.
+
+- Le tri se termine toujours par _id pour garantir un ordre total.
+- Les clés de tri sont toujours projetées (nécessaires au jeton), même si la
+  projection demandée les exclut ({"_id": 0}).
+- Le jeton de reprise est opaque (BSON encodé en base64 url-safe).
+
+Utilisation:
+    page, token = fetch_page(collection, sort=[("Date of Admission", 1)], page_size=50)
+    page, token = fetch_page(collection, sort=[("Date of Admission", 1)], page_size=50, resume_token=token)
+
+    for doc in stream(collection, {"Medical Condition": "Asthma"}):
+        ...
+"""
+
+import base64
+from typing import Any, Dict, Generator, List, Optional, Sequence, Tuple
+
+import bson
+from pymongo.collection import Collection
+
+SortSpec = Sequence[Tuple[str, int]]
+
+
+def _normalise_sort(sort: Optional[SortSpec]) -> List[Tuple[str, int]]:
+    """Ajouter _id en dernière clé si absent (départage des égalités)."""
+    keys = list(sort or [])
+    if "_id" not in [field for field, _ in keys]:
+        keys.append(("_id", 1))
+    return keys
+
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def encode_token(values: List[Any]) -> str:
+    """Encoder les dernières valeurs de tri en jeton opaque."""
+    return base64.urlsafe_b64encode(bson.encode({"k": values})).decode("ascii")
+
+
+def decode_token(token: str) -> List[Any]:
+    """Décoder un jeton produit par encode_token."""
+    try:
+        return bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))["k"]
+    except (ValueError, KeyError, bson.errors.BSONError) as e:
+        raise ValueError(f"Invalid resume token: {e}") from e
+
+
+def _after(field: str, direction: int, value: Any) -> Optional[Dict[str, Any]]:
+    """Condition « field strictement après value » selon l'ordre de tri MongoDB.
+
+    null (ou champ absent) trie avant toute autre valeur : {$gt: null} ne
+    correspondrait à rien (comparaisons limitées au même type BSON), et les
+    null arrivent en dernier dans un tri décroissant. None : aucune valeur après.
+    """
+    if value is None:
+        return {field: {"$ne": None}} if direction >= 0 else None
+    if direction >= 0:
+        return {field: {"$gt": value}}
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filter(sort: SortSpec, last_values: Sequence[Any]) -> Dict[str, Any]:
+    """Filtre « strictement après last_values » pour un tri composé.
+
+    Pour un tri (a, b, _id) : a > va OU (a = va ET b > vb) OU (a = va ET b = vb ET _id > vid),
+    l'opérateur étant $lt pour les clés triées en ordre décroissant ; les valeurs
+    nulles sont traitées explicitement (voir _after).
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        after = _after(field, direction, last_values[i])
+        if after is None:
+            continue
+        clause = {prev_field: last_values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause.update(after)
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def fetch_page(collection: Collection, filter: Optional[Dict[str, Any]] = None,
+               sort: Optional[SortSpec] = None, page_size: int = 100,
+               resume_token: Optional[str] = None,
+               projection: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Lire une page et retourner (documents, jeton de la page suivante ou None)."""
+    keys = _normalise_sort(sort)
+    query = dict(filter or {})
+    if resume_token is not None:
+        after = keyset_filter(keys, decode_token(resume_token))
+        query = {"$and": [query, after]} if query else after
+    if projection is not None:
+        # Clés de tri nécessaires au jeton suivant : incluses, ou retirées des exclusions
+        projection = dict(projection)
+        inclusive = any(v for v in projection.values())
+        for field, _ in keys:
+            if inclusive:
+                projection[field] = 1
+            else:
+                projection.pop(field, None)
+
+    docs = list(collection.find(query, projection, sort=keys, limit=page_size))
+    if len(docs) < page_size:
+        return docs, None
+    return docs, encode_token([_get_path(docs[-1], field) for field, _ in keys])
+
+
+def stream(collection: Collection, filter: Optional[Dict[str, Any]] = None,
+           sort: Optional[SortSpec] = None, page_size: int = 1000,
+           projection: Optional[Dict[str, Any]] = None) -> Generator[Dict[str, Any], None, None]:
+    """Parcourir tout le résultat page par page, en mémoire constante."""
+    token = None
+    while True:
+        docs, token = fetch_page(collection, filter, sort, page_size, token, projection)
+        yield from docs
+        if token is None:
+            return
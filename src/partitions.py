@@ -0,0 +1,251 @@
+"""
+Partitionnement temporel de patient_records par année ou par mois d'admission.
+
+En mode partitionné (MIGRATION_PARTITION=year|month), la migration écrit chaque
+document dans la collection de sa période, d'après Date of Admission :
+patient_records_2023 (année) ou patient_records_2023_04 (mois) ; les documents
+sans date valide vont dans patient_records_undated. Chaque partition reçoit
+les index déclarés (indexes.py) à sa création.
+
+PartitionedCollection sert à la fois de cible d'insertion (même interface
+insert_many que pymongo, utilisée par insert_batch) et de couche de requêtes :
+les prédicats sur la date d'admission (égalité, $in, $gt/$gte/$lt/$lte, y
+compris sous $and) éliminent les partitions hors période, et les partitions
+restantes sont interrogées en parallèle puis fusionnées (tri et limite
+appliqués sur le résultat combiné).
+
+La rétention se fait en supprimant des partitions entières (drop) au lieu de
+delete_many coûteux sur une collection unique.
+
+Utilisation:
+    python src/partitions.py --list
+    python src/partitions.py --drop-before 2021-01-01 [--dry-run]
+"""
+
+import argparse
+import logging
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.results import InsertManyResult
+
+from fieldmap import FieldMap, load_fieldmap
+from indexes import ensure_indexes
+
+PARTITION_FIELD = "Date of Admission"
+GRANULARITIES = {"year": 4, "month": 7}
+UNDATED = "undated"
+_DATE_PREFIX = re.compile(r"^\d{4}-\d{2}")
+
+
+def partition_names(db: Database, base: str) -> List[str]:
+    """Partitions existantes de base, toutes granularités confondues (undated en dernier)."""
+    pattern = re.compile(rf"^{re.escape(base)}_(\d{{4}}|\d{{4}}_\d{{2}}|{UNDATED})$")
+    names = [name for name in db.list_collection_names() if pattern.match(name)]
+    return sorted(names, key=lambda name: (name.endswith(UNDATED), name))
+
+
+class PartitionedCollection:
+    """Collections <base>_<période> vues comme une seule collection (insertion routée, lectures élaguées).
+
+    field : nom stocké de la date d'admission (clé courte si fieldmap).
+    """
+
+    def __init__(self, db: Database, base: str, granularity: str = "year",
+                 fieldmap: Optional[FieldMap] = None, max_workers: int = 8) -> None:
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown partition granularity {granularity!r} (expected {', '.join(GRANULARITIES)})")
+        self.database = db
+        self.name = base
+        self.granularity = granularity
+        self.fieldmap = fieldmap
+        self.field = fieldmap.short(PARTITION_FIELD) if fieldmap is not None else PARTITION_FIELD
+        self._width = GRANULARITIES[granularity]
+        period = r"\d{4}_\d{2}" if granularity == "month" else r"\d{4}"
+        self._pattern = re.compile(rf"^{re.escape(base)}_({period}|{UNDATED})$")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="partition")
+        self._known: Set[str] = set(self.partition_names())
+        self._lock = threading.Lock()
+
+    # Routage
+
+    def partition_key(self, value: Any) -> str:
+        """Période d'une date AAAA-MM-JJ ("2023" ou "2023_04"), UNDATED si absente ou invalide."""
+        if isinstance(value, str) and _DATE_PREFIX.match(value):
+            return value[:self._width].replace("-", "_")
+        return UNDATED
+
+    def partition(self, key: str) -> Collection:
+        """Collection d'une période (index créés à la première utilisation)."""
+        name = f"{self.name}_{key}"
+        collection = self.database[name]
+        if name not in self._known:
+            with self._lock:
+                if name not in self._known:
+                    ensure_indexes(collection, self.fieldmap)
+                    self._known.add(name)
+        return collection
+
+    def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = False) -> InsertManyResult:
+        """Insérer chaque document dans sa partition (un insert_many par partition, en parallèle).
+
+        Les erreurs par document sont regroupées dans une BulkWriteError dont les
+        index renvoient à documents, comme pour une collection unique.
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, doc in enumerate(documents):
+            groups.setdefault(self.partition_key(doc.get(self.field)), []).append(i)
+
+        def insert(item: Tuple[str, List[int]]) -> Tuple[List[int], Optional[Dict[str, Any]]]:
+            key, indices = item
+            try:
+                self.partition(key).insert_many([documents[i] for i in indices], ordered=ordered)
+                return indices, None
+            except BulkWriteError as bwe:
+                return indices, bwe.details or {}
+
+        inserted, write_errors = 0, []
+        for indices, details in self._executor.map(insert, groups.items()):
+            if details is None:
+                inserted += len(indices)
+                continue
+            inserted += details.get("nInserted", 0)
+            write_errors += [{**err, "index": indices[err["index"]]} for err in details.get("writeErrors", [])]
+        if write_errors:
+            raise BulkWriteError({"writeErrors": sorted(write_errors, key=lambda err: err["index"]),
+                                  "nInserted": inserted})
+        return InsertManyResult([doc["_id"] for doc in documents], True)
+
+    # Lecture
+
+    def partition_names(self) -> List[str]:
+        """Partitions existantes, par période croissante (undated en dernier)."""
+        return [name for name in partition_names(self.database, self.name) if self._pattern.match(name)]
+
+    def _date_key(self, value: Any) -> Optional[str]:
+        key = self.partition_key(value)
+        return key if key != UNDATED else None
+
+    def _bounds(self, condition: Any) -> Optional[Tuple[Optional[str], Optional[str], Optional[Set[str]]]]:
+        """(période min, période max, périodes exactes) d'une condition sur la date ; None = pas d'élagage."""
+        if not isinstance(condition, dict):
+            key = self._date_key(condition)
+            return (key, key, None) if key is not None else None
+        low = high = None
+        keys = None
+        for op, value in condition.items():
+            if op == "$eq":
+                low = high = self._date_key(value)
+            elif op in ("$gt", "$gte"):
+                low = self._date_key(value)
+            elif op in ("$lt", "$lte"):
+                high = self._date_key(value)
+            elif op == "$in":
+                in_keys = [self._date_key(v) for v in value]
+                keys = set(in_keys) if None not in in_keys else None
+        if low is None and high is None and keys is None:
+            return None
+        return low, high, keys
+
+    def partitions_for(self, query: Optional[Dict[str, Any]]) -> List[str]:
+        """Partitions pouvant contenir des documents de query (élagage par la date d'admission)."""
+        names = self.partition_names()
+        conditions = [clause[self.field] for clause in [query or {}] + (query or {}).get("$and", [])
+                      if self.field in clause]
+        prefix = len(self.name) + 1
+        for condition in conditions:
+            bounds = self._bounds(condition)
+            if bounds is None:
+                continue
+            low, high, keys = bounds
+            names = [name for name in names
+                     if name[prefix:] != UNDATED
+                     and (low is None or name[prefix:] >= low)
+                     and (high is None or name[prefix:] <= high)
+                     and (keys is None or name[prefix:] in keys)]
+        return names
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None,
+             sort: Optional[Sequence[Tuple[str, int]]] = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """Interroger les partitions concernées en parallèle ; retourne la liste fusionnée (triée, limitée)."""
+        filter = filter or {}
+
+        def query(name: str) -> List[Dict[str, Any]]:
+            return list(self.database[name].find(filter, projection, sort=sort, limit=limit))
+
+        documents = [doc for part in self._executor.map(query, self.partitions_for(filter)) for doc in part]
+        # Tri stable clé par clé, de la moins à la plus significative
+        for field, direction in reversed(list(sort or [])):
+            documents.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field)), reverse=direction < 0)
+        return documents[:limit] if limit else documents
+
+    def count_documents(self, filter: Dict[str, Any]) -> int:
+        return sum(self._executor.map(lambda name: self.database[name].count_documents(filter),
+                                      self.partitions_for(filter)))
+
+    # Rétention
+
+    def drop_before(self, cutoff: str, dry_run: bool = False) -> List[str]:
+        """Supprimer les partitions entièrement antérieures à cutoff (AAAA-MM-JJ) ; retourne leurs noms."""
+        cutoff_key = self.partition_key(cutoff)
+        if cutoff_key == UNDATED:
+            raise ValueError(f"Invalid cutoff date: {cutoff!r}")
+        prefix = len(self.name) + 1
+        # Une partition commençant avant la coupure mais la contenant est conservée
+        dropped = [name for name in self.partition_names() if name[prefix:] != UNDATED and name[prefix:] < cutoff_key]
+        for name in dropped:
+            if not dry_run:
+                self.database.drop_collection(name)
+                self._known.discard(name)
+            logging.info("%s partition %s", "Would drop" if dry_run else "Dropped", name)
+        return dropped
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : liste et rétention des partitions de la collection cible."""
+    # Import local : migrate.py importe ce module pour MIGRATION_PARTITION
+    from migrate import get_env, get_mongo_client, get_target_collection, setup_logging
+
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="partitions.py", description="Partitions temporelles de patient_records")
+    parser.add_argument("--granularity", default=get_env("MIGRATION_PARTITION", "year"), choices=list(GRANULARITIES))
+    parser.add_argument("--list", action="store_true", help="lister les partitions et leur nombre de documents")
+    parser.add_argument("--drop-before", help="supprimer les partitions antérieures à cette date (AAAA-MM-JJ)")
+    parser.add_argument("--dry-run", action="store_true", help="afficher les partitions à supprimer sans rien supprimer")
+    args = parser.parse_args(argv[1:])
+
+    client = get_mongo_client()
+    try:
+        target = get_target_collection(client)
+        fieldmap = load_fieldmap(target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")], target.name)
+        partitions = PartitionedCollection(target.database, target.name, args.granularity, fieldmap)
+        if args.list:
+            for name in partitions.partition_names():
+                logging.info("Partition %s: %s documents", name, target.database[name].estimated_document_count())
+        if args.drop_before:
+            dropped = partitions.drop_before(args.drop_before, args.dry_run)
+            logging.info("Retention summary: %s partitions %s before %s", len(dropped),
+                         "to drop" if args.dry_run else "dropped", args.drop_before)
+        partitions.close()
+    except ValueError as e:
+        logging.error("Invalid partition settings: %s", e)
+        return 1
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,381 @@
+"""
+Application de fichiers de corrections (patchs) sur patient_records.
+
+Un fichier de corrections est un CSV : une colonne clé (_id par défaut) et les
+colonnes modifiées, en noms longs. Pour chaque ligne :
+- cellule vide : champ inchangé ;
+- cellule égale au marqueur (__UNSET__ par défaut) : champ supprimé ($unset) ;
+- autre valeur : champ remplacé ($set).
+
+Le fichier est lu en flux par lots (même lecteur que la migration) ; dans un
+lot, les corrections d'une même clé sont fusionnées dans l'ordre du fichier,
+puis envoyées en un bulk_write non ordonné d'UpdateOne. Reprises ciblées des
+erreurs transitoires (migrate.write_with_retry), dead-letter et rapport par
+étape comme pour migrate.py.
+
+Les corrections sont écrites dans le schéma de la collection : clés converties
+(ObjectId, entier), noms compacts si un mapping est enregistré (fieldmap.py),
+libellés remplacés par leurs clés de dimension (colonnes enregistrées dans
+schema_metadata, dimensions.py) et
+champs dérivés recalculés quand Age ou une date change (MIGRATION_DERIVED_FIELDS).
+Sur une collection pseudonymisée (clé enregistrée, pseudonymise.py), les valeurs
+et la clé des colonnes pseudonymisées sont hachées avec la même clé
+(MIGRATION_PSEUDONYM_KEY ou MIGRATION_PSEUDONYM_KEY_FILE) ; sans elle, le
+patch est refusé.
+
+Utilisation:
+    python src/patch.py corrections.csv
+    python src/patch.py corrections.csv --key "Room Number" --key-type str
+    python src/patch.py corrections.csv --missing-report reports/patch_missing.jsonl
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from derived import SOURCE_FIELDS, derived_values, parse_fields
+from dimensions import DimensionEncoder, dimensions_record
+from fieldmap import FieldMap, TranslatedCollection, load_fieldmap
+from metrics import StageMetrics
+from migrate import (
+    RetryPolicy,
+    build_throttle,
+    classify_write_error,
+    get_env,
+    get_mongo_client,
+    get_target_collection,
+    read_csv_in_batches,
+    setup_logging,
+    write_with_retry,
+)
+from pseudonymise import Pseudonymiser, key_record, read_key
+from quarantine import QuarantineWriter
+from throttle import LoadThrottle
+
+UNSET_MARKER = "__UNSET__"
+KEY_TYPES = ("auto", "objectid", "int", "str")
+
+
+def cast_key(value: str, key_field: str, key_type: str = "auto") -> Any:
+    """Convertir une clé lue dans le CSV vers son type stocké.
+
+    auto : _id en ObjectId (24 caractères hexadécimaux) ou en entier, texte sinon ;
+    les autres colonnes migrées sont stockées en texte. ValueError si la
+    conversion demandée est impossible.
+    """
+    if key_type == "auto":
+        if key_field != "_id":
+            return value
+        if ObjectId.is_valid(value):
+            return ObjectId(value)
+        key_type = "int" if value.lstrip("-").isdigit() else "str"
+    if key_type == "objectid":
+        try:
+            return ObjectId(value)
+        except InvalidId as e:
+            raise ValueError(str(e)) from None
+    if key_type == "int":
+        return int(value)
+    return value
+
+
+def group_changes(batch: List[Dict[str, Any]], row_numbers: List[int], key_field: str,
+                  unset_marker: str = UNSET_MARKER,
+                  key_type: str = "auto") -> Tuple[Dict[Any, Dict[str, Any]], List[int]]:
+    """Fusionner les corrections du lot par clé (convertie, voir cast_key), dans l'ordre du fichier.
+
+    Retourne ({clé: {"set": {...}, "unset": {...}, "rows": [...]}}, lignes sans clé valide).
+    """
+    grouped: Dict[Any, Dict[str, Any]] = {}
+    without_key: List[int] = []
+    for row, row_number in zip(batch, row_numbers):
+        try:
+            key = cast_key((row.get(key_field) or "").strip(), key_field, key_type)
+        except ValueError:
+            key = ""
+        if key == "":
+            without_key.append(row_number)
+            continue
+        change = grouped.setdefault(key, {"set": {}, "unset": {}, "rows": []})
+        change["rows"].append(row_number)
+        for field, value in row.items():
+            if field == key_field or field is None or value is None or value == "":
+                continue
+            if value == unset_marker:
+                change["set"].pop(field, None)
+                change["unset"][field] = ""
+            else:
+                change["unset"].pop(field, None)
+                change["set"][field] = value
+    return grouped, without_key
+
+
+def build_requests(grouped: Dict[Any, Dict[str, Any]], key_field: str,
+                   fieldmap: Optional[FieldMap] = None) -> Tuple[List[UpdateOne], List[Any], List[Dict[str, Any]]]:
+    """UpdateOne par clé (clés sans changement ignorées), avec clés et mises à jour correspondantes.
+
+    fieldmap : noms de champs traduits vers les clés courtes de la collection.
+    """
+    requests, keys, updates = [], [], []
+    stored_key = fieldmap.short(key_field) if fieldmap is not None else key_field
+    for key, change in grouped.items():
+        update: Dict[str, Any] = {}
+        if change["set"]:
+            update["$set"] = change["set"]
+        if change["unset"]:
+            update["$unset"] = change["unset"]
+        if update:
+            if fieldmap is not None:
+                update = fieldmap.translate_update(update)
+            requests.append(UpdateOne({stored_key: key}, update))
+            keys.append(key)
+            updates.append(update)
+    return requests, keys, updates
+
+
+def apply_updates(collection: Collection, requests: List[UpdateOne], retry: RetryPolicy = RetryPolicy(),
+                  throttle: Optional[LoadThrottle] = None,
+                  updates: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """bulk_write non ordonné avec reprise ciblée des erreurs transitoires (migrate.write_with_retry).
+
+    updates (documents de mise à jour) sert à estimer la taille des lots pour throttle.
+    Retourne matched, modified, failed (indices dans requests) et last_error par indice.
+    """
+    totals: Dict[str, Any] = {"matched": 0, "modified": 0}
+
+    def send(pending: List[int], attempt: int, last_error: Dict[int, str],
+             to_retry: List[int], failed: List[int]) -> int:
+        try:
+            result = collection.bulk_write([requests[i] for i in pending], ordered=False)
+            totals["matched"] += result.matched_count
+            totals["modified"] += result.modified_count
+        except PyMongoError as e:
+            if isinstance(e, BulkWriteError):
+                totals["matched"] += (e.details or {}).get("nMatched", 0)
+                totals["modified"] += (e.details or {}).get("nModified", 0)
+            # $set / $unset sont idempotents : renvoyer tout le lot est sans risque
+            classify_write_error(e, pending, last_error, to_retry, failed)
+        return 0
+
+    _, failed, last_error, _ = write_with_retry(send, updates if updates is not None else [{}] * len(requests),
+                                                retry, throttle, label="updates")
+    return {**totals, "failed": failed, "last_error": last_error}
+
+
+class PatchApplier:
+    """Étapes appliquées à chaque lot de corrections : regroupement, bulk_write, rapports.
+
+    - fieldmap : mapping de la collection (noms compacts), None si noms longs
+    - dimensions : encodeur des colonnes de dimension si la collection en utilise
+    - derived : champs dérivés recalculés quand une de leurs sources est corrigée
+    - pseudonymiser : clé de la collection si elle est pseudonymisée (valeurs et clé hachées)
+    """
+
+    def __init__(self, collection: Collection, key_field: str = "_id",
+                 unset_marker: str = UNSET_MARKER, retry: RetryPolicy = RetryPolicy(),
+                 throttle: Optional[LoadThrottle] = None, metrics: Optional[StageMetrics] = None,
+                 dead_letter: Optional[QuarantineWriter] = None,
+                 missing: Optional[QuarantineWriter] = None, key_type: str = "auto",
+                 fieldmap: Optional[FieldMap] = None, dimensions: Optional[DimensionEncoder] = None,
+                 derived: Sequence[str] = (), pseudonymiser: Optional[Pseudonymiser] = None) -> None:
+        if key_type not in KEY_TYPES:
+            raise ValueError(f"Unsupported key type: {key_type} (expected one of {', '.join(KEY_TYPES)})")
+        self.collection = collection
+        self.key_field = key_field
+        self.unset_marker = unset_marker
+        self.retry = retry
+        self.throttle = throttle
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.dead_letter = dead_letter
+        self.missing = missing
+        self.key_type = key_type
+        self.fieldmap = fieldmap
+        self.dimensions = dimensions
+        self.derived = list(derived)
+        self.pseudonymiser = pseudonymiser
+        # Lectures (clés absentes, sources des champs dérivés) en noms longs
+        self.reader = TranslatedCollection(collection, fieldmap) if fieldmap is not None else collection
+        self.totals = {"rows": 0, "keys": 0, "matched": 0, "modified": 0, "not_found": 0,
+                       "errors": 0, "skipped": 0}
+
+    def _report_missing(self, keys: List[Any], grouped: Dict[Any, Dict[str, Any]]) -> None:
+        """Écrire les clés absentes de la collection (une requête $in par lot)."""
+        found = {doc[self.key_field] for doc in self.reader.find(
+            {self.key_field: {"$in": keys}}, {self.key_field: 1})}
+        absent = [key for key in keys if key not in found]
+        self.missing.write_many([{self.key_field: key} for key in absent],
+                                [grouped[key]["rows"][0] for key in absent],
+                                ["key not found"] * len(absent))
+
+    def _recompute_derived(self, grouped: Dict[Any, Dict[str, Any]]) -> None:
+        """Ajouter aux corrections les champs dérivés recalculés (sources lues en une requête $in).
+
+        Un champ qui n'est plus calculable (date supprimée ou invalide) est retiré ($unset).
+        """
+        touched = [key for key, change in grouped.items()
+                   if any(name in change["set"] or name in change["unset"] for name in SOURCE_FIELDS)]
+        if not touched:
+            return
+        projection = {name: 1 for name in (self.key_field,) + SOURCE_FIELDS}
+        current = {doc[self.key_field]: doc
+                   for doc in self.reader.find({self.key_field: {"$in": touched}}, projection)}
+        rows, changes = [], []
+        for key in touched:
+            if key not in current:
+                continue
+            change = grouped[key]
+            row = {name: current[key].get(name) for name in SOURCE_FIELDS}
+            row.update({name: value for name, value in change["set"].items() if name in SOURCE_FIELDS})
+            row.update({name: None for name in change["unset"] if name in SOURCE_FIELDS})
+            rows.append(row)
+            changes.append(change)
+        if not rows:
+            return
+        for change, values in zip(changes, derived_values(rows, self.derived)):
+            for name in self.derived:
+                if name in values:
+                    change["unset"].pop(name, None)
+                    change["set"][name] = values[name]
+                else:
+                    change["set"].pop(name, None)
+                    change["unset"][name] = ""
+
+    def process(self, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+        first_row = self.totals["rows"] + 1
+        row_numbers = list(range(first_row, first_row + len(batch)))
+        self.totals["rows"] += len(batch)
+
+        with self.metrics.measure("transform", len(batch)):
+            if self.pseudonymiser is not None and self.key_field in self.pseudonymiser.fields:
+                # Clé stockée sous forme de pseudonyme : hachée avant le regroupement
+                for row in batch:
+                    value = (row.get(self.key_field) or "").strip()
+                    if value and value != self.unset_marker:
+                        row[self.key_field] = self.pseudonymiser.pseudonym(value)
+            grouped, without_key = group_changes(batch, row_numbers, self.key_field, self.unset_marker,
+                                                 self.key_type)
+            if self.derived:
+                self._recompute_derived(grouped)
+            if self.pseudonymiser is not None:
+                # Avant les dimensions, comme à l'ingestion
+                self.pseudonymiser.pseudonymise_batch([change["set"] for change in grouped.values()])
+            if self.dimensions is not None:
+                self.dimensions.encode_batch([change["set"] for change in grouped.values()])
+            requests, keys, updates = build_requests(grouped, self.key_field, self.fieldmap)
+        self.totals["skipped"] += len(without_key)
+        if without_key:
+            logging.warning("Skipped %s rows without a valid %s (rows %s...)", len(without_key), self.key_field,
+                            without_key[:5])
+        counts = {"matched": 0, "modified": 0, "errors": 0}
+        if requests:
+            with self.metrics.measure("update", len(requests)):
+                result = apply_updates(self.collection, requests, self.retry, self.throttle, updates)
+            failed = sorted(result["failed"])
+            counts = {"matched": result["matched"], "modified": result["modified"], "errors": len(failed)}
+            if failed and self.dead_letter is not None:
+                self.dead_letter.write_many(
+                    [{self.key_field: keys[i], **updates[i]} for i in failed],
+                    [grouped[keys[i]]["rows"][0] for i in failed],
+                    [result["last_error"].get(i, "unknown error") for i in failed],
+                )
+            not_found = len(requests) - len(failed) - result["matched"]
+            if not_found > 0 and self.missing is not None:
+                self._report_missing(keys, grouped)
+            self.totals["not_found"] += max(0, not_found)
+
+        self.totals["keys"] += len(requests)
+        for name, value in counts.items():
+            self.totals[name] += value
+        logging.info("Patched batch: keys=%s, matched=%s, modified=%s, errors=%s",
+                     len(requests), counts["matched"], counts["modified"], counts["errors"])
+        return counts
+
+
+def apply_patch_file(applier: PatchApplier, path: str, batch_size: int) -> Dict[str, int]:
+    """Appliquer un fichier de corrections par lots et retourner les totaux."""
+    for batch in read_csv_in_batches(path, batch_size, applier.metrics, categorical=None):
+        applier.process(batch)
+    return applier.totals
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : application d'un fichier de corrections à la collection cible."""
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="patch.py", description="Corrections par lots sur patient_records")
+    parser.add_argument("path", help="CSV de corrections (colonne clé + colonnes modifiées)")
+    parser.add_argument("--key", default=get_env("PATCH_KEY_FIELD", "_id"), help="colonne clé (nom long)")
+    parser.add_argument("--key-type", choices=KEY_TYPES, default=get_env("PATCH_KEY_TYPE", "auto"),
+                        help="type stocké de la clé (auto : ObjectId ou entier pour _id, texte sinon)")
+    parser.add_argument("--unset-marker", default=UNSET_MARKER, help="valeur signifiant « supprimer le champ »")
+    parser.add_argument("--batch-size", type=int, default=int(get_env("MIGRATION_BATCH_SIZE", "1000")))
+    parser.add_argument("--dead-letter", default=get_env("PATCH_DEAD_LETTER_PATH", "reports/patch_dead_letter.jsonl"))
+    parser.add_argument("--missing-report", default=None, help="écrire les clés introuvables dans ce fichier")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        retry = RetryPolicy(max_retries=max(0, int(get_env("MIGRATION_MAX_RETRIES", "3"))),
+                            base_delay=float(get_env("MIGRATION_RETRY_BASE_DELAY", "0.5")))
+        derived = parse_fields(get_env("MIGRATION_DERIVED_FIELDS", ""))
+        client = get_mongo_client()
+        throttle = build_throttle(client)
+    except ValueError as e:
+        logging.error("Invalid settings: %s", e)
+        return 1
+
+    metrics = StageMetrics()
+    missing = QuarantineWriter(args.missing_report) if args.missing_report else None
+    try:
+        target = get_target_collection(client)
+        metadata_name = get_env("FIELDMAP_COLLECTION", "schema_metadata")
+        # Schéma de la collection chargé avant de construire les $set
+        fieldmap = load_fieldmap(target.database[metadata_name], target.name)
+        pseudonymiser = None
+        record = key_record(target.database[metadata_name], target.name)
+        if record is not None:
+            pseudonymiser = Pseudonymiser(
+                read_key(get_env("MIGRATION_PSEUDONYM_KEY", ""), get_env("MIGRATION_PSEUDONYM_KEY_FILE", "")),
+                record["fields"])
+            if pseudonymiser.fingerprint != record["fingerprint"]:
+                raise ValueError(f"{target.name} is pseudonymised with another key ({record['fingerprint']})")
+        dimensions = None
+        record = dimensions_record(target.database[metadata_name], target.name)
+        if record is not None:
+            dimensions = DimensionEncoder(target.database, record["fields"], metadata_name=metadata_name)
+        with QuarantineWriter(args.dead_letter) as dead_letter:
+            applier = PatchApplier(target, args.key, args.unset_marker, retry, throttle, metrics, dead_letter,
+                                   missing, args.key_type, fieldmap, dimensions, derived, pseudonymiser)
+            totals = apply_patch_file(applier, args.path, max(1, args.batch_size))
+    except FileNotFoundError:
+        logging.error("Patch file not found: %s", args.path)
+        return 1
+    except ValueError as e:
+        # Collection pseudonymisée : clé absente ou différente de celle enregistrée
+        logging.error("Invalid settings: %s", e)
+        return 1
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    finally:
+        if missing is not None:
+            missing.close()
+        client.close()
+
+    metrics.log_report()
+    logging.info(
+        "Patch summary: rows=%s, keys=%s, matched=%s, modified=%s, not_found=%s, errors=%s, skipped=%s",
+        totals["rows"], totals["keys"], totals["matched"], totals["modified"], totals["not_found"],
+        totals["errors"], totals["skipped"],
+    )
+    return 0 if totals["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,270 @@
+"""
+Pseudonymisation des colonnes identifiantes (Name, Doctor) à l'ingestion.
+
+Chaque valeur est remplacée par un hachage BLAKE2b à clé secrète (32 caractères
+hexadécimaux) : la même personne garde le même pseudonyme d'un chargement à
+l'autre, mais la valeur d'origine n'est pas recalculable sans la clé. La casse
+et les espaces multiples sont normalisés avant hachage.
+
+Débit :
+- l'état BLAKE2b initialisé avec la clé est calculé une fois puis copié pour
+  chaque valeur (pas de bloc de clé à recompresser, ~3x plus rapide qu'un HMAC) ;
+- chaque lot ne hache que ses valeurs distinctes, via un cache LRU borné
+  partagé entre lots (les noms répétés ne sont hachés qu'une fois).
+
+L'empreinte de la clé (jamais la clé) est enregistrée dans schema_metadata :
+un chargement avec une autre clé est refusé tant que la rotation n'a pas été faite.
+Les deux schémas ne sont jamais mélangés dans une collection : un chargement
+sans pseudonymisation est refusé si une clé est enregistrée, et une première
+clé n'est pas enregistrée sur une collection contenant déjà des valeurs en clair.
+
+Rotation de clé : les correspondances ancien -> nouveau pseudonyme sont
+recalculées depuis les CSV source (un pseudonyme n'est pas réversible), puis
+les documents existants sont réécrits par lots d'_id croissants. Une rotation
+interrompue peut être relancée : les documents déjà réécrits sont ignorés.
+
+Utilisation:
+    MIGRATION_PSEUDONYMISE=Name,Doctor MIGRATION_PSEUDONYM_KEY=... python src/migrate.py
+    python src/pseudonymise.py --old-key-file old.key --new-key-file new.key data/*.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import logging
+import sys
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from categorical import CategoricalBatch
+from dimensions import dimension_collection_name, dimensions_record
+from fieldmap import FieldMap, load_fieldmap
+from scheduler import expand_inputs
+from throttle import TokenBucket
+
+PSEUDONYM_FIELDS = ("Name",)
+DIGEST_SIZE = 16
+
+
+def read_key(value: Optional[str] = None, path: Optional[str] = None) -> bytes:
+    """Clé secrète depuis une valeur ("hex:..." ou texte) ou un fichier (1 à 64 octets)."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            value = f.read().strip()
+    if not value:
+        raise ValueError("Pseudonymisation key is empty")
+    key = bytes.fromhex(value[4:]) if value.startswith("hex:") else value.encode("utf-8")
+    if len(key) > hashlib.blake2b.MAX_KEY_SIZE:
+        raise ValueError(f"Pseudonymisation key is longer than {hashlib.blake2b.MAX_KEY_SIZE} bytes")
+    return key
+
+
+def key_fingerprint(key: bytes) -> str:
+    """Empreinte courte de la clé, enregistrable sans la révéler."""
+    return hashlib.blake2b(b"pseudonym-key-fingerprint", key=key, digest_size=8).hexdigest()
+
+
+def normalise(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+
+class Pseudonymiser:
+    """Hachage à clé des colonnes fields, avec cache LRU de cache_size valeurs."""
+
+    def __init__(self, key: bytes, fields: Sequence[str] = PSEUDONYM_FIELDS, cache_size: int = 100_000) -> None:
+        self.fields = tuple(fields)
+        self.fingerprint = key_fingerprint(key)
+        keyed = hashlib.blake2b(key=key, digest_size=DIGEST_SIZE)
+
+        def digest(value: str) -> str:
+            h = keyed.copy()
+            h.update(normalise(value).encode("utf-8"))
+            return h.hexdigest()
+
+        # lru_cache est implémenté en C et sûr entre threads (ingestion multi-fichiers)
+        self.pseudonym = lru_cache(maxsize=cache_size)(digest)
+
+    def cache_info(self):
+        return self.pseudonym.cache_info()
+
+    def pseudonymise_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Transformation de lot pour BatchProcessor (migrate.py) : une empreinte par valeur distincte."""
+        pseudonym = self.pseudonym
+        for field in self.fields:
+            cells = [row.get(field) for row in batch]
+            mapping = {value: pseudonym(value) for value in dict.fromkeys(cells) if isinstance(value, str) and value}
+            for row, value in zip(batch, cells):
+                if value in mapping:
+                    row[field] = mapping[value]
+            if isinstance(batch, CategoricalBatch):
+                batch.invalidate(field)
+        return batch
+
+
+def key_record(metadata: Collection, collection_name: str) -> Optional[Dict[str, Any]]:
+    """Enregistrement de la clé de pseudonymisation de la collection (None si elle est en clair)."""
+    return metadata.find_one({"_id": f"{collection_name}:pseudonym_key"})
+
+
+def register_key(metadata: Collection, collection_name: str, pseudonymiser: Pseudonymiser,
+                 has_documents: bool = False, replace: bool = False) -> None:
+    """Enregistrer l'empreinte de la clé.
+
+    ValueError si la collection utilise une autre clé ou d'autres champs, ou si elle n'a pas de clé
+    enregistrée mais contient déjà des documents (has_documents : valeurs en clair).
+    replace=True : après le swap d'un full_reload, l'enregistrement décrit la
+    nouvelle collection et remplace l'ancien.
+    """
+    doc_id = f"{collection_name}:pseudonym_key"
+    record = {
+        "_id": doc_id, "collection": collection_name, "kind": "pseudonym_key",
+        "fingerprint": pseudonymiser.fingerprint, "fields": list(pseudonymiser.fields),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if replace:
+        metadata.replace_one({"_id": doc_id}, record, upsert=True)
+        return
+    if has_documents and key_record(metadata, collection_name) is None:
+        raise ValueError(f"{collection_name} already holds plain-text documents; "
+                         "pseudonymise it with a full reload (MIGRATION_MODE=full_reload)")
+    try:
+        metadata.insert_one(record)
+    except DuplicateKeyError:
+        existing = key_record(metadata, collection_name)
+        if existing["fingerprint"] != pseudonymiser.fingerprint:
+            raise ValueError(f"{collection_name} is pseudonymised with another key "
+                             f"({existing['fingerprint']}); rotate it first (src/pseudonymise.py)")
+        if sorted(existing["fields"]) != sorted(pseudonymiser.fields):
+            # Un champ en plus ou en moins mélangerait valeurs en clair et pseudonymes dans la même colonne
+            raise ValueError(f"{collection_name} pseudonymises {', '.join(existing['fields'])}, "
+                             f"not {', '.join(pseudonymiser.fields)}; change the fields with a full reload")
+
+
+def rotation_map(paths: Iterable[str], fields: Sequence[str], old: Pseudonymiser,
+                 new: Pseudonymiser) -> Dict[str, Dict[str, str]]:
+    """Correspondances ancien -> nouveau pseudonyme de chaque champ, depuis les CSV source."""
+    mapping: Dict[str, Dict[str, str]] = {field: {} for field in fields}
+    for path in paths:
+        with open(path, mode="r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                for field in fields:
+                    value = row.get(field)
+                    if value:
+                        mapping[field][old.pseudonym(value)] = new.pseudonym(value)
+    return mapping
+
+
+def rotate_collection(collection: Collection, paths: Dict[str, str], mapping: Dict[str, Dict[str, str]],
+                      batch_size: int = 1000, rate: float = 0) -> Dict[str, int]:
+    """Réécrire les pseudonymes des documents par lots d'_id croissants.
+
+    paths : champ source -> chemin stocké (nom court, "name" d'une dimension...).
+    unmapped : valeurs ni dans l'ancienne ni dans la nouvelle table (source incomplète).
+    """
+    bucket = TokenBucket(rate, burst=max(rate, batch_size)) if rate > 0 else None
+    already = {field: set(values.values()) for field, values in mapping.items()}
+    projection = {path: 1 for path in paths.values()}
+    totals = {"scanned": 0, "modified": 0, "unmapped": 0, "errors": 0}
+    last_id = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        documents = list(collection.find(query, projection, sort=[("_id", 1)], limit=batch_size))
+        if not documents:
+            break
+        last_id = documents[-1]["_id"]
+        totals["scanned"] += len(documents)
+        requests = []
+        for doc in documents:
+            changes = {}
+            for field, path in paths.items():
+                value = doc.get(path)
+                if value in mapping[field]:
+                    changes[path] = mapping[field][value]
+                elif isinstance(value, str) and value not in already[field]:
+                    totals["unmapped"] += 1
+            if changes:
+                requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if bucket is not None:
+            bucket.acquire(len(requests))
+        if requests:
+            try:
+                totals["modified"] += collection.bulk_write(requests, ordered=False).modified_count
+            except BulkWriteError as bwe:
+                totals["modified"] += bwe.details.get("nModified", 0)
+                totals["errors"] += len(bwe.details.get("writeErrors", []))
+        logging.info("Rotation progress on %s: scanned=%s, modified=%s",
+                     collection.name, totals["scanned"], totals["modified"])
+    return totals
+
+
+def rotation_targets(target: Collection, fields: Sequence[str], fieldmap: Optional[FieldMap] = None,
+                     dimensions: Sequence[str] = ()) -> List[Tuple[Collection, Dict[str, str]]]:
+    """Collections à réécrire : la cible (noms courts si fieldmap) et les dimensions des champs normalisés."""
+    direct = {field: fieldmap.short(field) if fieldmap is not None else field
+              for field in fields if field not in dimensions}
+    targets = [(target, direct)] if direct else []
+    targets += [(target.database[dimension_collection_name(field)], {field: "name"})
+                for field in fields if field in dimensions]
+    return targets
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : rotation de la clé de pseudonymisation de la collection cible."""
+    # Import local : migrate.py importe ce module pour MIGRATION_PSEUDONYMISE
+    from migrate import get_env, get_mongo_client, get_target_collection, setup_logging
+
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="pseudonymise.py", description="Rotation de la clé de pseudonymisation")
+    parser.add_argument("sources", nargs="+", help="CSV source (fichiers, répertoires ou globs)")
+    parser.add_argument("--old-key-file", required=True)
+    parser.add_argument("--new-key-file", required=True)
+    parser.add_argument("--fields", default=get_env("MIGRATION_PSEUDONYMISE", ",".join(PSEUDONYM_FIELDS)))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="plafond en documents/s (0 = sans plafond)")
+    args = parser.parse_args(argv[1:])
+
+    fields = [name.strip() for name in args.fields.split(",") if name.strip()]
+    try:
+        old = Pseudonymiser(read_key(path=args.old_key_file), fields)
+        new = Pseudonymiser(read_key(path=args.new_key_file), fields)
+        mapping = rotation_map(expand_inputs(args.sources), fields, old, new)
+    except (OSError, ValueError) as e:
+        logging.error("Invalid rotation settings: %s", e)
+        return 1
+    logging.info("Rotation map built: %s", ", ".join(f"{f}={len(m)}" for f, m in mapping.items()))
+
+    client = get_mongo_client()
+    try:
+        target = get_target_collection(client)
+        metadata = target.database[get_env("FIELDMAP_COLLECTION", "schema_metadata")]
+        record = dimensions_record(metadata, target.name)
+        dimensions = tuple(record["fields"]) if record is not None else ()
+        totals = {"scanned": 0, "modified": 0, "unmapped": 0, "errors": 0}
+        for collection, paths in rotation_targets(target, fields, load_fieldmap(metadata, target.name), dimensions):
+            for name, value in rotate_collection(collection, paths, mapping, max(1, args.batch_size),
+                                                 args.rate).items():
+                totals[name] += value
+        if totals["errors"] == 0 and totals["unmapped"] == 0:
+            metadata.update_one({"_id": f"{target.name}:pseudonym_key"},
+                                {"$set": {"fingerprint": new.fingerprint, "fields": fields,
+                                          "rotated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}}, upsert=True)
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    finally:
+        client.close()
+
+    logging.info("Rotation summary: scanned=%s, modified=%s, unmapped=%s, errors=%s",
+                 totals["scanned"], totals["modified"], totals["unmapped"], totals["errors"])
+    if totals["unmapped"]:
+        logging.warning("Some values are missing from the sources; key fingerprint left unchanged")
+    return 0 if totals["errors"] == 0 and totals["unmapped"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,86 @@
+"""
+Écriture en flux des lignes écartées par la migration (quarantaine, dead-letter).
+
+Chaque ligne est écrite avec son numéro de ligne de données (_row) et la raison
+du rejet (_reason). Les lectures par tranches d'octets (ingestion multi-fichiers,
+migration coopérative) ne connaissent pas les numéros de ligne : elles passent
+une RowLocation, écrite en _file / _offset (position en octets dans le CSV).
+Le format dépend de l'extension : .csv ou JSONL (défaut).
+Le fichier n'est créé qu'au premier rejet ; append=True complète un fichier
+existant (reprise d'une migration interrompue).
+"""
+
+import csv
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Union
+
+
+class RowLocation(NamedTuple):
+    """Position d'une ligne lue par tranche : fichier source et début de la ligne (octets)."""
+
+    file: str
+    offset: int
+
+
+_META_FIELDS = ("_row", "_file", "_offset", "_reason")
+
+
+class QuarantineWriter:
+    """Fichier de rejets ouvert à la demande, en ajout ligne par ligne (partageable entre threads)."""
+
+    def __init__(self, path: str, append: bool = False) -> None:
+        self.path = path
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._csv_writer: Optional[csv.DictWriter] = None
+        self._lock = threading.RLock()
+
+    def _open(self, first_row: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        existing = self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        self._file = open(self.path, mode="a" if self.append else "w", encoding="utf-8", newline="")
+        if self.path.lower().endswith(".csv"):
+            fieldnames = ([k for k in _META_FIELDS if k in first_row]
+                          + [k for k in first_row if k not in _META_FIELDS])
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction="ignore")
+            if not existing:
+                self._csv_writer.writeheader()
+
+    def write(self, row: Dict[str, Any], row_number: Union[int, RowLocation], reason: str) -> None:
+        """Écrire une ligne rejetée avec son numéro (ou sa position) et sa raison."""
+        if isinstance(row_number, RowLocation):
+            record: Dict[str, Any] = {"_file": row_number.file, "_offset": row_number.offset, "_reason": reason}
+        else:
+            record = {"_row": row_number, "_reason": reason}
+        record.update((k, v) for k, v in row.items() if k != "_id")
+        with self._lock:
+            if self._file is None:
+                self._open(record)
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self.count += 1
+
+    def write_many(self, rows: Iterable[Dict[str, Any]], row_numbers: Iterable[Union[int, RowLocation]],
+                   reasons: Iterable[str]) -> None:
+        with self._lock:
+            for row, row_number, reason in zip(rows, row_numbers, reasons):
+                self.write(row, row_number, reason)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "QuarantineWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
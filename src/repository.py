@@ -0,0 +1,270 @@
+"""
+Repository d'écriture groupée (write-coalescing) pour la collection patient_records.
+
+Objectif: remplacer les appels unitaires insert_one / update_one / delete_one
+par un tampon qui regroupe les écritures sur une courte fenêtre de temps ou
+jusqu'à un seuil de taille, puis les envoie en un seul bulk_write non ordonné.
+
+- Les $set successifs sur la même clé sont fusionnés en une seule opération.
+- Chaque opération logique retourne un Future (concurrent.futures) résolu avec
+  un WriteAck, ou avec l'exception correspondant à son erreur d'écriture.
+- flush() est synchrone : à utiliser quand l'appelant doit relire ses écritures.
+
+Utilisation:
+    repo = BulkWriteRepository(collection, key_field="patient_id")
+    fut = repo.insert({"patient_id": "P1", "age": "42"})
+    repo.set_fields("P1", {"diagnosis": "Hypertension"})
+    repo.flush()
+    fut.result()
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError, WriteError
+
+
+class WriteAck(NamedTuple):
+    """Accusé de réception d'une opération logique."""
+
+    operation: str
+    inserted_id: Any = None
+    upserted_id: Any = None
+
+
+class _PendingOp:
+    """Opération en attente dans le tampon (éventuellement fusionnée)."""
+
+    __slots__ = ("kind", "key", "document", "filter", "update", "many", "upsert", "futures")
+
+    def __init__(self, kind: str, key: Any, document: Optional[Dict[str, Any]] = None,
+                 filter: Optional[Dict[str, Any]] = None, update: Optional[Dict[str, Any]] = None,
+                 many: bool = False, upsert: bool = False) -> None:
+        self.kind = kind
+        self.key = key
+        self.document = document
+        self.filter = filter
+        self.update = update
+        self.many = many
+        self.upsert = upsert
+        self.futures: List[Future] = []
+
+    def is_set_only(self) -> bool:
+        return self.kind == "update" and not self.many and list(self.update or {}) == ["$set"]
+
+    def to_request(self):
+        if self.kind == "insert":
+            return InsertOne(self.document)
+        if self.kind == "update":
+            op = UpdateMany if self.many else UpdateOne
+            return op(self.filter, self.update, upsert=self.upsert)
+        op = DeleteMany if self.many else DeleteOne
+        return op(self.filter)
+
+
+def _paths_conflict(existing: Dict[str, Any], fields: Dict[str, Any]) -> bool:
+    """Un chemin de fields est-il le préfixe d'un chemin de existing, ou l'inverse ?"""
+    for name in fields:
+        for other in existing:
+            if name != other and (other.startswith(name + ".") or name.startswith(other + ".")):
+                return True
+    return False
+
+
+class BulkWriteRepository:
+    """Tampon d'écritures fusionnées, vidé par bulk_write(ordered=False).
+
+    Paramètres:
+      - key_field: champ identifiant un document (patient_id par défaut). Les
+        opérations dont le filtre est exactement {key_field: valeur} sont
+        fusionnables ; les autres servent de barrière d'ordonnancement.
+      - max_ops: nombre d'opérations en attente déclenchant un flush immédiat.
+      - max_delay: fenêtre (secondes) après laquelle le tampon est vidé en
+        arrière-plan. 0 désactive le flush temporisé.
+
+    Comme bulk_write non ordonné n'offre aucune garantie d'ordre, les
+    opérations touchant une même clé sont réparties en « rondes » successives
+    (au plus une opération par clé et par ronde).
+    """
+
+    def __init__(self, collection: Collection, key_field: str = "patient_id",
+                 max_ops: int = 1000, max_delay: float = 0.05) -> None:
+        self.collection = collection
+        self.key_field = key_field
+        self.max_ops = max(1, max_ops)
+        self.max_delay = max_delay
+        self._ops: List[_PendingOp] = []
+        self._last_by_key: Dict[Any, _PendingOp] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+
+    # --- API publique -----------------------------------------------------
+
+    def insert(self, document: Dict[str, Any]) -> Future:
+        """Ajouter une insertion. L'_id est attribué côté client si absent.
+
+        Le tampon garde une copie : les $set fusionnés ensuite ne modifient pas
+        le document de l'appelant.
+        """
+        document.setdefault("_id", ObjectId())
+        key = document.get(self.key_field, ("_id", document["_id"]))
+        return self._enqueue(_PendingOp("insert", key, document=dict(document)))
+
+    def set_fields(self, key_value: Any, fields: Dict[str, Any], upsert: bool = False) -> Future:
+        """Ajouter un $set sur le document {key_field: key_value} (fusionnable)."""
+        return self.update({self.key_field: key_value}, {"$set": dict(fields)}, upsert=upsert)
+
+    def update(self, filter: Dict[str, Any], update: Dict[str, Any],
+               many: bool = False, upsert: bool = False) -> Future:
+        """Ajouter une mise à jour (update_one, ou update_many si many=True)."""
+        op = _PendingOp("update", self._key_of(filter), filter=filter,
+                        update={k: dict(v) for k, v in update.items()}, many=many, upsert=upsert)
+        return self._enqueue(op)
+
+    def delete(self, filter: Dict[str, Any], many: bool = False) -> Future:
+        """Ajouter une suppression (delete_one, ou delete_many si many=True)."""
+        return self._enqueue(_PendingOp("delete", self._key_of(filter), filter=filter, many=many))
+
+    def flush(self) -> None:
+        """Vider le tampon de façon synchrone (lecture de ses propres écritures)."""
+        with self._flush_lock:
+            with self._lock:
+                ops = self._ops
+                self._ops = []
+                self._last_by_key = {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if ops:
+                self._execute(ops)
+
+    def close(self) -> None:
+        """Vider le tampon et refuser toute nouvelle opération."""
+        self._closed = True
+        self.flush()
+
+    def __enter__(self) -> "BulkWriteRepository":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- Interne ----------------------------------------------------------
+
+    def _key_of(self, filter: Dict[str, Any]) -> Any:
+        """Clé de fusion : valeur de key_field si le filtre est un simple égal, sinon None."""
+        if list(filter) == [self.key_field] and not isinstance(filter[self.key_field], dict):
+            return filter[self.key_field]
+        if list(filter) == ["_id"] and not isinstance(filter["_id"], dict):
+            return ("_id", filter["_id"])
+        return None
+
+    def _enqueue(self, op: _PendingOp) -> Future:
+        if self._closed:
+            raise RuntimeError("BulkWriteRepository is closed")
+        future: Future = Future()
+        flush_now = False
+        with self._lock:
+            previous = self._last_by_key.get(op.key) if op.key is not None else None
+            if previous is not None and op.is_set_only() and not op.upsert and self._merge(previous, op):
+                previous.futures.append(future)
+            else:
+                op.futures.append(future)
+                self._ops.append(op)
+                if op.key is not None:
+                    self._last_by_key[op.key] = op
+                else:
+                    # Barrière : plus aucune fusion possible avec les opérations précédentes
+                    self._last_by_key = {}
+            flush_now = len(self._ops) >= self.max_ops
+            if not flush_now and self.max_delay > 0 and self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+        return future
+
+    @staticmethod
+    def _merge(previous: _PendingOp, op: _PendingOp) -> bool:
+        """Fusionner un $set dans l'opération précédente sur la même clé, si possible.
+
+        Pas de fusion si un chemin est le préfixe d'un autre ("a" et "a.b") : un
+        même $set les refuserait (conflit). L'opération part alors dans la ronde
+        suivante.
+        """
+        fields = op.update["$set"]
+        if previous.is_set_only():
+            if _paths_conflict(previous.update["$set"], fields):
+                return False
+            previous.update["$set"].update(fields)
+            return True
+        if previous.kind == "insert" and not any("." in name for name in fields):
+            previous.document.update(fields)
+            return True
+        return False
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:  # Le timer ne doit jamais lever : les Futures portent les erreurs
+            logging.error("Background flush failed: %s", e)
+
+    def _rounds(self, ops: List[_PendingOp]) -> List[List[_PendingOp]]:
+        """Répartir les opérations en rondes respectant l'ordre par clé et les barrières."""
+        rounds: List[List[_PendingOp]] = []
+        last_round: Dict[Any, int] = {}
+        floor = 0
+        for op in ops:
+            if op.key is None:
+                index = max(len(rounds), floor)
+                floor = index + 1
+            else:
+                index = max(floor, last_round.get(op.key, -1) + 1)
+                last_round[op.key] = index
+            while len(rounds) <= index:
+                rounds.append([])
+            rounds[index].append(op)
+        return [r for r in rounds if r]
+
+    def _execute(self, ops: List[_PendingOp]) -> None:
+        rounds = self._rounds(ops)
+        for position, round_ops in enumerate(rounds):
+            try:
+                result = self.collection.bulk_write([op.to_request() for op in round_ops], ordered=False)
+                upserted = result.upserted_ids or {}
+                failed: Dict[int, Dict[str, Any]] = {}
+            except BulkWriteError as bwe:
+                details = bwe.details or {}
+                upserted = {u["index"]: u["_id"] for u in details.get("upserted", [])}
+                failed = {err["index"]: err for err in details.get("writeErrors", [])}
+                logging.error("Repository bulk_write completed with %s write errors", len(failed))
+            except PyMongoError as e:
+                logging.error("Repository bulk_write failed: %s", e)
+                for pending in rounds[position:]:
+                    for op in pending:
+                        for future in op.futures:
+                            future.set_exception(e)
+                return
+
+            for index, op in enumerate(round_ops):
+                if index in failed:
+                    err = failed[index]
+                    exc = WriteError(err.get("errmsg", "write error"), err.get("code"), err)
+                    for future in op.futures:
+                        future.set_exception(exc)
+                    continue
+                ack = WriteAck(
+                    operation=op.kind,
+                    inserted_id=op.document["_id"] if op.kind == "insert" else None,
+                    upserted_id=upserted.get(index),
+                )
+                for future in op.futures:
+                    future.set_result(ack)
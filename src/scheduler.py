@@ -0,0 +1,217 @@
+"""
+Ingestion multi-fichiers avec ordonnanceur à vol de travail (work stealing).
+
+- expand_inputs : chemins, motifs glob, répertoires (*.csv) et manifestes
+  (un chemin par ligne, # pour les commentaires) -> liste de fichiers.
+- Les fichiers sont découpés en unités de travail : un fichier entier, ou des
+  tranches d'octets alignées sur les lignes pour les gros fichiers.
+- Chaque worker a sa propre file d'unités (les plus grosses d'abord) ; quand
+  elle est vide, il vole l'unité la plus petite en queue de la file la plus
+  chargée. Un très gros fichier n'immobilise donc qu'un worker par tranche.
+- Résultats par fichier (lignes, succès, erreurs, rejets, échecs) et totaux
+  combinés.
+
+Les _id sont dérivés de (version du fichier, position de la ligne), la version
+étant le chemin absolu, la taille et la date de modification
+(coordinator.file_version) : relancer l'ingestion d'un fichier déjà chargé ne
+crée pas de doublons, et deux fichiers de même nom ou deux versions d'un même
+fichier ne partagent pas leurs _id. Les lignes rejetées sont
+tracées par fichier et position (_file / _offset) dans la quarantaine et le
+dead-letter. Une erreur sur une unité (fichier illisible, CSV invalide, erreur
+inattendue) est enregistrée comme échec du fichier sans arrêter le worker.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from coordinator import file_version, plan_chunks, read_chunk_in_batches
+from metrics import StageMetrics
+from quarantine import RowLocation
+
+_GLOB_CHARS = ("*", "?", "[")
+
+
+class WorkUnit(NamedTuple):
+    """Tranche [start, end) d'un fichier CSV."""
+
+    path: str
+    header: List[str]
+    start: int
+    end: int
+    index: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+def read_manifest(path: str) -> List[str]:
+    """Chemins listés dans un manifeste (relatifs au répertoire du manifeste)."""
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                entries.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return entries
+
+
+def expand_inputs(specs: List[str], manifests: Optional[List[str]] = None) -> List[str]:
+    """Développer chemins, globs, répertoires et manifestes en chemins absolus (sans doublon, ordre stable)."""
+    specs = list(specs)
+    for manifest in manifests or []:
+        specs += read_manifest(manifest)
+    files: List[str] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            files += sorted(glob.glob(os.path.join(spec, "*.csv")))
+        elif any(char in spec for char in _GLOB_CHARS):
+            matches = sorted(glob.glob(spec, recursive=True))
+            if not matches:
+                logging.warning("No file matches %s", spec)
+            files += matches
+        else:
+            files.append(spec)
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+
+def plan_units(paths: List[str], chunk_bytes: int) -> List[WorkUnit]:
+    """Unités de travail de tous les fichiers, les plus grosses d'abord."""
+    units = []
+    for path in paths:
+        header, chunks = plan_chunks(path, chunk_bytes)
+        units += [WorkUnit(path, header, start, end, i) for i, (start, end) in enumerate(chunks)]
+    units.sort(key=lambda unit: unit.size, reverse=True)
+    return units
+
+
+class WorkStealingQueues:
+    """Une file par worker ; un worker inactif vole en queue de la file la plus chargée."""
+
+    def __init__(self, units: List[WorkUnit], workers: int) -> None:
+        self._queues: List[Deque[WorkUnit]] = [deque() for _ in range(workers)]
+        self._load = [0] * workers
+        self._lock = threading.Lock()
+        self.steals = 0
+        # Répartition initiale gloutonne : chaque unité va à la file la moins chargée
+        for unit in units:
+            target = self._load.index(min(self._load))
+            self._queues[target].append(unit)
+            self._load[target] += unit.size
+
+    def next(self, worker: int) -> Optional[WorkUnit]:
+        """Prochaine unité du worker : tête de sa file, sinon vol en queue de la file la plus chargée."""
+        with self._lock:
+            owner = worker
+            if not self._queues[worker]:
+                owner = max(range(len(self._queues)), key=lambda i: self._load[i])
+                if not self._queues[owner]:
+                    return None
+                self.steals += 1
+            unit = self._queues[owner].popleft() if owner == worker else self._queues[owner].pop()
+            self._load[owner] -= unit.size
+            return unit
+
+
+def _new_file_result(path: str) -> Dict[str, Any]:
+    return {"file": path, "units": 0, "rows": 0, "success": 0, "errors": 0, "rejected": 0,
+            "failures": [], "seconds": 0.0}
+
+
+def run_multi_file(paths: List[str], make_processor: Callable[[StageMetrics], Any], batch_size: int,
+                   workers: int = 4, chunk_bytes: int = 64 * 1024 * 1024) -> Dict[str, Any]:
+    """Ingérer tous les fichiers avec workers threads ; retourne le résumé combiné.
+
+    make_processor(metrics) construit le BatchProcessor d'un worker (migrate.py) ;
+    chaque worker a ses propres métriques, fusionnées à la fin.
+    """
+    results = {path: _new_file_result(path) for path in paths}
+    units: List[WorkUnit] = []
+    sources: Dict[str, str] = {}
+    for path in paths:
+        try:
+            sources[path] = file_version(path)
+            units += plan_units([path], chunk_bytes)
+        except (OSError, UnicodeDecodeError, StopIteration) as e:
+            results[path]["failures"].append(f"{type(e).__name__}: {e}")
+            logging.error("Cannot plan %s: %s", path, e)
+    units.sort(key=lambda unit: unit.size, reverse=True)
+    workers = max(1, min(workers, len(units) or 1))
+    queues = WorkStealingQueues(units, workers)
+    metrics = [StageMetrics() for _ in range(workers)]
+    lock = threading.Lock()
+
+    def work(worker: int) -> None:
+        processor = make_processor(metrics[worker])
+        while True:
+            unit = queues.next(worker)
+            if unit is None:
+                return
+            before = dict(processor.totals)
+            started = time.perf_counter()
+            failure = None
+            try:
+                for batch, offsets in read_chunk_in_batches(unit.path, unit.header, unit.start, unit.end,
+                                                            batch_size, sources[unit.path], processor.metrics):
+                    processor.process(batch, [RowLocation(unit.path, offset) for offset in offsets])
+            except Exception as e:  # csv.Error, réglage invalide... : l'unité échoue, le worker continue
+                failure = f"chunk {unit.index}: {type(e).__name__}: {e}"
+                logging.error("Failed to ingest %s (%s)", unit.path, failure)
+            with lock:
+                result = results[unit.path]
+                result["units"] += 1
+                result["seconds"] += time.perf_counter() - started
+                for key in ("rows", "success", "errors", "rejected"):
+                    result[key] += processor.totals[key] - before[key]
+                if failure is not None:
+                    result["failures"].append(failure)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(i,), name=f"ingest-{i}") for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    combined = StageMetrics()
+    for worker_metrics in metrics:
+        combined.merge(worker_metrics)
+    files = list(results.values())
+    totals = {key: sum(r[key] for r in files) for key in ("rows", "success", "errors", "rejected")}
+    return {
+        "files": files,
+        "totals": totals,
+        "failed_files": [r["file"] for r in files if r["failures"]],
+        "units": len(units),
+        "steals": queues.steals,
+        "workers": workers,
+        "elapsed_s": time.perf_counter() - started,
+        "metrics": combined,
+    }
+
+
+def log_summary(summary: Dict[str, Any]) -> None:
+    for result in summary["files"]:
+        logging.info("File %s: units=%s rows=%s success=%s errors=%s rejected=%s time=%.1fs%s",
+                     result["file"], result["units"], result["rows"], result["success"], result["errors"],
+                     result["rejected"], result["seconds"],
+                     f" FAILED ({'; '.join(result['failures'])})" if result["failures"] else "")
+    logging.info("Scheduled %s units on %s workers in %.1fs (%s steals), %s failed files",
+                 summary["units"], summary["workers"], summary["elapsed_s"], summary["steals"],
+                 len(summary["failed_files"]))
+
+
+def write_summary(summary: Dict[str, Any], path: str) -> None:
+    """Écrire le résumé (sans l'objet de métriques) en JSON."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({key: value for key, value in summary.items() if key != "metrics"}, f, indent=2)
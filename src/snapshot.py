@@ -0,0 +1,217 @@
+"""
+Instantané binaire et restauration parallèle de patient_records.
+
+- snapshot : export de la collection en segments BSON bruts (documents
+  concaténés, tels que renvoyés par find_raw_batches) + manifest.json décrivant
+  les segments, les options de la collection et ses index.
+- restore : chargement parallèle des segments sous forme de RawBSONDocument
+  (aucun parsing CSV ni ré-encodage) dans une collection de staging, puis
+  reconstruction des index, vérification et swap vers la cible.
+
+Utilisation:
+    python src/snapshot.py snapshot --output snapshots/patient_records
+    python src/snapshot.py restore --input snapshots/patient_records --workers 8
+"""
+
+import argparse
+import logging
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Generator, List
+
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from indexes import describe_indexes
+from migrate import (RetryPolicy, create_staging_collection, get_env, get_mongo_client, get_target_collection,
+                     insert_batch, setup_logging, swap_staging, verify_staging)
+
+MANIFEST_NAME = "manifest.json"
+_INT32 = struct.Struct("<i")
+
+
+def iter_raw_documents(data: bytes) -> Generator[bytes, None, None]:
+    """Découper une suite de documents BSON concaténés."""
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        size = _INT32.unpack_from(data, pos)[0]
+        yield view[pos:pos + size]
+        pos += size
+
+
+def _count_documents(data: bytes) -> int:
+    count = 0
+    pos = 0
+    while pos < len(data):
+        pos += _INT32.unpack_from(data, pos)[0]
+        count += 1
+    return count
+
+
+def snapshot_collection(collection: Collection, output_dir: str,
+                        segment_bytes: int = 16 * 1024 * 1024, batch_size: int = 10000) -> Dict[str, Any]:
+    """Écrire les segments BSON bruts et le manifest ; retourne le manifest."""
+    os.makedirs(output_dir, exist_ok=True)
+    segments: List[Dict[str, Any]] = []
+    current = None
+
+    def close_segment():
+        if current is not None:
+            current["file"].close()
+            segments.append({k: v for k, v in current.items() if k != "file"})
+
+    cursor = collection.find_raw_batches({}, sort=[("_id", 1)], batch_size=batch_size)
+    try:
+        for batch in cursor:
+            if current is None or current["bytes"] >= segment_bytes:
+                close_segment()
+                name = f"segment-{len(segments):05d}.bson"
+                current = {"name": name, "documents": 0, "bytes": 0,
+                           "file": open(os.path.join(output_dir, name), "wb")}
+            current["file"].write(batch)
+            current["documents"] += _count_documents(batch)
+            current["bytes"] += len(batch)
+    finally:
+        cursor.close()
+        close_segment()
+
+    manifest = {
+        "database": collection.database.name,
+        "collection": collection.name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "documents": sum(s["documents"] for s in segments),
+        "bytes": sum(s["bytes"] for s in segments),
+        "options": collection.options(),
+        "indexes": describe_indexes(collection),
+        "segments": segments,
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        f.write(json_util.dumps(manifest, indent=2))
+    logging.info("Snapshot written: %s documents in %s segments (%.1f MB) -> %s",
+                 manifest["documents"], len(segments), manifest["bytes"] / (1024 * 1024), output_dir)
+    return manifest
+
+
+def load_manifest(input_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(input_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        return json_util.loads(f.read())
+
+
+def _restore_segment(collection: Collection, path: str, batch_docs: int, retry: RetryPolicy) -> Dict[str, int]:
+    with open(path, "rb") as f:
+        data = f.read()
+    totals = {"success": 0, "errors": 0}
+    batch: List[RawBSONDocument] = []
+    for raw in iter_raw_documents(data):
+        batch.append(RawBSONDocument(bytes(raw)))
+        if len(batch) >= batch_docs:
+            counts = insert_batch(collection, batch, retry=retry)
+            totals["success"] += counts["success"]
+            totals["errors"] += counts["errors"]
+            batch = []
+    if batch:
+        counts = insert_batch(collection, batch, retry=retry)
+        totals["success"] += counts["success"]
+        totals["errors"] += counts["errors"]
+    logging.info("Restored %s: success=%s, errors=%s", os.path.basename(path), totals["success"], totals["errors"])
+    return totals
+
+
+def restore_collection(collection: Collection, input_dir: str, workers: int = 4, batch_docs: int = 1000,
+                       drop: bool = True, retry: RetryPolicy = RetryPolicy(),
+                       keep_generations: int = 0) -> Dict[str, Any]:
+    """Restaurer un instantané dans collection (segments en parallèle, index ensuite).
+
+    drop=True : chargement dans une collection de staging (options du manifest),
+    vérifiée puis substituée à la cible par swap_staging ; en cas d'échec le
+    staging est supprimé et la cible reste intacte. drop=False : insertion
+    directe dans la cible existante. restored indique si les données sont en place.
+    """
+    manifest = load_manifest(input_dir)
+    staging = create_staging_collection(collection, manifest.get("options", {})) if drop else None
+    destination = staging if staging is not None else collection
+
+    try:
+        started = time.perf_counter()
+        paths = [os.path.join(input_dir, s["name"]) for s in manifest["segments"]]
+        # Les plus gros segments d'abord pour équilibrer les workers
+        paths.sort(key=os.path.getsize, reverse=True)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = list(pool.map(lambda p: _restore_segment(destination, p, batch_docs, retry), paths))
+        totals: Dict[str, Any] = {"success": sum(r["success"] for r in results),
+                                  "errors": sum(r["errors"] for r in results)}
+        load_seconds = time.perf_counter() - started
+
+        models = [IndexModel(index["key"], **index["options"]) for index in manifest.get("indexes", [])]
+        if models:
+            destination.create_indexes(models)
+    except Exception:
+        if staging is not None:
+            staging.drop()
+        raise
+    logging.info("Restore summary: documents=%s/%s, errors=%s, load=%.1fs (%.0f docs/s), indexes=%s",
+                 totals["success"], manifest["documents"], totals["errors"], load_seconds,
+                 totals["success"] / load_seconds if load_seconds > 0 else 0, len(models))
+
+    totals["restored"] = True
+    if staging is not None:
+        if verify_staging(staging, {"rows": manifest["documents"], "rejected": 0, "errors": totals["errors"]}):
+            swap_staging(staging, collection, keep_generations)
+        else:
+            staging.drop()
+            totals["restored"] = False
+            logging.error("Restore aborted: %s left unchanged", collection.full_name)
+    return totals
+
+
+def main(argv: List[str]) -> int:
+    """Point d'entrée : snapshot ou restore de la collection cible."""
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="snapshot.py", description="Snapshot / restore BSON de patient_records")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="exporter la collection en segments BSON")
+    snap.add_argument("--output", required=True, help="répertoire de l'instantané")
+    snap.add_argument("--segment-mb", type=int, default=16, help="taille cible d'un segment (Mo)")
+    rest = sub.add_parser("restore", help="restaurer un instantané")
+    rest.add_argument("--input", required=True, help="répertoire de l'instantané")
+    rest.add_argument("--workers", type=int, default=int(get_env("RESTORE_WORKERS", "4")))
+    rest.add_argument("--batch-size", type=int, default=1000, help="documents par insert_many")
+    rest.add_argument("--keep-existing", action="store_true", help="insérer dans la collection cible sans staging ni swap")
+    args = parser.parse_args(argv[1:])
+
+    client = None
+    try:
+        client = get_mongo_client()
+        collection = get_target_collection(client)
+        if args.command == "snapshot":
+            snapshot_collection(collection, args.output, segment_bytes=args.segment_mb * 1024 * 1024)
+            ok = True
+        else:
+            try:
+                keep_generations = max(0, int(get_env("MIGRATION_KEEP_GENERATIONS", "0")))
+            except ValueError:
+                keep_generations = 0
+            totals = restore_collection(collection, args.input, args.workers, args.batch_size,
+                                        drop=not args.keep_existing, keep_generations=keep_generations)
+            ok = totals["restored"] and totals["errors"] == 0
+    except (OSError, ValueError) as e:
+        logging.error("Snapshot file error: %s", e)
+        return 1
+    except PyMongoError as e:
+        logging.error("MongoDB error: %s", e)
+        return 1
+    finally:
+        if client is not None:
+            client.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
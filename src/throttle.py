@@ -0,0 +1,204 @@
+"""
+Limitation de débit de la migration pour protéger le primaire partagé.
+
+- TokenBucket : plafond en documents/s et/ou en octets/s.
+- LoadThrottle : applique les plafonds avant chaque insertion et ajuste un
+  facteur de débit (AIMD) : réduction de moitié quand la latence d'insert_many
+  ou la file d'attente serveur (serverStatus.globalLock.currentQueue) dépasse
+  son seuil, remontée progressive sinon. serverStatus exige le rôle
+  clusterMonitor : s'il est refusé, un avertissement est émis une fois et seule
+  la latence est surveillée.
+- Réglage à chaud : fichier de contrôle JSON relu à chaque modification, ou
+  relecture immédiate sur SIGHUP.
+
+Exemple de fichier de contrôle:
+    {"docs_per_second": 2000, "mb_per_second": 4, "max_latency_ms": 250, "max_queue": 10}
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+class TokenBucket:
+    """Seau à jetons : rate unités/s, capacité burst (0 = illimité)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self.rate = rate
+            self.burst = rate
+            self._tokens = min(self._tokens, self.burst)
+
+    def acquire(self, amount: float) -> float:
+        """Consommer amount jetons, en dormant si nécessaire ; retourne l'attente (s)."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Un lot plus gros que la capacité passe en empruntant sur l'avenir
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def estimate_size(documents: List[Dict[str, Any]]) -> int:
+    """Taille approximative (octets) d'un lot de documents à champs texte."""
+    return sum(len(k) + len(str(v)) + 7 for doc in documents for k, v in doc.items())
+
+
+class LoadThrottle:
+    """Régulateur de charge de l'étape d'insertion.
+
+    Paramètres (tous modifiables à chaud via le fichier de contrôle):
+      - docs_per_second / mb_per_second : plafonds cibles (0 = pas de plafond)
+      - max_latency_ms : latence insert_many au-delà de laquelle on ralentit
+      - max_queue : file d'attente serveur (lecteurs + écrivains) tolérée
+      - status_interval : intervalle minimal (s) entre deux serverStatus
+    """
+
+    MIN_FACTOR = 0.05
+    INCREASE_STEP = 0.05
+
+    def __init__(self, docs_per_second: float = 0, mb_per_second: float = 0,
+                 max_latency_ms: float = 500, max_queue: int = 0,
+                 client: Optional[MongoClient] = None, control_file: Optional[str] = None,
+                 status_interval: float = 5.0) -> None:
+        self.settings: Dict[str, float] = {
+            "docs_per_second": docs_per_second,
+            "mb_per_second": mb_per_second,
+            "max_latency_ms": max_latency_ms,
+            "max_queue": max_queue,
+        }
+        self.client = client
+        self.control_file = control_file
+        self.status_interval = status_interval
+        self.factor = 1.0
+        self.total_wait = 0.0
+        self._control_mtime: Optional[float] = None
+        self._reload_requested = False
+        self._last_status = 0.0
+        self._queue_disabled = False
+        self._docs = TokenBucket(docs_per_second)
+        self._bytes = TokenBucket(mb_per_second * 1024 * 1024)
+        self.reload()
+
+    def install_signal_handler(self) -> None:
+        """Relire le fichier de contrôle sur SIGHUP (si la plateforme le permet)."""
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, self._on_sighup)
+
+    def _on_sighup(self, signum, frame) -> None:
+        self._reload_requested = True
+
+    def reload(self, force: bool = False) -> None:
+        """Relire le fichier de contrôle s'il a changé (ou si force)."""
+        if not self.control_file:
+            self._apply_rates()
+            return
+        try:
+            mtime = os.path.getmtime(self.control_file)
+        except OSError:
+            self._apply_rates()
+            return
+        if not force and mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+        try:
+            with open(self.control_file, encoding="utf-8") as f:
+                changes = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable throttle control file %s: %s", self.control_file, e)
+            return
+        if not isinstance(changes, dict):
+            logging.warning("Ignoring throttle control file %s: expected a JSON object", self.control_file)
+            return
+        for key, value in changes.items():
+            if key not in self.settings:
+                logging.warning("Ignoring unknown throttle setting %r", key)
+                continue
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = -1.0
+            # Booléens, NaN, infinis et négatifs refusés : le réglage précédent est conservé
+            if isinstance(value, bool) or not 0 <= number < float("inf"):
+                logging.warning("Ignoring invalid throttle setting %s=%r (kept %s)", key, value, self.settings[key])
+                continue
+            self.settings[key] = number
+        logging.info("Throttle settings updated: %s", self.settings)
+        self._apply_rates()
+
+    def _apply_rates(self) -> None:
+        self._docs.set_rate(self.settings["docs_per_second"] * self.factor)
+        self._bytes.set_rate(self.settings["mb_per_second"] * 1024 * 1024 * self.factor)
+
+    def before_insert(self, documents: List[Dict[str, Any]]) -> None:
+        """Attendre que les plafonds autorisent l'envoi du lot."""
+        self.reload(force=self._reload_requested)
+        self._reload_requested = False
+        waited = self._docs.acquire(len(documents))
+        if self.settings["mb_per_second"] > 0:
+            waited += self._bytes.acquire(estimate_size(documents))
+        self.total_wait += waited
+
+    def after_insert(self, latency: float) -> None:
+        """Ajuster le facteur de débit selon la latence observée et la file serveur."""
+        overloaded = latency * 1000 > self.settings["max_latency_ms"] > 0
+        queue = self._server_queue()
+        if queue is not None and self.settings["max_queue"] > 0 and queue > self.settings["max_queue"]:
+            overloaded = True
+
+        previous = self.factor
+        if overloaded:
+            self.factor = max(self.MIN_FACTOR, self.factor / 2)
+        else:
+            self.factor = min(1.0, self.factor + self.INCREASE_STEP)
+        if self.factor != previous:
+            if overloaded:
+                logging.warning("Backpressure: latency=%.0fms queue=%s -> rate factor %.2f",
+                                latency * 1000, queue, self.factor)
+            self._apply_rates()
+        if overloaded and self.settings["docs_per_second"] <= 0 and self.settings["mb_per_second"] <= 0:
+            # Sans plafond configuré, ralentir par une pause proportionnelle à la latence
+            pause = latency * (1 / self.factor - 1)
+            time.sleep(pause)
+            self.total_wait += pause
+
+    def _server_queue(self) -> Optional[int]:
+        """Taille de la file globale (serverStatus), échantillonnée au plus toutes les status_interval s."""
+        if self.client is None or self.settings["max_queue"] <= 0 or self._queue_disabled:
+            return None
+        now = time.monotonic()
+        if now - self._last_status < self.status_interval:
+            return None
+        self._last_status = now
+        try:
+            status = self.client.admin.command("serverStatus", repl=0, metrics=0, locks=0)
+        except OperationFailure as e:
+            # Commande refusée (rôle clusterMonitor absent) : inutile de la renvoyer à chaque lot
+            logging.warning("serverStatus refused (%s): queue-based throttling disabled, "
+                            "grant clusterMonitor to the migration user to enable it", e)
+            self._queue_disabled = True
+            return None
+        except PyMongoError as e:
+            logging.debug("serverStatus unavailable for throttling: %s", e)
+            return None
+        return status.get("globalLock", {}).get("currentQueue", {}).get("total")
@@ -0,0 +1,38 @@
+"""
+Tests unitaires du conseiller d'index (src/advisor.py)
+"""
+
+from advisor import extract_query, is_covered, normalise, propose_index
+
+
+class TestAdvisor:
+    """Normalisation des formes de requête et ordre ESR"""
+
+    def test_unit_shapes_ignore_literal_values(self):
+        """Test Advisor 1: deux requêtes de même forme ont la même clé normalisée"""
+        entry = {"op": "query", "command": {"find": "patient_records",
+                                            "filter": {"Age": {"$gte": 40}, "Gender": "Male"}}}
+        op, query, sort = extract_query(entry)
+        assert op == "find" and sort == {}
+        assert normalise(query) == normalise({"Gender": "Female", "Age": {"$gte": 18}})
+        assert normalise(query) == {"Age": {"$gte": 1}, "Gender": 1}
+
+    def test_unit_esr_order(self):
+        """Test Advisor 2: égalité, puis tri, puis intervalle ; index existant reconnu"""
+        keys = propose_index(
+            {"Date of Admission": {"$gte": "2022-01-01"}, "Medical Condition": "Asthma",
+             "Blood Type": {"$in": ["O+", "A-"]}},
+            {"Billing Amount": -1},
+        )
+        assert keys == [("Medical Condition", 1), ("Blood Type", 1),
+                        ("Billing Amount", -1), ("Date of Admission", 1)]
+        assert is_covered([("Medical Condition", 1)], [[("Medical Condition", 1), ("Date of Admission", 1)]])
+        assert not is_covered(keys, [[("Medical Condition", 1), ("Date of Admission", 1)]])
+
+    def test_unit_logical_clauses_are_all_kept(self):
+        """Test Advisor 3: toutes les clauses de $and / $or comptent dans la forme, pas la longueur des $in"""
+        query = {"$and": [{"Medical Condition": "Asthma"}, {"Date of Admission": {"$gte": "2022-01-01"}}]}
+        assert normalise(query) == {"$and": [{"Date of Admission": {"$gte": 1}}, {"Medical Condition": 1}]}
+        assert normalise({"$or": [{"Gender": "Male"}, {"Age": {"$lt": 18}}]}) != normalise({"$or": [{"Gender": "Male"}]})
+        assert normalise({"Blood Type": {"$in": ["O+", "A-", "B+"]}}) == normalise({"Blood Type": {"$in": ["O+"]}})
+        assert propose_index(normalise(query)) == [("Medical Condition", 1), ("Date of Admission", 1)]
@@ -0,0 +1,89 @@
+"""
+Tests unitaires de l'archivage par lots (src/archive.py)
+"""
+
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError
+
+from archive import archive_batch, archive_collection
+from fieldmap import DEFAULT_MAPPING, FieldMap
+from migrate import RetryPolicy
+
+NO_WAIT = RetryPolicy(max_retries=0, base_delay=0.0)
+
+
+class FakeCollection:
+    """Collection factice : insert_many scripté, delete_many enregistré"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.deleted = []
+
+    def insert_many(self, documents, ordered=True):
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in documents])
+
+    def delete_many(self, query):
+        self.deleted.append(query)
+        return SimpleNamespace(deleted_count=3)
+
+
+class CompactCollection(FakeCollection):
+    """Collection chaude factice en clés courtes : find filtre sur la clé de coupure stockée"""
+
+    def __init__(self, documents):
+        super().__init__()
+        self.name = "patient_records"
+        self.database = SimpleNamespace(list_collection_names=lambda: [self.name, "patient_records_archive"])
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, sort=None, limit=0):
+        self.queries.append(query)
+        after = query.get("_id", {}).get("$gt", -1)
+        return [doc for doc in self.documents if doc["_id"] > after
+                and all(doc.get(k, "9999") < v["$lt"] for k, v in query.items() if k != "_id")][:limit]
+
+
+class TestArchiveBatch:
+    """Copie puis suppression des _id copiés"""
+
+    def test_unit_delete_copied_ids_after_copy(self):
+        """Test Archive 1: suppression limitée aux _id copiés, pas à l'intervalle qu'ils couvrent"""
+        hot, archive = FakeCollection(), FakeCollection()
+        documents = [{"_id": i, "Discharge Date": "2019-05-01"} for i in (4, 7, 9)]
+        counts = archive_batch(hot, archive, documents, "Discharge Date", "2020-01-01", NO_WAIT)
+        assert counts == {"copied": 3, "deleted": 3, "errors": 0}
+        assert hot.deleted == [{"_id": {"$in": [4, 7, 9]}, "Discharge Date": {"$lt": "2020-01-01"}}]
+
+    def test_unit_failed_copy_keeps_hot_documents(self):
+        """Test Archive 2: une copie incomplète ne supprime rien"""
+        error = BulkWriteError({"nInserted": 2, "writeErrors": [
+            {"index": 1, "code": 121, "errmsg": "Document failed validation"}]})
+        hot = FakeCollection()
+        documents = [{"_id": i} for i in (1, 2, 3)]
+        counts = archive_batch(hot, FakeCollection(error), documents, "Discharge Date", "2020-01-01", NO_WAIT)
+        assert counts["errors"] == 1 and counts["deleted"] == 0
+        assert hot.deleted == []
+
+    def test_unit_resume_after_copy_without_delete(self):
+        """Test Archive 3: des documents déjà archivés (run interrompu) sont supprimés à la reprise"""
+        duplicate = BulkWriteError({"nInserted": 1, "writeErrors": [
+            {"index": 0, "code": 11000, "keyPattern": {"_id": 1}, "errmsg": "E11000 duplicate key"}]})
+        hot = FakeCollection()
+        counts = archive_batch(hot, FakeCollection(duplicate), [{"_id": 1}, {"_id": 2}],
+                               "Discharge Date", "2020-01-01", NO_WAIT)
+        assert counts["errors"] == 0 and counts["copied"] == 2
+        assert len(hot.deleted) == 1
+
+    def test_unit_cutoff_field_translated_on_compact_collection(self):
+        """Test Archive 4: sur une collection compacte, la coupure porte sur la clé courte"""
+        hot = CompactCollection([{"_id": i, "dd": f"2019-0{i}-01"} for i in (1, 2, 3)])
+        archive = CompactCollection([])
+        archive.name = "patient_records_archive"
+        totals = archive_collection(hot, archive, "2019-03-01", batch_size=1, retry=NO_WAIT,
+                                    fieldmap=FieldMap(DEFAULT_MAPPING))
+        assert hot.queries[0] == {"dd": {"$lt": "2019-03-01"}}
+        assert totals["batches"] == 2 and hot.deleted[0]["dd"] == {"$lt": "2019-03-01"}
@@ -0,0 +1,115 @@
+"""
+Tests unitaires du moteur de migration asyncio (src/async_engine.py)
+"""
+
+import asyncio
+import csv
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from async_engine import Checkpoint, insert_batch_async, migrate_async
+from coordinator import file_version, row_id
+from migrate import BatchProcessor, RetryPolicy, load_csv
+from quarantine import QuarantineWriter
+
+
+class ReplayedCollection:
+    """Collection factice : tous les documents sont déjà présents (doublons sur _id)"""
+
+    def __init__(self):
+        self.sent = []
+
+    def insert_many(self, documents, ordered=True):
+        self.sent.extend(documents)
+        raise BulkWriteError({"nInserted": 0, "writeErrors": [
+            {"index": i, "code": 11000, "errmsg": "E11000 duplicate key error index: _id_"}
+            for i in range(len(documents))]})
+
+
+class FlakyAsyncCollection:
+    """Collection factice du driver asynchrone : le premier envoi échoue (erreur réseau transitoire)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        if self.calls == 1:
+            raise AutoReconnect("connection reset")
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in documents])
+
+
+def write_patients(path, count):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "Date of Admission", "Medical Condition"])
+        for i in range(count):
+            writer.writerow([f"Patient {i}", "-1" if i % 7 == 0 else str(20 + i % 60), "2023-01-05", "Asthma"])
+
+
+class TestAsyncEngine:
+    """Point de reprise sans trou et résultats identiques au moteur synchrone"""
+
+    def test_unit_checkpoint_advances_on_gapless_batches(self, tmp_path):
+        """Test Async 1: un lot terminé en avance ne fait pas avancer le point de reprise"""
+        path = str(tmp_path / "checkpoint.json")
+        checkpoint = Checkpoint(path, "data.csv", 100, flush_seconds=0)
+        counts = {"rows": 100, "success": 90, "errors": 0, "rejected": 10}
+        checkpoint.done(1, counts)
+        assert checkpoint.batches == 0
+        checkpoint.done(0, counts)
+        assert checkpoint.batches == 2 and checkpoint.totals["success"] == 180
+        resumed = Checkpoint(path, "data.csv", 100)
+        resumed.load()
+        assert resumed.batches == 2 and resumed.totals == checkpoint.totals
+        with pytest.raises(ValueError):
+            Checkpoint(path, "data.csv", 500).load()
+
+    def test_unit_async_dry_run_matches_sync(self, tmp_path):
+        """Test Async 2: mêmes totaux et mêmes rejets que BatchProcessor.process, lot par lot"""
+        path = str(tmp_path / "data.csv")
+        write_patients(path, 250)
+        totals = {}
+        for engine in ("sync", "async"):
+            with QuarantineWriter(str(tmp_path / f"q_{engine}.jsonl")) as quarantine:
+                processor = BatchProcessor(None, quarantine, idempotent=True)
+                if engine == "async":
+                    asyncio.run(migrate_async(processor, path, 32, concurrency=4))
+                else:
+                    load_csv(processor, path, 32)
+            totals[engine] = processor.totals
+        assert totals["async"] == totals["sync"] == {"rows": 250, "success": 214, "errors": 0, "rejected": 36}
+        assert (tmp_path / "q_async.jsonl").read_text() == (tmp_path / "q_sync.jsonl").read_text()
+
+    def test_unit_duplicates_accepted_only_for_replayable_batches(self, tmp_path):
+        """Test Async 3: à la reprise, doublons acceptés sous la borne du run interrompu, erreurs au-delà"""
+        path = str(tmp_path / "data.csv")
+        write_patients(path, 40)
+        source = file_version(path) + "#row"
+        interrupted = Checkpoint(str(tmp_path / "checkpoint.json"), path, 10, reserve_batches=2)
+        interrupted.source = source
+        interrupted.batches = 1
+        interrupted.totals.update(rows=10, success=10)
+        interrupted.reserve(0)
+
+        checkpoint = Checkpoint(interrupted.path, path, 10)
+        checkpoint.load()
+        collection = ReplayedCollection()
+        processor = BatchProcessor(collection, retry=RetryPolicy(max_retries=0))
+        asyncio.run(migrate_async(processor, path, 10, categorical=None, concurrency=1, checkpoint=checkpoint))
+
+        assert collection.sent[0]["_id"] == row_id(source, 11)
+        assert processor.totals == {"rows": 40, "success": 20, "errors": 20, "rejected": 0}
+
+    def test_unit_async_insert_retries_through_shared_loop(self):
+        """Test Async 4: insert_batch_async renvoie le lot après une erreur transitoire (write_with_retry)"""
+        collection = FlakyAsyncCollection()
+        processor = BatchProcessor(None, retry=RetryPolicy(max_retries=2, base_delay=0.0))
+        documents = [{"_id": i} for i in range(3)]
+
+        counts = asyncio.run(insert_batch_async(collection, documents, [1, 2, 3], processor))
+
+        assert collection.calls == 2
+        assert counts == {"success": 3, "errors": 0, "retried": 3}
@@ -0,0 +1,68 @@
+"""
+Tests unitaires du moteur de cohortes en mémoire (src/cohort.py)
+"""
+
+import bson
+import numpy as np
+
+from cohort import BITMAP_MAX_VALUES, CohortEngine
+from fieldmap import DEFAULT_MAPPING, FieldMap
+
+
+class RawBatchCollection:
+    """Collection factice : find_raw_batches renvoie les documents projetés en un lot BSON"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find_raw_batches(self, filter, projection, batch_size=None):
+        wanted = [key for key, keep in projection.items() if keep]
+        return RawCursor([b"".join(bson.encode({k: doc[k] for k in wanted if k in doc}) for doc in self.documents)])
+
+
+class RawCursor(list):
+    def close(self):
+        pass
+
+
+class DimensionNames:
+    """Carte clé -> libellé à la manière de dimensions.DimensionCache"""
+
+    fields = ("Hospital",)
+
+    def __init__(self, names):
+        self.names = {"Hospital": names}
+
+
+class TestCohortEngine:
+    """Filtres par bitmaps ou par codes, export depuis le stockage compact"""
+
+    def test_unit_high_cardinality_columns_filter_on_codes(self):
+        """Test Cohort 1: pas de bitmap au-delà de BITMAP_MAX_VALUES, mêmes résultats que les bitmaps"""
+        size = 1000
+        hospitals = np.array([f"Hospital {i}" for i in range(BITMAP_MAX_VALUES + 44)])
+        categories = {
+            "Hospital": (hospitals, (np.arange(size) % len(hospitals)).astype(np.int32)),
+            "Gender": (np.array(["Male", "Female"]), (np.arange(size) % 2).astype(np.int32)),
+        }
+        engine = CohortEngine(size, categories, {"Age": np.arange(size, dtype=float) % 90}, 0.0)
+
+        assert "Hospital" not in engine._bitmaps and "Gender" in engine._bitmaps
+        assert engine.count({"Hospital": "Hospital 3"}) == 4
+        assert engine.count({"Hospital": {"$in": ["Hospital 3", "Hospital 4", "unknown"]}, "Gender": "Male"}) == 4
+        assert engine.count({"Hospital": "unknown"}) == 0
+        assert engine.group_by("Gender", {"Hospital": "Hospital 1", "Age": {"$lt": 50}}) == {"Female": 3}
+
+    def test_unit_export_reads_compact_names_and_dimension_keys(self):
+        """Test Cohort 2: clés courtes et clés de dimension ramenées aux noms et libellés d'origine"""
+        fieldmap = FieldMap(DEFAULT_MAPPING)
+        documents = [fieldmap.encode_document({"Gender": gender, "Hospital": key, "Age": age,
+                                               "Date of Admission": "2023-01-0" + str(day)})
+                     for gender, key, age, day in [("Male", 1, 30, 1), ("Female", 2, 40, 2), ("Male", 1, 50, 3)]]
+        engine = CohortEngine.from_collection(RawBatchCollection(documents), fieldmap=fieldmap,
+                                              dimensions=DimensionNames({1: "Kim Inc", 2: "Cook PLC"}))
+
+        assert engine.size == 3
+        assert engine.group_by("Hospital") == {"Kim Inc": 2, "Cook PLC": 1}
+        assert engine.count({"Gender": "Male", "Age": {"$gte": 40}}) == 1
+        assert engine.count({"Date of Admission": {"$gte": "2023-01-02"}}) == 2
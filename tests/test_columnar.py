@@ -0,0 +1,54 @@
+"""
+Tests unitaires du décodeur colonnaire de lots BSON bruts (src/columnar.py)
+Les lots sont encodés localement avec bson : aucun MongoDB requis
+"""
+
+import datetime
+
+import bson
+import numpy as np
+
+from columnar import decode_raw_batch
+
+
+def encode_batch(documents):
+    """Concaténer des documents BSON comme le fait find_raw_batches"""
+    return b"".join(bson.encode(doc) for doc in documents)
+
+
+class TestDecodeRawBatch:
+    """Décodage direct des champs projetés vers des colonnes NumPy"""
+
+    def test_unit_typed_columns(self):
+        """Test Columnar 1: chaque colonne reçoit le dtype NumPy adapté"""
+        raw = encode_batch([
+            {"Name": "Bobby", "Age": 30, "Billing Amount": 10.5, "Date": datetime.datetime(2022, 1, 2)},
+            {"Name": "Alice", "Age": 41, "Billing Amount": 3, "Date": datetime.datetime(2023, 5, 6)},
+        ])
+        columns = decode_raw_batch(raw, ["Name", "Age", "Billing Amount", "Date"])
+
+        assert list(columns["Name"]) == ["Bobby", "Alice"]
+        assert columns["Age"].dtype == np.int64
+        assert columns["Billing Amount"].dtype == np.float64
+        assert columns["Date"].dtype == np.dtype("datetime64[ms]")
+        assert columns["Date"][1] == np.datetime64("2023-05-06")
+
+    def test_unit_int64_columns_stay_numeric(self):
+        """Test Columnar 3: bson.Int64 (entiers hors int32) en int64, mêlés à des float en float64"""
+        raw = encode_batch([{"Count": bson.Int64(1 << 40), "Total": 1}, {"Count": 5, "Total": 2.5}])
+        columns = decode_raw_batch(raw, ["Count", "Total"])
+
+        assert columns["Count"].dtype == np.int64 and columns["Count"][0] == 1 << 40
+        assert columns["Total"].dtype == np.float64
+
+    def test_unit_missing_and_skipped_fields(self):
+        """Test Columnar 2: champs absents à None, champs non demandés ignorés"""
+        raw = encode_batch([
+            {"nested": {"a": [1, 2]}, "Gender": "Male", "blob": bson.Binary(b"xyz")},
+            {"Gender": None},
+            {"other": 1},
+        ])
+        columns = decode_raw_batch(raw, ["Gender", "nested"])
+
+        assert list(columns["Gender"]) == ["Male", None, None]
+        assert columns["nested"][0] == {"a": [1, 2]}
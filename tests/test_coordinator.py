@@ -0,0 +1,118 @@
+"""
+Tests unitaires du découpage en tranches de la migration coopérative (src/coordinator.py)
+"""
+
+import csv
+import os
+
+import coordinator
+from coordinator import file_version, job_id_for, plan_chunks, read_chunk_in_batches, row_id, run_coordinated
+from migrate import BatchProcessor
+from quarantine import RowLocation
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "Hospital"])
+        for i in range(rows):
+            writer.writerow([f"Patient {i}", str(20 + i % 60), f"Hospital, {i % 7}"])
+
+
+class TestChunks:
+    """Tranches d'octets alignées sur les lignes et _id déterministes"""
+
+    def test_unit_chunks_cover_every_row_once(self, tmp_path):
+        """Test Chunks 1: chaque ligne appartient à exactement une tranche, quelle que soit la taille"""
+        path = str(tmp_path / "data.csv")
+        write_csv(path, 500)
+        header, chunks = plan_chunks(path, 1000)
+        assert header == ["Name", "Age", "Hospital"] and len(chunks) > 5
+        names = []
+        for start, end in chunks:
+            for batch, _ in read_chunk_in_batches(path, header, start, end, 64, "data.csv"):
+                names += [row["Name"] for row in batch]
+        assert names == [f"Patient {i}" for i in range(500)]
+
+    def test_unit_ids_do_not_depend_on_chunking(self, tmp_path):
+        """Test Chunks 2: une tranche relue (autre découpage, autre instance) produit les mêmes _id"""
+        path = str(tmp_path / "data.csv")
+        write_csv(path, 200)
+        ids = {}
+        for chunk_bytes in (700, 5000):
+            header, chunks = plan_chunks(path, chunk_bytes)
+            ids[chunk_bytes] = [row["_id"] for start, end in chunks
+                                for batch, _ in read_chunk_in_batches(path, header, start, end, 50, "data.csv")
+                                for row in batch]
+        assert ids[700] == ids[5000]
+        assert len(set(ids[700])) == 200
+        assert row_id("data.csv", 0) != row_id("other.csv", 0)
+
+
+class ReclaimedChunk:
+    """Coordinateur factice : une seule tranche, déjà traitée jusqu'à done_to par une instance morte"""
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.worker_id = "worker-2"
+        self.job_id = "job"
+        self.completed = None
+
+    def register(self, chunks):
+        pass
+
+    def claim(self):
+        chunk, self.chunk = self.chunk, None
+        return chunk
+
+    def remaining(self):
+        return 0
+
+    def heartbeat(self, chunk_id):
+        return True
+
+    def progress(self, chunk_id, offset, counts):
+        return True
+
+    def complete(self, chunk_id, counts):
+        self.completed = counts
+        return True
+
+    def summary(self):
+        return {}
+
+
+class TestReclaim:
+    """Reprise d'une tranche après la dernière ligne traitée"""
+
+    def test_unit_reclaimed_chunk_resumes_after_recorded_progress(self, tmp_path, monkeypatch):
+        """Test Chunks 3: lignes déjà traitées ignorées, compteurs partiels cumulés, lignes repérées par fichier"""
+        path = str(tmp_path / "data.csv")
+        write_csv(path, 10)
+        header, chunks = plan_chunks(path, 1 << 20)
+        offsets = [offset for batch, rows in read_chunk_in_batches(path, header, *chunks[0], 100, "data.csv")
+                   for offset in rows]
+        chunk = {"_id": "job:000000", "start": chunks[0][0], "end": chunks[0][1], "attempts": 2,
+                 "done_to": offsets[5], "partial": {"rows": 6, "success": 6, "errors": 0, "rejected": 0}}
+        fake = ReclaimedChunk(chunk)
+        monkeypatch.setattr(coordinator, "ChunkCoordinator", lambda *args: fake)
+
+        seen, ids = [], []
+        processor = BatchProcessor(None, transforms=[
+            lambda batch: seen.extend(row["Name"] for row in batch) or ids.extend(row["_id"] for row in batch) or batch])
+        processed = []
+        original = processor.process
+        monkeypatch.setattr(processor, "process", lambda batch, rows: processed.extend(rows) or original(batch, rows))
+        run_coordinated(processor, None, path, batch_size=4)
+
+        assert seen == [f"Patient {i}" for i in range(6, 10)]
+        assert ids == [row_id(file_version(path), offset) for offset in offsets[6:]]
+        assert processed == [RowLocation(path, offset) for offset in offsets[6:]]
+        assert fake.completed == {"rows": 10, "success": 10, "errors": 0, "rejected": 0}
+
+    def test_unit_job_id_distinguishes_same_name_files(self, tmp_path):
+        """Test Chunks 4: deux fichiers de même nom et même taille ont des travaux distincts"""
+        for folder in ("a", "b"):
+            os.makedirs(tmp_path / folder)
+            write_csv(str(tmp_path / folder / "data.csv"), 5)
+        assert job_id_for(str(tmp_path / "a" / "data.csv"), 100) != job_id_for(str(tmp_path / "b" / "data.csv"), 100)
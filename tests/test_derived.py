@@ -0,0 +1,75 @@
+"""
+Tests unitaires des champs dérivés (src/derived.py)
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from derived import backfill, make_transform, parse_fields
+from fieldmap import DEFAULT_MAPPING, FieldMap
+
+
+def matches(doc, query):
+    """Sous-ensemble des filtres utilisés par backfill : $and, $or, $exists, $gt"""
+    for key, condition in query.items():
+        if key == "$and":
+            ok = all(matches(doc, clause) for clause in condition)
+        elif key == "$or":
+            ok = any(matches(doc, clause) for clause in condition)
+        elif "$exists" in condition:
+            ok = (key in doc) == condition["$exists"]
+        else:
+            ok = doc.get(key) is not None and doc[key] > condition["$gt"]
+        if not ok:
+            return False
+    return True
+
+
+class StoredCollection:
+    """Collection factice : filtres appliqués aux documents stockés, $set des bulk_write appliqués"""
+
+    def __init__(self, documents):
+        self.documents = {doc["_id"]: doc for doc in documents}
+        self.projections = []
+
+    def find(self, query, projection=None, sort=None, limit=0):
+        self.projections.append(projection)
+        found = [doc for _, doc in sorted(self.documents.items()) if matches(doc, query)][:limit]
+        return [{k: v for k, v in doc.items() if k in projection or k == "_id"} for doc in found]
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.documents[request._filter["_id"]].update(request._doc["$set"])
+        return SimpleNamespace(modified_count=len(requests))
+
+
+class TestDerivedFields:
+    """Calcul vectorisé par lot"""
+
+    def test_unit_derived_values(self):
+        """Test Derived 1: durée de séjour, année/mois, tranche d'âge ; champs incalculables omis"""
+        derive = make_transform(parse_fields("all"))
+        batch = derive([
+            {"Age": "45", "Date of Admission": "2023-12-28", "Discharge Date": "2024-01-04"},
+            {"Age": "abc", "Date of Admission": "", "Discharge Date": "2024-01-04"},
+        ])
+        assert {k: batch[0][k] for k in ("length_of_stay", "admission_year", "admission_month", "age_band")} == {
+            "length_of_stay": 7, "admission_year": 2023, "admission_month": 12, "age_band": "45-59"}
+        assert not {"length_of_stay", "admission_year", "age_band"} & set(batch[1])
+        with pytest.raises(ValueError):
+            parse_fields("length_of_stay,bmi")
+
+    def test_unit_backfill_reads_compact_collection(self):
+        """Test Derived 2: sources lues en clés courtes ; documents incalculables comptés"""
+        fieldmap = FieldMap(DEFAULT_MAPPING)
+        collection = StoredCollection([
+            {"_id": 1, "a": "45", "da": "2023-12-28", "dd": "2024-01-04"},
+            {"_id": 2, "a": "30", "da": "", "dd": "2024-01-04"},
+        ])
+        totals = backfill(collection, ["length_of_stay", "age_band"], batch_size=1, fieldmap=fieldmap)
+
+        assert set(collection.projections[0]) == {"a", "da", "dd"}
+        assert collection.documents[1]["length_of_stay"] == 7 and collection.documents[1]["age_band"] == "45-59"
+        assert collection.documents[2]["age_band"] == "30-44" and "length_of_stay" not in collection.documents[2]
+        assert totals == {"scanned": 2, "modified": 2, "errors": 0, "uncomputable": 1}
@@ -0,0 +1,137 @@
+"""
+Tests unitaires de la normalisation des dimensions (src/dimensions.py)
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from categorical import CategoryInterner
+from dimensions import (
+    DimensionEncoder,
+    dimension_collection_name,
+    dimensions_record,
+    forget_dimensions,
+    register_dimensions,
+)
+
+
+class DimensionCollection:
+    """Collection de dimension factice : index unique sur name simulé par insert_many"""
+
+    def __init__(self):
+        self.docs = []
+        self.error_code = 11000
+
+    def create_index(self, keys, unique=False):
+        pass
+
+    def find(self, filter, projection=None):
+        if "name" in filter:
+            return [doc for doc in self.docs if doc["name"] in filter["name"]["$in"]]
+        return list(self.docs)
+
+    def insert_many(self, documents, ordered=True):
+        names = {doc["name"] for doc in self.docs}
+        errors = [{"index": i, "code": self.error_code, "errmsg": "write error"}
+                  for i, doc in enumerate(documents) if doc["name"] in names]
+        self.docs.extend(doc for doc in documents if doc["name"] not in names)
+        if errors:
+            raise BulkWriteError({"nInserted": len(documents) - len(errors), "writeErrors": errors})
+
+
+class CounterCollection:
+    """schema_metadata factice : compteur $inc atomique"""
+
+    def __init__(self):
+        self.value = 0
+
+    def find_one_and_update(self, filter, update, upsert=False, return_document=None):
+        self.value += update["$inc"]["value"]
+        return {"_id": filter["_id"], "value": self.value}
+
+
+class MetadataCollection(dict):
+    """schema_metadata factice : documents par _id"""
+
+    def insert_one(self, document):
+        if document["_id"] in self:
+            raise DuplicateKeyError("E11000 duplicate key")
+        self[document["_id"]] = document
+
+    def find_one(self, filter):
+        return self.get(filter["_id"])
+
+    def replace_one(self, filter, document, upsert=False):
+        self[filter["_id"]] = document
+
+    def delete_many(self, filter):
+        deleted = self.pop(filter["_id"], None)
+        return SimpleNamespace(deleted_count=int(deleted is not None))
+
+
+class DimensionDatabase(dict):
+    def __missing__(self, name):
+        self[name] = CounterCollection() if name == "schema_metadata" else DimensionCollection()
+        return self[name]
+
+
+class TestDimensionEncoder:
+    """Clés de substitution attribuées en mémoire (sans serveur)"""
+
+    def test_unit_keys_are_stable_across_batches(self):
+        """Test Dimensions 1: un même libellé garde sa clé d'un lot à l'autre"""
+        encoder = DimensionEncoder(None, fields=("Hospital",))
+        first = encoder.encode_batch([{"Hospital": "Sons and Miller"}, {"Hospital": "Kim Inc"},
+                                      {"Hospital": "Sons and Miller"}])
+        second = encoder.encode_batch([{"Hospital": "Kim Inc"}, {"Hospital": "Cook PLC"}])
+        assert [doc["Hospital"] for doc in first] == [1, 2, 1]
+        assert [doc["Hospital"] for doc in second] == [2, 3]
+        assert dimension_collection_name("Insurance Provider") == "dim_insurance_provider"
+
+    def test_unit_categorical_codes_invalidated(self):
+        """Test Dimensions 2: les codes catégoriels d'une colonne encodée ne sont plus exposés"""
+        batch = CategoryInterner(["Insurance Provider", "Gender"]).encode(
+            [{"Insurance Provider": "Aetna", "Gender": "Male"}, {"Insurance Provider": "Cigna", "Gender": "Male"}])
+        DimensionEncoder(None, fields=("Insurance Provider",)).encode_batch(batch)
+        assert [doc["Insurance Provider"] for doc in batch] == [1, 2]
+        assert "Insurance Provider" not in batch.codes and list(batch.codes["Gender"]) == [0, 0]
+
+    def test_unit_concurrent_registration_reuses_existing_keys(self):
+        """Test Dimensions 3: libellé inséré entre-temps par un autre chargeur (E11000) -> sa clé est reprise"""
+        db = DimensionDatabase()
+        encoder = DimensionEncoder(db, fields=("Hospital",))
+        db["dim_hospital"].docs.append({"_id": 7, "name": "Kim Inc"})
+
+        batch = encoder.encode_batch([{"Hospital": "Sons and Miller"}, {"Hospital": "Kim Inc"}])
+
+        assert [doc["Hospital"] for doc in batch] == [1, 7]
+        assert encoder.keys["Hospital"] == {"Sons and Miller": 1, "Kim Inc": 7}
+        assert db["dim_hospital"].docs == [{"_id": 7, "name": "Kim Inc"}, {"_id": 1, "name": "Sons and Miller"}]
+
+    def test_unit_other_registration_errors_raised(self):
+        """Test Dimensions 4: une erreur d'insertion autre qu'un doublon est remontée"""
+        db = DimensionDatabase()
+        encoder = DimensionEncoder(db, fields=("Hospital",))
+        db["dim_hospital"].docs.append({"_id": 3, "name": "Cook PLC"})
+        db["dim_hospital"].error_code = 121
+        with pytest.raises(BulkWriteError):
+            encoder.encode_batch([{"Hospital": "Cook PLC"}])
+
+    def test_unit_encoded_columns_recorded(self):
+        """Test Dimensions 5: colonnes enregistrées ; collection en libellés ou autres colonnes refusées"""
+        metadata = MetadataCollection()
+        with pytest.raises(ValueError, match="full reload"):
+            register_dimensions(metadata, "patient_records", has_documents=True)
+        assert dimensions_record(metadata, "patient_records") is None
+
+        register_dimensions(metadata, "patient_records", ("Doctor", "Hospital"))
+        register_dimensions(metadata, "patient_records", ("Hospital", "Doctor"), has_documents=True)
+        with pytest.raises(ValueError, match="not Hospital"):
+            register_dimensions(metadata, "patient_records", ("Hospital",), has_documents=True)
+
+        register_dimensions(metadata, "patient_records", ("Hospital",), replace=True)
+        assert dimensions_record(metadata, "patient_records")["fields"] == ["Hospital"]
+        assert forget_dimensions(metadata, "patient_records") == 1
+        assert dimensions_record(metadata, "patient_records") is None
@@ -0,0 +1,30 @@
+"""
+Tests unitaires de l'encodage compact des noms de champs (src/fieldmap.py)
+"""
+
+from fieldmap import DEFAULT_MAPPING, FieldMap
+
+
+class TestFieldMap:
+    """Traduction noms longs <-> clés courtes"""
+
+    def test_unit_document_round_trip(self):
+        """Test FieldMap 1: encodage puis décodage restitue le document (_id inchangé)"""
+        fieldmap = FieldMap(DEFAULT_MAPPING)
+        doc = {"_id": 1, "Name": "Bobby", "Date of Admission": "2024-01-31", "Billing Amount": "18856.28"}
+        encoded = fieldmap.encode_document(doc)
+        assert encoded == {"_id": 1, "n": "Bobby", "da": "2024-01-31", "ba": "18856.28"}
+        assert fieldmap.decode_document(encoded) == doc
+
+    def test_unit_query_translation(self):
+        """Test FieldMap 2: filtres logiques, $expr, projections, tris et mises à jour"""
+        fieldmap = FieldMap(DEFAULT_MAPPING)
+        query = {"$or": [{"Medical Condition": "Asthma"}, {"Age": {"$gte": "60"}}],
+                 "$expr": {"$lt": ["$Date of Admission", "$Discharge Date"]}}
+        assert fieldmap.translate_filter(query) == {
+            "$or": [{"mc": "Asthma"}, {"a": {"$gte": "60"}}],
+            "$expr": {"$lt": ["$da", "$dd"]},
+        }
+        assert fieldmap.translate_projection({"Name": 1, "_id": 0}) == {"n": 1, "_id": 0}
+        assert fieldmap.translate_sort([("Date of Admission", -1)]) == [("da", -1)]
+        assert fieldmap.translate_update({"$set": {"Billing Amount": "1"}}) == {"$set": {"ba": "1"}}
@@ -0,0 +1,164 @@
+"""
+Tests de non-régression sur l'utilisation des index, pilotés par explain()
+Chaque forme de requête de production est enregistrée avec le plan attendu :
+un passage en COLLSCAN ou une explosion des clés ou documents examinés fait échouer
+le test. Les bornes portent sur les volumes examinés, pas sur le temps d'exécution
+(instable sur une CI partagée)
+"""
+
+import random
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import ServerSelectionTimeoutError
+
+from indexes import DEMO_INDEX_SPECS, ensure_indexes
+
+SEED_DOCUMENTS = 5000
+CONDITIONS = ["Cancer", "Obesity", "Diabetes", "Asthma", "Hypertension", "Arthritis"]
+
+# Formes de requêtes de production (src/crud_demo.py, tests d'intégrité, analyses)
+# - stage : étape d'accès attendue dans le plan gagnant
+# - max_keys_per_returned : plafond keysExamined / nReturned
+# - max_keys : plafond absolu de keysExamined (engagement de docs/database-schema.md)
+# - max_docs_per_returned : plafond docsExamined / nReturned (1 = aucun document lu inutilement)
+# - selective=False : requête non sélective connue, signalée (xfail strict) tant qu'elle
+#   parcourt tout l'index ; le test échoue si elle devient sélective sans mise à jour ici
+QUERY_SHAPES = [
+    {
+        "id": "patient_point_read",
+        "filter": {"patient_id": "P001234"},
+        "stage": "IXSCAN",
+        "max_keys_per_returned": 1,
+        "max_keys": 2,
+        "max_docs_per_returned": 1,
+    },
+    {
+        "id": "patient_prefix_regex",
+        "filter": {"patient_id": {"$regex": "^P0012"}},
+        "stage": "IXSCAN",
+        "max_keys_per_returned": 1,
+        "max_docs_per_returned": 1,
+    },
+    {
+        "id": "age_string_range",
+        "filter": {"age": {"$lt": "30"}},
+        "limit": 3,
+        "stage": "IXSCAN",
+        "max_keys_per_returned": 1,
+        "max_docs_per_returned": 1,
+    },
+    {
+        # $regex non ancré et insensible à la casse : aucune borne d'index possible,
+        # toutes les clés précédant les correspondances sont lues (non sélective)
+        "id": "diagnosis_regex_projection",
+        "filter": {"diagnosis": {"$regex": "Diabetes", "$options": "i"}},
+        "projection": {"patient_id": 1, "age": 1, "diagnosis": 1, "_id": 0},
+        "limit": 2,
+        "stage": "IXSCAN",
+        "max_keys_per_returned": 1,
+        "max_docs_per_returned": 1,
+        "selective": False,
+    },
+    {
+        "id": "completeness_by_name",
+        "filter": {"Name": "Patient 42"},
+        "stage": "IXSCAN",
+        "max_keys_per_returned": 1,
+        "max_docs_per_returned": 1,
+    },
+    {
+        "id": "condition_admission_range",
+        "filter": {"Medical Condition": "Asthma",
+                   "Date of Admission": {"$gte": "2022-01-01", "$lt": "2023-01-01"}},
+        "stage": "IXSCAN",
+        "max_keys_per_returned": 1,
+        "max_docs_per_returned": 1,
+    },
+]
+
+
+def seed_document(i, rng):
+    """Document synthétique combinant les champs CSV et ceux de la démonstration CRUD"""
+    condition = rng.choice(CONDITIONS)
+    return {
+        "patient_id": f"P{i:06d}",
+        "age": str(rng.randint(0, 99)),
+        "diagnosis": condition,
+        "Name": f"Patient {i}",
+        "Age": rng.randint(0, 99),
+        "Medical Condition": condition,
+        "Date of Admission": f"{rng.randint(2019, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    }
+
+
+def shape_param(shape):
+    """Paramètre pytest : les formes non sélectives sont signalées par un xfail strict"""
+    marks = []
+    if not shape.get("selective", True):
+        marks.append(pytest.mark.xfail(strict=True,
+                                       reason=f"{shape['id']}: requête non sélective (parcours d'index complet)"))
+    return pytest.param(shape, id=shape["id"], marks=marks)
+
+
+def plan_stages(plan):
+    """Lister les étapes d'un plan d'exécution (arbre inputStage / inputStages)"""
+    stages = [plan["stage"]]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+@pytest.fixture(scope="module")
+def seeded_collection(mongodb_connection_string, database_name):
+    """Collection dédiée, peuplée et indexée avec les index de production et de la démonstration CRUD"""
+    client = MongoClient(mongodb_connection_string, serverSelectionTimeoutMS=3000)
+    try:
+        client.admin.command("ping")
+    except ServerSelectionTimeoutError as e:
+        pytest.skip(f"MongoDB local indisponible: {e}")
+
+    db = client[f"{database_name}_explain_test"]
+    db.drop_collection("patient_records")
+    collection = db["patient_records"]
+    rng = random.Random(42)
+    collection.insert_many([seed_document(i, rng) for i in range(SEED_DOCUMENTS)])
+    ensure_indexes(collection)
+    ensure_indexes(collection, specs=DEMO_INDEX_SPECS)
+    yield collection
+    client.drop_database(db.name)
+    client.close()
+
+
+class TestIndexUsage:
+    """Plan gagnant et volumes examinés pour chaque forme de requête"""
+
+    @pytest.mark.parametrize("shape", [shape_param(shape) for shape in QUERY_SHAPES])
+    def test_query_shape_uses_index(self, seeded_collection, shape):
+        """Test Index: la forme de requête reste servie par un index"""
+        command = {"find": seeded_collection.name, "filter": shape["filter"]}
+        if "projection" in shape:
+            command["projection"] = shape["projection"]
+        if "limit" in shape:
+            command["limit"] = shape["limit"]
+        explain = seeded_collection.database.command("explain", command, verbosity="executionStats")
+
+        winning = explain["queryPlanner"]["winningPlan"]
+        stages = plan_stages(winning.get("queryPlan", winning))
+        stats = explain["executionStats"]
+        returned = max(stats["nReturned"], 1)
+
+        assert "COLLSCAN" not in stages, f"{shape['id']}: COLLSCAN ({stages})"
+        assert shape["stage"] in stages, f"{shape['id']}: {shape['stage']} absent ({stages})"
+        # +1 : clé supplémentaire lue pour constater la fin de l'intervalle
+        assert stats["totalKeysExamined"] <= shape["max_keys_per_returned"] * returned + 1, (
+            f"{shape['id']}: {stats['totalKeysExamined']} clés examinées pour {stats['nReturned']} retournés"
+        )
+        if "max_keys" in shape:
+            assert stats["totalKeysExamined"] <= shape["max_keys"], (
+                f"{shape['id']}: {stats['totalKeysExamined']} clés examinées > {shape['max_keys']}"
+            )
+        assert stats["totalDocsExamined"] <= shape["max_docs_per_returned"] * returned, (
+            f"{shape['id']}: {stats['totalDocsExamined']} documents examinés pour {stats['nReturned']} retournés"
+        )
@@ -0,0 +1,86 @@
+"""
+Tests unitaires du générateur de charge (src/loadgen.py)
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from loadgen import RUN_FIELD, Workload, parse_mix, run_load
+
+
+def make_workload(delay=0.0):
+    """Charge factice : chaque opération dort delay secondes"""
+    operations = {name: (lambda rng: time.sleep(delay)) for name in ("point_read", "update")}
+    return SimpleNamespace(run_id="test", operations=operations, check_mix=lambda mix: None)
+
+
+class PoolCollection:
+    """Collection factice : échantillon fixe, écritures enregistrées"""
+
+    name = "patient_records"
+
+    def __init__(self, condition="Asthma"):
+        self.calls = []
+        self.next_id = 100
+        self.condition = condition
+
+    def aggregate(self, pipeline):
+        return [{"_id": i, "Name": f"Patient {i}", "Medical Condition": self.condition} for i in range(3)]
+
+    def insert_one(self, doc):
+        self.calls.append("insert_one")
+        self.next_id += 1
+        return SimpleNamespace(inserted_id=self.next_id)
+
+    def insert_many(self, documents):
+        assert all(doc[RUN_FIELD] for doc in documents)
+        ids = list(range(self.next_id + 1, self.next_id + 1 + len(documents)))
+        self.next_id += len(documents)
+        return SimpleNamespace(inserted_ids=ids)
+
+    def update_one(self, filter, update):
+        self.calls.append(("update_one", filter["_id"]))
+
+    def delete_one(self, filter):
+        self.calls.append(("delete_one", filter["_id"]))
+
+
+class TestLoadgen:
+    """Mélange d'opérations et rapport de latences"""
+
+    def test_unit_parse_mix(self):
+        """Test Loadgen 1: poids par opération, opérations inconnues refusées"""
+        assert parse_mix("point_read=70, update=30") == {"point_read": 70.0, "update": 30.0}
+        with pytest.raises(ValueError):
+            parse_mix("scan=10")
+
+    def test_unit_open_loop_measures_from_intended_start(self):
+        """Test Loadgen 2: en boucle ouverte, l'attente derrière un serveur lent compte dans la latence"""
+        report = run_load(make_workload(delay=0.02), {"point_read": 1}, workers=1,
+                          duration=0.2, rate=200, open_loop=True)
+        line = report["operations"]["point_read"]
+        assert report["late_arrivals"] > 0
+        # Service 20ms mais arrivées toutes les 5ms : la file d'attente apparaît dans p99
+        assert line["p99_ms"] > 40
+
+    def test_unit_writes_use_preseeded_pool_or_are_skipped(self):
+        """Test Loadgen 3: mises à jour et suppressions sans insert mesuré ; pool épuisé -> opération sautée"""
+        collection = PoolCollection()
+        workload = Workload(collection, run_id="test")
+        assert workload.seed_pool(2, seed=1) == 2
+
+        report = run_load(workload, {"delete": 1}, workers=2, duration=0.05, seed=1)
+
+        assert sorted(collection.calls) == [("delete_one", 101), ("delete_one", 102)]
+        assert report["operations"]["delete"]["count"] == 2
+        assert report["skipped"]["delete"] > 0
+
+    def test_unit_mix_needing_conditions_refused_without_any(self):
+        """Test Loadgen 4: aucune "Medical Condition" échantillonnée -> lectures filtrées refusées d'emblée"""
+        workload = Workload(PoolCollection(condition=None), run_id="test")
+
+        with pytest.raises(ValueError, match="filtered_read"):
+            run_load(workload, {"point_read": 1, "filtered_read": 1}, workers=2, duration=0.05)
+        workload.check_mix({"point_read": 1, "update": 1})
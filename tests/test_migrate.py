@@ -0,0 +1,356 @@
+"""
+Tests unitaires des étapes de migration (src/migrate.py)
+Les collections factices simulent les réponses du serveur : aucun MongoDB requis
+"""
+
+import re
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+
+import migrate
+from fieldmap import DEFAULT_MAPPING, FieldMap
+from indexes import copy_index_definitions
+from migrate import RetryPolicy, insert_batch
+from quarantine import QuarantineWriter
+
+NO_WAIT = RetryPolicy(max_retries=2, base_delay=0.0)
+
+
+class InsertResult:
+    def __init__(self, ids):
+        self.inserted_ids = ids
+
+
+class ScriptedCollection:
+    """Collection factice : chaque appel à insert_many consomme une réponse scriptée"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def insert_many(self, documents, ordered=True):
+        self.calls.append([doc["Name"] for doc in documents])
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return InsertResult([None] * len(documents))
+
+
+def docs(*names):
+    return [{"Name": name} for name in names]
+
+
+class TestInsertBatch:
+    """Rattachement des writeErrors, reprises ciblées et dead-letter"""
+
+    def test_unit_only_retryable_subset_is_resent(self, tmp_path):
+        """Test Insert 1: seul le document en erreur transitoire est renvoyé"""
+        errors = BulkWriteError({"nInserted": 1, "writeErrors": [
+            {"index": 1, "code": 91, "errmsg": "shutdown in progress"},
+            {"index": 2, "code": 121, "errmsg": "Document failed validation"},
+        ]})
+        coll = ScriptedCollection([errors, None])
+        dead_letter = QuarantineWriter(str(tmp_path / "dead.jsonl"))
+
+        counts = insert_batch(coll, docs("a", "b", "c"), [10, 11, 12], dead_letter, NO_WAIT)
+        dead_letter.close()
+
+        assert coll.calls == [["a", "b", "c"], ["b"]]
+        assert counts == {"success": 2, "errors": 1, "retried": 1}
+        assert '"_row": 12' in (tmp_path / "dead.jsonl").read_text(encoding="utf-8")
+
+    def test_unit_network_error_retries_whole_batch(self):
+        """Test Insert 2: une coupure réseau ne fait pas perdre le lot"""
+        duplicate = BulkWriteError({"nInserted": 1, "writeErrors": [
+            {"index": 0, "code": 11000, "errmsg": "E11000 duplicate key", "keyPattern": {"_id": 1}},
+        ]})
+        coll = ScriptedCollection([AutoReconnect("connection reset"), duplicate])
+
+        counts = insert_batch(coll, docs("a", "b"), retry=NO_WAIT)
+
+        assert counts == {"success": 2, "errors": 0, "retried": 2}
+
+    def test_unit_retries_are_bounded(self):
+        """Test Insert 3: au-delà de max_retries, les documents sont en échec définitif"""
+        coll = ScriptedCollection([AutoReconnect("down")] * 3)
+
+        counts = insert_batch(coll, docs("a"), retry=NO_WAIT)
+
+        assert len(coll.calls) == 3
+        assert counts["errors"] == 1 and counts["success"] == 0
+
+
+class TestDryRun:
+    """Pipeline complet sans serveur MongoDB"""
+
+    def test_unit_dry_run_reports_stages(self, tmp_path, monkeypatch):
+        """Test Dry-run 1: lecture, validation et encodage BSON sans connexion"""
+        csv_path = tmp_path / "sample.csv"
+        csv_path.write_text(
+            "Name,Age,Gender,Medical Condition,Date of Admission,Discharge Date,Billing Amount\n"
+            "Bobby,30,Male,Cancer,2024-01-31,2024-02-02,100.5\n"
+            "Alice,130,Female,Asthma,2024-01-31,2024-02-02,10\n",
+            encoding="utf-8",
+        )
+        monkeypatch.setenv("MIGRATION_QUARANTINE_PATH", str(tmp_path / "quarantine.jsonl"))
+        monkeypatch.setenv("MIGRATION_DEAD_LETTER_PATH", str(tmp_path / "dead.jsonl"))
+
+        assert migrate.main(["migrate.py", str(csv_path), "--dry-run"]) == 0
+        assert (tmp_path / "quarantine.jsonl").read_text(encoding="utf-8").count("\n") == 1
+
+
+class StagingCollection:
+    """Collection factice pour le swap : comptage fixe, renommage dans la base factice"""
+
+    def __init__(self, db, name, count=0):
+        self.database = db
+        self.name = name
+        self.full_name = f"healthcare_db.{name}"
+        self.count = count
+
+    def count_documents(self, filter):
+        return self.count
+
+    def rename(self, new_name, dropTarget=False):
+        # Comme pymongo : l'objet garde son nom, seule la base change
+        assert dropTarget or new_name not in self.database.collections
+        self.database.collections[new_name] = self.database.collections.pop(self.name)
+
+
+class StagingDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def add(self, name, count=0):
+        self.collections[name] = StagingCollection(self, name, count)
+        return self.collections[name]
+
+    def list_collection_names(self, filter=None):
+        names = list(self.collections)
+        if filter is not None:
+            names = [name for name in names if re.match(filter["name"]["$regex"], name)]
+        return names
+
+    def drop_collection(self, name):
+        del self.collections[name]
+
+    def __getitem__(self, name):
+        # Collections annexes (schema_metadata...) : vides
+        return self.collections.get(name) or SchemaCollection(name)
+
+
+class TestFullReload:
+    """Vérification de la collection de staging et rétention des générations"""
+
+    def test_unit_verify_staging_rejects_partial_loads(self):
+        """Test Full reload 1: comptage différent ou échecs d'insertion -> pas de swap"""
+        staging = StagingDatabase().add("patient_records__staging_1", count=95)
+        totals = {"rows": 100, "success": 95, "errors": 0, "rejected": 5}
+        assert migrate.verify_staging(staging, totals)
+        assert not migrate.verify_staging(staging, {**totals, "rejected": 3})
+        # 2 documents en dead-letter : le comptage concorde mais le chargement est partiel
+        staging.count = 93
+        partial = {"rows": 100, "success": 93, "errors": 2, "rejected": 5}
+        assert not migrate.verify_staging(staging, partial)
+        assert migrate.verify_staging(staging, partial, max_errors=2)
+        staging.count = 0
+        assert not migrate.verify_staging(staging, {"rows": 0, "success": 0, "errors": 0, "rejected": 0})
+
+    def test_unit_swap_keeps_most_recent_generations(self, monkeypatch):
+        """Test Full reload 2: l'ancienne cible devient une génération, seules les N plus récentes restent"""
+        db = StagingDatabase()
+        for stamp in ("20240101000000", "20240201000000"):
+            db.add(f"patient_records__gen_{stamp}")
+        target = db.add("patient_records", count=10)
+        staging = db.add("patient_records__staging_20240301000000", count=12)
+        monkeypatch.setattr(migrate.time, "strftime", lambda fmt: "20240301000000")
+        migrate.swap_staging(staging, target, keep_generations=2)
+        assert sorted(db.collections) == ["patient_records", "patient_records__gen_20240201000000",
+                                          "patient_records__gen_20240301000000"]
+        assert db.collections["patient_records"] is staging
+        assert db.collections["patient_records__gen_20240301000000"] is target
+
+
+class SchemaCollection:
+    """Collection factice : documents (find_one) et index (list_indexes / create_indexes)"""
+
+    def __init__(self, name, documents=(), indexes=()):
+        self.name = name
+        self.documents = list(documents)
+        self.indexes = [{"v": 2, "key": {"_id": 1}, "name": "_id_"}] + list(indexes)
+        self.created = []
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        matches = [doc for doc in self.documents if all(doc.get(k) == v for k, v in (filter or {}).items())]
+        if sort:
+            (field, direction), = sort
+            matches.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return matches[0] if matches else None
+
+    def insert_one(self, doc):
+        if any(existing["_id"] == doc["_id"] for existing in self.documents):
+            raise DuplicateKeyError("E11000 duplicate key")
+        self.documents.append(doc)
+
+    def replace_one(self, filter, document, upsert=False):
+        self.documents = [doc for doc in self.documents if doc["_id"] != filter["_id"]] + [document]
+
+    def delete_many(self, filter):
+        kept = [doc for doc in self.documents if not all(doc.get(k) == v for k, v in filter.items())]
+        deleted, self.documents = len(self.documents) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def list_indexes(self):
+        return list(self.indexes)
+
+    def create_indexes(self, models):
+        self.created.extend(model.document["key"] for model in models)
+        return [model.document["name"] for model in models]
+
+
+class PartitionDatabase:
+    """Base factice : collections par nom"""
+
+    def __init__(self, collections):
+        self.collections = {collection.name: collection for collection in collections}
+
+    def add(self, collection):
+        self.collections[collection.name] = collection
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+class TestFieldMapSchema:
+    """Un seul schéma de clés par collection"""
+
+    def test_unit_append_refused_on_long_name_collection(self):
+        """Test Field map 1: append en clés courtes refusé sur une cible non vide sans mapping enregistré"""
+        target = SchemaCollection("patient_records", [{"_id": 1, "Name": "Bobby"}])
+        metadata = SchemaCollection("schema_metadata")
+        with pytest.raises(ValueError, match="full_reload"):
+            migrate.prepare_fieldmap(target, metadata, "append")
+        assert metadata.documents == []
+
+        # full_reload : mapping enregistré seulement après le swap (record_schema)
+        fieldmap = migrate.prepare_fieldmap(target, metadata, "full_reload")
+        assert fieldmap.short("Name") == "n" and metadata.documents == []
+        migrate.record_schema(metadata, target.name, fieldmap)
+        # Mapping enregistré : l'append reprend ce mapping
+        assert migrate.prepare_fieldmap(target, metadata, "append").to_short == fieldmap.to_short
+
+    def test_unit_partitions_checked_for_documents(self):
+        """Test Field map 3: en mode partitionné, une partition en noms longs suffit à refuser l'append"""
+        target = SchemaCollection("patient_records")
+        target.database = PartitionDatabase([target, SchemaCollection("patient_records_archive", [{"_id": 1}])])
+        metadata = SchemaCollection("schema_metadata")
+        assert migrate.prepare_fieldmap(target, metadata, "append", partitioned=True).short("Name") == "n"
+
+        metadata = SchemaCollection("schema_metadata")
+        target.database.add(SchemaCollection("patient_records_2023_04", [{"_id": 2, "Name": "Bobby"}]))
+        assert not migrate.target_has_documents(target)
+        with pytest.raises(ValueError, match="full_reload"):
+            migrate.prepare_fieldmap(target, metadata, "append", partitioned=True)
+
+    def test_unit_long_name_indexes_not_copied_to_compact_collection(self):
+        """Test Field map 2: seuls les index exprimés dans le schéma compact sont recopiés"""
+        source = SchemaCollection("patient_records", indexes=[
+            {"v": 2, "key": {"Medical Condition": 1, "Date of Admission": 1}, "name": "mc_da"},
+            {"v": 2, "key": {"mc": 1, "da": -1}, "name": "mc_da_desc"},
+            {"v": 2, "key": {"length_of_stay": 1}, "name": "los"},
+        ])
+        staging = SchemaCollection("patient_records__staging_1")
+        copy_index_definitions(source, staging, FieldMap(DEFAULT_MAPPING))
+        assert staging.created == [{"mc": 1, "da": -1}, {"length_of_stay": 1}]
+
+
+class ReloadClient:
+    """Client factice : ping accepté, fermeture enregistrée"""
+
+    def __init__(self):
+        self.admin = self
+        self.closed = False
+
+    def command(self, command):
+        return {"ok": 1}
+
+    def close(self):
+        self.closed = True
+
+
+def run_reload(monkeypatch, tmp_path, failed_files=(), env=None, metadata=None):
+    """main() en full_reload multi-fichiers contre des collections factices ; retourne (code, base, staging, swaps)"""
+    db = StagingDatabase()
+    if metadata is not None:
+        db.collections["schema_metadata"] = metadata
+    target = db.add("patient_records", count=5)
+    staging = db.add("patient_records__staging_1", count=5)
+    staging.dropped = False
+    staging.drop = lambda: setattr(staging, "dropped", True)
+    client = ReloadClient()
+    swaps = []
+    totals = {"rows": 5, "success": 5, "errors": 0, "rejected": 0}
+    for name, value in {"MIGRATION_MODE": "full_reload", "MIGRATION_QUARANTINE_PATH": str(tmp_path / "q.jsonl"),
+                        "MIGRATION_DEAD_LETTER_PATH": str(tmp_path / "dead.jsonl"), **(env or {})}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(migrate, "get_mongo_client", lambda: client)
+    monkeypatch.setattr(migrate, "get_target_collection", lambda c: target)
+    monkeypatch.setattr(migrate, "create_staging_collection", lambda t: staging)
+    monkeypatch.setattr(migrate, "expand_inputs", lambda specs, manifests: specs)
+    monkeypatch.setattr(migrate, "log_summary", lambda files: None)
+    monkeypatch.setattr(migrate, "ensure_indexes", lambda *args: [])
+    monkeypatch.setattr(migrate, "copy_index_definitions", lambda *args: [])
+    monkeypatch.setattr(migrate, "swap_staging", lambda *args: swaps.append(args))
+    monkeypatch.setattr(migrate, "run_multi_file", lambda *args, **kwargs: {
+        "metrics": migrate.StageMetrics(), "totals": totals, "failed_files": list(failed_files)})
+    code = migrate.main(["migrate.py", "a.csv", "b.csv"])
+    assert client.closed
+    return code, db, staging, swaps
+
+
+class TestReloadMain:
+    """Full reload de bout en bout (main) : swap et schéma enregistré"""
+
+    def test_unit_failed_file_drops_staging_without_swap(self, tmp_path, monkeypatch):
+        """Test Full reload 3: un fichier en échec -> staging supprimé, cible inchangée"""
+        code, db, staging, swaps = run_reload(monkeypatch, tmp_path, failed_files=["b.csv"])
+        assert code == 1 and staging.dropped and swaps == []
+
+    def test_unit_field_map_recorded_only_after_swap(self, tmp_path, monkeypatch):
+        """Test Full reload 4: mapping enregistré après le swap, supprimé par un rechargement en noms longs"""
+        metadata = SchemaCollection("schema_metadata")
+        monkeypatch.setattr(migrate, "verify_staging", lambda *args: False)
+        code, _, _, swaps = run_reload(monkeypatch, tmp_path, env={"MIGRATION_FIELD_MAP": "1"}, metadata=metadata)
+        assert code == 1 and swaps == [] and metadata.documents == []
+
+        monkeypatch.setattr(migrate, "verify_staging", lambda *args: True)
+        code, _, _, swaps = run_reload(monkeypatch, tmp_path, env={"MIGRATION_FIELD_MAP": "1"}, metadata=metadata)
+        assert code == 0 and len(swaps) == 1
+        assert [doc["kind"] for doc in metadata.documents] == ["fieldmap"]
+
+        monkeypatch.delenv("MIGRATION_FIELD_MAP")
+        code, _, _, swaps = run_reload(monkeypatch, tmp_path, metadata=metadata)
+        assert code == 0 and len(swaps) == 1 and metadata.documents == []
+
+    def test_unit_pseudonym_key_recorded_only_after_swap(self, tmp_path, monkeypatch):
+        """Test Full reload 5: empreinte de clé enregistrée après le swap, remplacée par une nouvelle clé"""
+        metadata = SchemaCollection("schema_metadata")
+        env = {"MIGRATION_PSEUDONYMISE": "Name", "MIGRATION_PSEUDONYM_KEY": "first-key"}
+        monkeypatch.setattr(migrate, "verify_staging", lambda *args: False)
+        code, _, _, swaps = run_reload(monkeypatch, tmp_path, env=env, metadata=metadata)
+        assert code == 1 and swaps == [] and metadata.documents == []
+
+        monkeypatch.setattr(migrate, "verify_staging", lambda *args: True)
+        code, _, _, swaps = run_reload(monkeypatch, tmp_path, env=env, metadata=metadata)
+        first, = metadata.documents
+        assert code == 0 and len(swaps) == 1 and first["fields"] == ["Name"]
+
+        env["MIGRATION_PSEUDONYM_KEY"] = "second-key"
+        code, _, _, swaps = run_reload(monkeypatch, tmp_path, env=env, metadata=metadata)
+        second, = metadata.documents
+        assert code == 0 and second["fingerprint"] != first["fingerprint"]
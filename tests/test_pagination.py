@@ -0,0 +1,72 @@
+"""
+Tests unitaires de la pagination par clé (src/pagination.py)
+"""
+
+import datetime
+
+import pytest
+from bson import ObjectId
+
+from pagination import decode_token, encode_token, fetch_page, keyset_filter
+
+
+class ProjectingCollection:
+    """Collection factice : documents triés par _id, projection inclusive appliquée"""
+
+    def __init__(self, count):
+        self.documents = [{"_id": i, "Name": f"Patient {i}", "Age": 20 + i} for i in range(count)]
+        self.projections = []
+
+    def find(self, query, projection=None, sort=None, limit=0):
+        self.projections.append(projection)
+        after = query.get("_id", {}).get("$gt", -1)
+        docs = [doc for doc in self.documents if doc["_id"] > after][:limit]
+        if projection and any(projection.values()):
+            return [{k: v for k, v in doc.items() if projection.get(k)} for doc in docs]
+        return [{k: v for k, v in doc.items() if k not in (projection or {})} for doc in docs]
+
+
+class TestKeyset:
+    """Filtres de reprise et jetons opaques"""
+
+    def test_unit_keyset_filter_handles_nulls(self):
+        """Test Pagination 1: reprise après une valeur, après null, et en ordre décroissant"""
+        oid = ObjectId()
+        assert keyset_filter([("_id", 1)], [oid]) == {"_id": {"$gt": oid}}
+        sort = [("Date of Admission", 1), ("_id", 1)]
+        assert keyset_filter(sort, ["2023-01-01", oid]) == {"$or": [
+            {"Date of Admission": {"$gt": "2023-01-01"}},
+            {"Date of Admission": "2023-01-01", "_id": {"$gt": oid}},
+        ]}
+        # Dernière page dans le bloc des null : les dates non nulles suivent
+        assert keyset_filter(sort, [None, oid]) == {"$or": [
+            {"Date of Admission": {"$ne": None}},
+            {"Date of Admission": None, "_id": {"$gt": oid}},
+        ]}
+        descending = [("Billing Amount", -1), ("_id", 1)]
+        assert keyset_filter(descending, [10.5, oid]) == {"$or": [
+            {"$or": [{"Billing Amount": {"$lt": 10.5}}, {"Billing Amount": None}]},
+            {"Billing Amount": 10.5, "_id": {"$gt": oid}},
+        ]}
+        assert keyset_filter(descending, [None, oid]) == {"Billing Amount": None, "_id": {"$gt": oid}}
+
+    def test_unit_token_round_trip(self):
+        """Test Pagination 2: les valeurs BSON survivent au jeton, un jeton corrompu est refusé"""
+        values = [datetime.datetime(2023, 1, 2), None, ObjectId(), 42]
+        assert decode_token(encode_token(values)) == values
+        with pytest.raises(ValueError):
+            decode_token("not-a-token")
+
+    def test_unit_sort_keys_always_projected(self):
+        """Test Pagination 3: _id exclu par la projection mais projeté pour le jeton, pages complètes"""
+        collection = ProjectingCollection(5)
+        names, token = [], None
+        while True:
+            page, token = fetch_page(collection, page_size=2, resume_token=token, projection={"Name": 1, "_id": 0})
+            names += [doc["Name"] for doc in page]
+            if token is None:
+                break
+        assert names == [f"Patient {i}" for i in range(5)]
+        assert collection.projections[0] == {"Name": 1, "_id": 1}
+        fetch_page(collection, page_size=2, projection={"_id": 0, "Age": 0})
+        assert collection.projections[-1] == {"Age": 0}
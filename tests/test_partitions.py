@@ -0,0 +1,77 @@
+"""
+Tests unitaires du partitionnement temporel (src/partitions.py)
+"""
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from migrate import RetryPolicy, insert_batch
+from partitions import PartitionedCollection
+
+
+class FakeCollection:
+    """Collection factice : documents en mémoire, _id dupliqués rejetés"""
+
+    def __init__(self, name):
+        self.full_name = f"healthcare_db.{name}"
+        self.documents = {}
+
+    def create_indexes(self, models):
+        return [f"index_{i}" for i, _ in enumerate(models)]
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        for i, doc in enumerate(documents):
+            if doc["_id"] in self.documents:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key", "keyPattern": {"_id": 1}})
+            else:
+                self.documents[doc["_id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection(name)
+        return self[name]
+
+    def list_collection_names(self):
+        return list(self)
+
+
+class TestPartitions:
+    """Routage des lots par période et élagage des partitions à la lecture"""
+
+    def test_unit_batches_are_routed_by_admission_period(self):
+        """Test Partitions 1: un document par partition, erreurs ramenées aux index du lot"""
+        db = FakeDatabase()
+        partitions = PartitionedCollection(db, "patient_records", "year")
+        documents = [{"_id": i, "Date of Admission": date}
+                     for i, date in enumerate(["2023-04-01", "2019-12-31", "", "2023-11-05"])]
+        counts = insert_batch(partitions, documents, retry=RetryPolicy(max_retries=0))
+        assert counts["success"] == 4
+        assert {name: sorted(c.documents) for name, c in db.items()} == {
+            "patient_records_2023": [0, 3], "patient_records_2019": [1], "patient_records_undated": [2]}
+        duplicate = [{"_id": 10, "Date of Admission": "2020-01-01"}, {"_id": 3, "Date of Admission": "2023-11-05"}]
+        with pytest.raises(BulkWriteError) as raised:
+            partitions.insert_many(duplicate)
+        assert [err["index"] for err in raised.value.details["writeErrors"]] == [1]
+        assert raised.value.details["nInserted"] == 1
+        partitions.close()
+
+    def test_unit_date_predicates_prune_partitions(self):
+        """Test Partitions 2: seules les partitions de la période demandée sont interrogées"""
+        db = FakeDatabase()
+        for name in ("patient_records_2019_05", "patient_records_2020_01", "patient_records_2020_07",
+                     "patient_records_undated", "patient_records_archive"):
+            db[name]
+        partitions = PartitionedCollection(db, "patient_records", "month")
+        assert partitions.partitions_for({}) == ["patient_records_2019_05", "patient_records_2020_01",
+                                               "patient_records_2020_07", "patient_records_undated"]
+        query = {"$and": [{"Date of Admission": {"$gte": "2020-01-15"}}, {"Gender": "Female"}]}
+        assert partitions.partitions_for(query) == ["patient_records_2020_01", "patient_records_2020_07"]
+        assert partitions.partitions_for({"Date of Admission": {"$in": ["2019-05-02", "2021-01-01"]}}) == [
+            "patient_records_2019_05"]
+        assert partitions.drop_before("2020-03-01", dry_run=True) == ["patient_records_2019_05",
+                                                                      "patient_records_2020_01"]
+        partitions.close()
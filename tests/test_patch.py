@@ -0,0 +1,112 @@
+"""
+Tests unitaires de l'application des fichiers de corrections (src/patch.py)
+"""
+
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from dimensions import DimensionEncoder
+from fieldmap import DEFAULT_MAPPING, FieldMap
+from migrate import RetryPolicy
+from patch import PatchApplier, apply_updates, build_requests, group_changes
+from pseudonymise import Pseudonymiser
+
+OID = "65f0a1b2c3d4e5f601234567"
+
+
+class RecordingCollection:
+    """Collection factice : bulk_write enregistre les requêtes, seules les clés connues correspondent"""
+
+    def __init__(self, known, documents=(), errors=()):
+        self.known = set(known)
+        self.documents = list(documents)
+        self.errors = list(errors)
+        self.requests = []
+
+    def bulk_write(self, requests, ordered=True):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.requests.extend(requests)
+        matched = sum(1 for r in requests if next(iter(r._filter.values())) in self.known)
+        return SimpleNamespace(matched_count=matched, modified_count=matched)
+
+    def find(self, filter, projection=None, **kwargs):
+        (field, condition), = filter.items()
+        return [{k: v for k, v in doc.items() if k in projection or k == "_id"}
+                for doc in self.documents if doc.get(field) in condition["$in"]]
+
+
+class TestPatch:
+    """Regroupement par clé et comptes matched / modified / not_found"""
+
+    def test_unit_changes_merged_in_file_order(self):
+        """Test Patch 1: la dernière correction d'un champ l'emporte, $unset compris"""
+        batch = [
+            {"Room Number": "P1", "Age": "40", "Doctor": ""},
+            {"Room Number": "P2", "Age": "", "Doctor": "__UNSET__"},
+            {"Room Number": "P1", "Age": "41", "Doctor": "__UNSET__"},
+            {"Room Number": "", "Age": "50", "Doctor": ""},
+        ]
+        grouped, without_key = group_changes(batch, [1, 2, 3, 4], "Room Number")
+        assert without_key == [4]
+        _, keys, updates = build_requests(grouped, "Room Number")
+        assert keys == ["P1", "P2"]
+        assert updates == [{"$set": {"Age": "41"}, "$unset": {"Doctor": ""}}, {"$unset": {"Doctor": ""}}]
+
+    def test_unit_counts(self):
+        """Test Patch 2: une requête par clé, clés inconnues comptées not_found"""
+        collection = RecordingCollection(known=[ObjectId(OID)])
+        applier = PatchApplier(collection)
+        applier.process([{"_id": OID, "Age": "40"}, {"_id": "7", "Age": "41"}, {"_id": OID, "Gender": "Female"},
+                         {"_id": "not-an-id", "Age": "42"}])
+        assert [r._filter for r in collection.requests] == [{"_id": ObjectId(OID)}, {"_id": 7}, {"_id": "not-an-id"}]
+        assert applier.totals["matched"] == 1 and applier.totals["not_found"] == 2
+
+    def test_unit_invalid_keys_skipped_for_explicit_key_type(self):
+        """Test Patch 3: une clé non convertible vers --key-type compte comme ligne ignorée"""
+        grouped, without_key = group_changes([{"_id": "abc", "Age": "1"}, {"_id": "12", "Age": "2"}], [1, 2],
+                                             "_id", key_type="int")
+        assert list(grouped) == [12] and without_key == [1]
+
+    def test_unit_corrections_follow_collection_schema(self):
+        """Test Patch 4: clés courtes, clés de dimension et champs dérivés recalculés dans le $set"""
+        fieldmap = FieldMap(DEFAULT_MAPPING)
+        stored = {"_id": ObjectId(OID), "a": "40", "da": "2023-01-01", "dd": "2023-01-05", "length_of_stay": 4}
+        collection = RecordingCollection(known=[ObjectId(OID)], documents=[stored])
+        applier = PatchApplier(collection, fieldmap=fieldmap, dimensions=DimensionEncoder(None),
+                               derived=["length_of_stay", "age_band"])
+        applier.process([{"_id": OID, "Discharge Date": "2023-01-10", "Hospital": "Kim Inc"},
+                         {"_id": OID, "Age": "__UNSET__"}])
+
+        (request,) = collection.requests
+        assert request._filter == {"_id": ObjectId(OID)}
+        assert request._doc == {"$set": {"dd": "2023-01-10", "h": 1, "length_of_stay": 9},
+                                "$unset": {"a": "", "age_band": ""}}
+
+    def test_unit_transient_errors_retried(self):
+        """Test Patch 5: erreur transitoire renvoyée, erreur définitive en échec"""
+        transient = BulkWriteError({"nMatched": 1, "nModified": 1, "writeErrors": [
+            {"index": 1, "code": 91, "errmsg": "shutting down"},
+            {"index": 2, "code": 121, "errmsg": "Document failed validation"}]})
+        collection = RecordingCollection(known=[1, 2, 3], errors=[transient])
+        requests, _, _ = build_requests({key: {"set": {"Age": "1"}, "unset": {}} for key in (1, 2, 3)}, "_id")
+        result = apply_updates(collection, requests, RetryPolicy(max_retries=1, base_delay=0.0))
+        assert [r._filter for r in collection.requests] == [{"_id": 2}]
+        assert result["matched"] == 2 and result["failed"] == [2] and "121" in result["last_error"][2]
+
+    def test_unit_pseudonymised_columns_hashed(self):
+        """Test Patch 6: valeurs et clé des colonnes pseudonymisées hachées avec la clé de la collection"""
+        pseudonymiser = Pseudonymiser(b"key-1", ["Name", "Doctor"])
+        known = pseudonymiser.pseudonym("Bobby Jackson")
+        collection = RecordingCollection(known=[known])
+        applier = PatchApplier(collection, key_field="Name", pseudonymiser=pseudonymiser)
+        applier.process([{"Name": "bobby  JACKSON", "Doctor": "Matthew Smith", "Age": "41"},
+                         {"Name": "Bobby Jackson", "Doctor": "__UNSET__"}])
+
+        (request,) = collection.requests
+        assert request._filter == {"Name": known}
+        assert request._doc == {"$set": {"Age": "41"}, "$unset": {"Doctor": ""}}
+        applier.process([{"Name": "Bobby Jackson", "Doctor": "Matthew Smith"}])
+        assert collection.requests[-1]._doc == {"$set": {"Doctor": pseudonymiser.pseudonym("Matthew Smith")}}
@@ -0,0 +1,65 @@
+"""
+Tests unitaires de la pseudonymisation à clé (src/pseudonymise.py)
+"""
+
+import csv
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from pseudonymise import Pseudonymiser, key_record, register_key, rotation_map
+
+
+class MetadataCollection(dict):
+    """schema_metadata factice : documents par _id"""
+
+    def insert_one(self, document):
+        if document["_id"] in self:
+            raise DuplicateKeyError("E11000 duplicate key")
+        self[document["_id"]] = document
+
+    def find_one(self, filter):
+        return self.get(filter["_id"])
+
+    def replace_one(self, filter, document, upsert=False):
+        self[filter["_id"]] = document
+
+
+class TestPseudonymise:
+    """Pseudonymes stables par clé, cache et correspondances de rotation"""
+
+    def test_unit_batch_pseudonyms_are_keyed_and_cached(self):
+        """Test Pseudonymise 1: même nom -> même pseudonyme (casse ignorée), autre clé -> autre pseudonyme"""
+        pseudonymiser = Pseudonymiser(b"key-1", ("Name", "Doctor"))
+        batch = [{"Name": "Bobby JacksOn", "Doctor": "Dr A"}, {"Name": "bobby  jackson", "Doctor": ""},
+                 {"Name": "Leslie Terry"}]
+        pseudonymiser.pseudonymise_batch(batch)
+        assert batch[0]["Name"] == batch[1]["Name"] != batch[2]["Name"]
+        assert len(batch[0]["Name"]) == 32 and batch[1]["Doctor"] == "" and "Doctor" not in batch[2]
+        assert batch[0]["Name"] != Pseudonymiser(b"key-2").pseudonym("Bobby Jackson")
+        pseudonymiser.pseudonymise_batch([{"Name": "Leslie Terry"}])
+        assert pseudonymiser.cache_info().hits == 1
+
+    def test_unit_rotation_map_from_sources(self, tmp_path):
+        """Test Pseudonymise 2: la table de rotation relie ancien et nouveau pseudonyme de chaque valeur source"""
+        path = tmp_path / "data.csv"
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows([["Name", "Age"], ["Alice Doe", "30"], ["Bob Roe", "40"], ["Alice Doe", "31"]])
+        old, new = Pseudonymiser(b"old"), Pseudonymiser(b"new")
+        mapping = rotation_map([str(path)], ["Name"], old, new)
+        assert mapping == {"Name": {old.pseudonym(name): new.pseudonym(name) for name in ("Alice Doe", "Bob Roe")}}
+
+    def test_unit_key_registration_never_mixes_schemes(self):
+        """Test Pseudonymise 3: première clé refusée sur une collection en clair, autre clé ou autres champs refusés ensuite"""
+        metadata = MetadataCollection()
+        with pytest.raises(ValueError, match="plain-text"):
+            register_key(metadata, "patient_records", Pseudonymiser(b"key-1"), has_documents=True)
+        assert key_record(metadata, "patient_records") is None
+
+        register_key(metadata, "patient_records", Pseudonymiser(b"key-1"))
+        register_key(metadata, "patient_records", Pseudonymiser(b"key-1"), has_documents=True)
+        with pytest.raises(ValueError, match="another key"):
+            register_key(metadata, "patient_records", Pseudonymiser(b"key-2"), has_documents=True)
+        with pytest.raises(ValueError, match="not Name, Doctor"):
+            register_key(metadata, "patient_records", Pseudonymiser(b"key-1", ["Name", "Doctor"]))
+        assert key_record(metadata, "patient_records")["fingerprint"] == Pseudonymiser(b"key-1").fingerprint
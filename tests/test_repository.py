@@ -0,0 +1,109 @@
+"""
+Tests unitaires du repository d'écriture groupée (src/repository.py)
+Une collection factice enregistre les appels bulk_write : aucun MongoDB requis
+"""
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
+
+from repository import BulkWriteRepository
+
+
+class FakeResult:
+    upserted_ids = {}
+
+
+class FakeCollection:
+    """Collection minimale qui mémorise chaque appel à bulk_write"""
+
+    def __init__(self, write_errors=None):
+        self.calls = []
+        self.write_errors = write_errors or []
+
+    def bulk_write(self, requests, ordered=True):
+        self.calls.append((requests, ordered))
+        if self.write_errors:
+            errors, self.write_errors = self.write_errors, []
+            raise BulkWriteError({"writeErrors": errors, "upserted": []})
+        return FakeResult()
+
+
+class TestBulkWriteRepository:
+    """Fusion des écritures et résolution des Futures"""
+
+    def test_unit_successive_sets_are_merged(self):
+        """Test Repo 1: deux $set sur la même clé donnent un seul UpdateOne"""
+        coll = FakeCollection()
+        repo = BulkWriteRepository(coll, max_delay=0)
+        f1 = repo.set_fields("P1", {"diagnosis": "A"})
+        f2 = repo.set_fields("P1", {"status": "Traité"})
+        repo.flush()
+
+        assert len(coll.calls) == 1
+        requests, ordered = coll.calls[0]
+        assert ordered is False
+        assert requests == [UpdateOne({"patient_id": "P1"}, {"$set": {"diagnosis": "A", "status": "Traité"}})]
+        assert f1.result().operation == "update"
+        assert f2.done()
+
+    def test_unit_set_after_insert_folds_into_document(self):
+        """Test Repo 2: un $set sur un document en attente d'insertion modifie l'insertion"""
+        coll = FakeCollection()
+        repo = BulkWriteRepository(coll, max_delay=0)
+        document = {"patient_id": "P2", "age": "42"}
+        fut = repo.insert(document)
+        repo.set_fields("P2", {"age": "43"})
+        repo.flush()
+
+        requests, _ = coll.calls[0]
+        assert len(requests) == 1
+        assert isinstance(requests[0], InsertOne)
+        assert requests[0]._doc["age"] == "43"
+        assert document["age"] == "42"
+        assert fut.result().inserted_id is not None
+
+    def test_unit_same_key_ops_are_split_in_rounds(self):
+        """Test Repo 3: insertion puis suppression de la même clé restent ordonnées"""
+        coll = FakeCollection()
+        repo = BulkWriteRepository(coll, max_delay=0)
+        repo.insert({"patient_id": "P3"})
+        repo.insert({"patient_id": "P4"})
+        repo.delete({"patient_id": "P3"})
+        repo.flush()
+
+        assert [len(requests) for requests, _ in coll.calls] == [2, 1]
+
+    def test_unit_size_threshold_triggers_flush(self):
+        """Test Repo 4: le seuil max_ops vide le tampon sans flush explicite"""
+        coll = FakeCollection()
+        repo = BulkWriteRepository(coll, max_ops=2, max_delay=0)
+        repo.insert({"patient_id": "P5"})
+        assert coll.calls == []
+        repo.insert({"patient_id": "P6"})
+        assert len(coll.calls) == 1
+
+    def test_unit_write_error_is_routed_to_its_future(self):
+        """Test Repo 5: une erreur d'écriture n'échoue que l'opération concernée"""
+        coll = FakeCollection(write_errors=[{"index": 1, "code": 11000, "errmsg": "duplicate key"}])
+        repo = BulkWriteRepository(coll, max_delay=0)
+        ok = repo.insert({"patient_id": "P7"})
+        ko = repo.insert({"patient_id": "P8"})
+        repo.flush()
+
+        assert ok.result().operation == "insert"
+        with pytest.raises(WriteError):
+            ko.result()
+
+    def test_unit_conflicting_paths_are_not_merged(self):
+        """Test Repo 6: un chemin et son parent restent dans deux requêtes successives"""
+        coll = FakeCollection()
+        repo = BulkWriteRepository(coll, max_delay=0)
+        repo.set_fields("P1", {"address": {"city": "Lyon"}})
+        repo.set_fields("P1", {"address.zip": "69001"})
+        repo.flush()
+
+        assert [requests for requests, _ in coll.calls] == [
+            [UpdateOne({"patient_id": "P1"}, {"$set": {"address": {"city": "Lyon"}}})],
+            [UpdateOne({"patient_id": "P1"}, {"$set": {"address.zip": "69001"}})],
+        ]
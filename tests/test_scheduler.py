@@ -0,0 +1,87 @@
+"""
+Tests unitaires de l'ingestion multi-fichiers (src/scheduler.py)
+"""
+
+import csv
+import json
+import os
+
+from pymongo.errors import BulkWriteError
+
+from migrate import BatchProcessor, RetryPolicy
+from quarantine import QuarantineWriter
+from scheduler import WorkStealingQueues, WorkUnit, expand_inputs, run_multi_file
+
+
+def unit(path, size, index=0):
+    return WorkUnit(path, ["Name"], 0, size, index)
+
+
+class TestScheduler:
+    """Développement des entrées et répartition des unités entre workers"""
+
+    def test_unit_expand_inputs(self, tmp_path):
+        """Test Scheduler 1: répertoires, globs et manifestes développés sans doublon"""
+        for name in ("a.csv", "b.csv", "notes.txt"):
+            (tmp_path / name).write_text("Name\nx\n", encoding="utf-8")
+        (tmp_path / "files.txt").write_text("# lot du jour\nb.csv\n\nother.csv\n", encoding="utf-8")
+        files = expand_inputs([str(tmp_path), str(tmp_path / "*.csv")], [str(tmp_path / "files.txt")])
+        assert [os.path.basename(path) for path in files] == ["a.csv", "b.csv", "other.csv"]
+
+    def test_unit_idle_worker_steals_from_most_loaded(self):
+        """Test Scheduler 2: chaque unité est servie une fois, un worker inactif vole la plus petite"""
+        units = [unit("big.csv", 100, i) for i in range(3)] + [unit("small.csv", 10)]
+        queues = WorkStealingQueues(sorted(units, key=lambda u: u.size, reverse=True), 2)
+        served = [queues.next(0), queues.next(0)]
+        assert queues.next(0) == unit("small.csv", 10) and queues.steals == 1
+        served.append(queues.next(1))
+        assert queues.next(0) is None and queues.next(1) is None
+        assert sorted(served + [unit("small.csv", 10)]) == sorted(units)
+
+    def test_unit_unit_errors_are_recorded_and_rows_traced(self, tmp_path):
+        """Test Scheduler 3: toute erreur d'unité marque le fichier en échec ; dead-letter tracé par fichier et position"""
+        good, bad = str(tmp_path / "good.csv"), str(tmp_path / "bad.csv")
+        with open(good, "w", encoding="utf-8") as f:
+            f.write("Name\nAlice\nBob\n")
+        with open(bad, "w", encoding="utf-8") as f:
+            f.write("Name\nboom\n")
+
+        def transform(batch):
+            if any(row["Name"] == "boom" for row in batch):
+                raise csv.Error("field larger than field limit")
+            return batch
+
+        class RejectingCollection:
+            """Refus définitif (validation du schéma) de la ligne Bob"""
+
+            def insert_many(self, documents, ordered=False):
+                errors = [{"index": i, "code": 121, "errmsg": "Document failed validation"}
+                          for i, doc in enumerate(documents) if doc["Name"] == "Bob"]
+                if errors:
+                    raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+        with QuarantineWriter(str(tmp_path / "dead.jsonl")) as dead_letter:
+            summary = run_multi_file(
+                [good, bad], lambda metrics: BatchProcessor(RejectingCollection(), dead_letter=dead_letter,
+                                                            retry=RetryPolicy(max_retries=0), metrics=metrics,
+                                                            transforms=[transform]),
+                batch_size=10, workers=2)
+        assert summary["failed_files"] == [bad]
+        assert summary["files"][1]["failures"] == ["chunk 0: Error: field larger than field limit"]
+        assert summary["totals"] == {"rows": 3, "success": 1, "errors": 1, "rejected": 0}
+        with open(tmp_path / "dead.jsonl", encoding="utf-8") as f:
+            record = json.loads(f.readline())
+        assert (record["_file"], record["_offset"], record["Name"]) == (good, len("Name\nAlice\n"), "Bob")
+
+    def test_unit_ids_follow_file_version(self, tmp_path):
+        """Test Scheduler 4: deux fichiers de même nom et même contenu n'ont pas les mêmes _id"""
+        paths = []
+        for folder in ("a", "b"):
+            os.makedirs(tmp_path / folder)
+            (tmp_path / folder / "data.csv").write_text("Name\nAlice\nBob\n", encoding="utf-8")
+            paths.append(os.path.join(str(tmp_path), folder, ".", "data.csv"))
+        ids = []
+        run_multi_file(expand_inputs(paths), lambda metrics: BatchProcessor(
+            None, metrics=metrics, transforms=[lambda batch: ids.extend(row["_id"] for row in batch) or batch]),
+            batch_size=10, workers=1)
+        assert len(set(ids)) == 4
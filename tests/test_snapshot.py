@@ -0,0 +1,164 @@
+"""
+Tests unitaires de l'instantané BSON et de la restauration (src/snapshot.py)
+"""
+
+import datetime
+import os
+from types import SimpleNamespace
+
+import bson
+from bson import ObjectId
+
+import snapshot
+from migrate import RetryPolicy
+from snapshot import iter_raw_documents, load_manifest, restore_collection, snapshot_collection
+
+NO_WAIT = RetryPolicy(max_retries=0, base_delay=0.0)
+
+
+class RawCursor(list):
+    def close(self):
+        self.closed = True
+
+
+class SnapshotCollection:
+    """Collection factice : lots BSON bruts en lecture, insert_many / create_indexes enregistrés"""
+
+    def __init__(self, documents=(), batch_size=2, name="patient_records", database=None):
+        self.name = name
+        self.database = database or SnapshotDatabase(self)
+        self.full_name = f"{self.database.name}.{name}"
+        self.documents = list(documents)
+        self.raw_batch_size = batch_size
+        self.inserted = []
+        self.indexes = []
+
+    def find_raw_batches(self, filter, sort=None, batch_size=None):
+        chunks = [self.documents[i:i + self.raw_batch_size]
+                  for i in range(0, len(self.documents), self.raw_batch_size)]
+        return RawCursor(b"".join(bson.encode(doc) for doc in chunk) for chunk in chunks)
+
+    def options(self):
+        return {"validator": {"$jsonSchema": {"bsonType": "object", "required": ["Name"]}}}
+
+    def list_indexes(self):
+        return [{"v": 2, "key": {"_id": 1}, "name": "_id_"},
+                {"v": 2, "key": {"Medical Condition": 1, "Age": -1}, "name": "condition_age"}]
+
+    def insert_many(self, documents, ordered=True):
+        self.inserted.extend(bson.decode(doc.raw) for doc in documents)
+        return SimpleNamespace(inserted_ids=[None] * len(documents))
+
+    def create_indexes(self, models):
+        self.indexes.extend(model.document for model in models)
+        return [model.document["name"] for model in models]
+
+    def count_documents(self, filter):
+        return len(self.inserted)
+
+    def rename(self, new_name, dropTarget=False):
+        self.database.renamed.append((self.name, new_name))
+
+    def drop(self):
+        self.inserted = []
+        self.database.dropped.append(self.name)
+
+
+class SnapshotDatabase:
+    """Base factice : collections de staging créées, renommées et supprimées enregistrées"""
+
+    def __init__(self, collection):
+        self.name = "healthcare_db"
+        self.collection = collection
+        self.created = []
+        self.staging = None
+        self.renamed = []
+        self.dropped = []
+
+    def list_collection_names(self, filter=None):
+        # Aucun staging laissé par un run précédent
+        return [] if filter else [self.collection.name]
+
+    def create_collection(self, name, **options):
+        self.created.append((name, options))
+        self.staging = SnapshotCollection(name=name, database=self)
+        return self.staging
+
+
+def patients(count):
+    admitted = datetime.datetime(2023, 1, 1)
+    return [{"_id": ObjectId(), "Name": f"Patient {i}" * (1 + i % 3), "Age": 20 + i,
+             "Date of Admission": admitted + datetime.timedelta(days=i)} for i in range(count)]
+
+
+class TestSnapshot:
+    """Segments BSON bruts, manifest et restauration"""
+
+    def test_unit_segments_hold_every_document_in_order(self, tmp_path):
+        """Test Snapshot 1: segments découpés à la taille cible, relus document par document"""
+        documents = patients(7)
+        manifest = snapshot_collection(SnapshotCollection(documents), str(tmp_path), segment_bytes=1)
+
+        assert [s["documents"] for s in manifest["segments"]] == [2, 2, 2, 1]
+        read = []
+        for segment in manifest["segments"]:
+            data = (tmp_path / segment["name"]).read_bytes()
+            assert len(data) == segment["bytes"]
+            read.extend(bson.decode(bytes(raw)) for raw in iter_raw_documents(data))
+        assert read == documents
+        assert manifest["documents"] == 7 and manifest["bytes"] == sum(s["bytes"] for s in manifest["segments"])
+
+    def test_unit_manifest_round_trip(self, tmp_path):
+        """Test Snapshot 2: manifest relu à l'identique (options, index, segments)"""
+        manifest = snapshot_collection(SnapshotCollection(patients(3)), str(tmp_path))
+        loaded = load_manifest(str(tmp_path))
+        # JSON : les paires (champ, sens) des clés d'index sont relues en listes
+        for index in loaded["indexes"]:
+            index["key"] = [tuple(pair) for pair in index["key"]]
+        assert loaded == manifest
+        assert manifest["indexes"] == [{"key": [("Medical Condition", 1), ("Age", -1)],
+                                        "options": {"name": "condition_age"}}]
+
+    def test_unit_restore_loads_segments_then_indexes(self, tmp_path):
+        """Test Snapshot 3: documents et index restaurés en staging (options du manifest), puis swap"""
+        documents = patients(5)
+        snapshot_collection(SnapshotCollection(documents), str(tmp_path), segment_bytes=1)
+        target = SnapshotCollection()
+
+        totals = restore_collection(target, str(tmp_path), workers=2, batch_docs=1, retry=NO_WAIT)
+
+        assert totals == {"success": 5, "errors": 0, "restored": True}
+        staging = target.database.staging
+        assert staging.name.startswith("patient_records__staging_")
+        assert target.database.created == [(staging.name, target.options())]
+        assert sorted(staging.inserted, key=lambda doc: doc["_id"]) == documents
+        assert [index["name"] for index in staging.indexes] == ["condition_age"]
+        assert target.database.renamed == [(staging.name, "patient_records")]
+        assert target.inserted == [] and target.database.dropped == []
+
+    def test_unit_client_closed_on_error(self, tmp_path, monkeypatch):
+        """Test Snapshot 4: client fermé quand l'instantané échoue"""
+        client = SimpleNamespace(closed=False)
+        client.close = lambda: setattr(client, "closed", True)
+        monkeypatch.setattr(snapshot, "get_mongo_client", lambda: client)
+        monkeypatch.setattr(snapshot, "get_target_collection", lambda c: SnapshotCollection())
+
+        def fail(*args, **kwargs):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(snapshot, "snapshot_collection", fail)
+        assert snapshot.main(["snapshot.py", "snapshot", "--output", os.fspath(tmp_path)]) == 1
+        assert client.closed
+
+    def test_unit_failed_restore_leaves_target_untouched(self, tmp_path, monkeypatch):
+        """Test Snapshot 5: échec d'insertion -> staging supprimé, aucun swap, cible intacte"""
+        snapshot_collection(SnapshotCollection(patients(4)), str(tmp_path))
+        target = SnapshotCollection()
+        monkeypatch.setattr(snapshot, "insert_batch",
+                            lambda collection, batch, retry: {"success": 0, "errors": len(batch)})
+
+        totals = restore_collection(target, str(tmp_path), retry=NO_WAIT)
+
+        assert totals == {"success": 0, "errors": 4, "restored": False}
+        assert target.database.dropped == [target.database.staging.name]
+        assert target.database.renamed == []
@@ -0,0 +1,67 @@
+"""
+Tests unitaires du régulateur de charge (src/throttle.py)
+"""
+
+import json
+
+from pymongo.errors import OperationFailure
+
+from throttle import LoadThrottle
+
+
+class UnauthorisedClient:
+    """Client factice : serverStatus refusé (rôle clusterMonitor absent)"""
+
+    def __init__(self):
+        self.admin = self
+        self.calls = 0
+
+    def command(self, name, **kwargs):
+        self.calls += 1
+        raise OperationFailure("not authorized on admin to execute command { serverStatus: 1 }", code=13)
+
+
+class TestLoadThrottle:
+    """Réglage à chaud par fichier de contrôle et facteur de débit AIMD"""
+
+    def test_unit_reload_keeps_previous_settings_on_bad_values(self, tmp_path):
+        """Test Throttle 1: valeurs invalides ou fichier mal formé ignorés, réglages valides appliqués"""
+        control = tmp_path / "throttle.json"
+        control.write_text(json.dumps({"docs_per_second": 2000, "max_queue": "10"}))
+        throttle = LoadThrottle(docs_per_second=1000, control_file=str(control))
+        assert throttle.settings["docs_per_second"] == 2000 and throttle.settings["max_queue"] == 10
+
+        control.write_text(json.dumps({"docs_per_second": "fast", "mb_per_second": -1, "max_latency_ms": 250,
+                                       "max_queue": None, "unknown": 1}))
+        throttle.reload(force=True)
+        assert throttle.settings == {"docs_per_second": 2000, "mb_per_second": 0, "max_latency_ms": 250,
+                                     "max_queue": 10}
+
+        for content in ("[1, 2]", "{not json"):
+            control.write_text(content)
+            throttle.reload(force=True)
+            assert throttle.settings["docs_per_second"] == 2000
+        throttle.before_insert([{"Name": "Bobby"}])
+
+    def test_unit_rate_factor_halves_on_latency_and_recovers(self):
+        """Test Throttle 2: latence au-dessus du seuil -> facteur divisé par 2 (plancher), puis remontée progressive"""
+        throttle = LoadThrottle(docs_per_second=1000, max_latency_ms=100)
+        throttle.after_insert(0.5)
+        assert throttle.factor == 0.5 and throttle._docs.rate == 500
+        for _ in range(10):
+            throttle.after_insert(0.5)
+        assert throttle.factor == LoadThrottle.MIN_FACTOR
+        throttle.after_insert(0.01)
+        assert abs(throttle.factor - (LoadThrottle.MIN_FACTOR + LoadThrottle.INCREASE_STEP)) < 1e-9
+        for _ in range(40):
+            throttle.after_insert(0.01)
+        assert throttle.factor == 1.0 and throttle._docs.rate == 1000
+
+    def test_unit_queue_check_disabled_when_server_status_refused(self, caplog):
+        """Test Throttle 3: serverStatus refusé -> un seul avertissement, plus de requête, latence seule"""
+        client = UnauthorisedClient()
+        throttle = LoadThrottle(max_queue=10, client=client, status_interval=0)
+        for _ in range(3):
+            throttle.after_insert(0.001)
+        assert client.calls == 1 and throttle.factor == 1.0
+        assert sum("clusterMonitor" in record.message for record in caplog.records) == 1
@@ -0,0 +1,69 @@
+"""
+Tests unitaires de la validation vectorisée et de la quarantaine (src/validation.py)
+"""
+
+import json
+
+from categorical import CategoryInterner
+from quarantine import QuarantineWriter
+from validation import validate_batch
+
+
+def make_row(**overrides):
+    """Ligne CSV valide, modifiable champ par champ"""
+    row = {
+        "Name": "Bobby JacksOn", "Age": "30", "Gender": "Male", "Medical Condition": "Cancer",
+        "Date of Admission": "2024-01-31", "Discharge Date": "2024-02-02", "Billing Amount": "18856.28",
+    }
+    row.update(overrides)
+    return row
+
+
+class TestValidateBatch:
+    """Masques de contraintes et raisons de rejet"""
+
+    def test_unit_valid_rows_pass(self):
+        """Test Validation 1: un lot conforme est intégralement conservé"""
+        valid, rejected, reasons = validate_batch([make_row(), make_row(Gender="Female", Age="0")])
+        assert valid == [0, 1]
+        assert rejected == [] and reasons == []
+
+    def test_unit_rejected_rows_carry_reasons(self):
+        """Test Validation 2: chaque rejet indique les contraintes violées"""
+        batch = [
+            make_row(),
+            make_row(Age="121"),
+            make_row(Gender="Unknown", Name=""),
+            make_row(**{"Discharge Date": "2024-01-01"}),
+            make_row(**{"Date of Admission": "31/01/2024"}),
+        ]
+        valid, rejected, reasons = validate_batch(batch)
+
+        assert valid == [0]
+        assert rejected == [1, 2, 3, 4]
+        assert reasons[0] == "age_out_of_range"
+        assert set(reasons[1].split(";")) == {"missing:Name", "invalid_gender"}
+        assert reasons[2] == "discharge_before_admission"
+        assert reasons[3] == "invalid_date:Date of Admission"
+
+    def test_unit_categorical_codes_give_same_result(self):
+        """Test Validation 4: un lot à dictionnaires partagés est validé sur ses codes, à l'identique"""
+        rows = [make_row(), make_row(Gender="Unknown"), make_row(**{"Medical Condition": ""}),
+                make_row(Gender=" Female "), make_row(Gender="Male")]
+        interner = CategoryInterner(["Gender", "Medical Condition"])
+        batch = interner.encode([dict(row) for row in rows])
+        assert batch[0]["Gender"] is batch[4]["Gender"]
+        assert list(batch.codes["Gender"]) == [0, 1, 0, 2, 0]
+        assert validate_batch(batch) == validate_batch(rows)
+        assert list(batch.take([3, 1]).codes["Gender"]) == [2, 1]
+
+    def test_unit_quarantine_jsonl(self, tmp_path):
+        """Test Validation 3: la quarantaine JSONL contient ligne, numéro et raison"""
+        path = tmp_path / "quarantine.jsonl"
+        with QuarantineWriter(str(path)) as writer:
+            writer.write(make_row(Age="-1"), 7, "age_out_of_range")
+
+        record = json.loads(path.read_text(encoding="utf-8"))
+        assert record["_row"] == 7
+        assert record["_reason"] == "age_out_of_range"
+        assert record["Age"] == "-1"